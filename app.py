@@ -1,18 +1,28 @@
 import dash
-from dash import html, dcc, callback_context
-from dash.dependencies import Input, Output, State
+import flask
+from dash import html, dcc, dash_table, callback_context, no_update
+from dash.dependencies import Input, Output, State, ALL
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
-import plotly.express as px
 import datetime
 import random
 import copy
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 from dash.exceptions import PreventUpdate
+from plotly.io.json import to_json_plotly
 from abc import ABC, abstractmethod
-import copy
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+from functools import lru_cache
+import hashlib
+import io
+import itertools
+import logging
 import os  # Add this import
+import json
+import threading
+import time
 
 # Initialize the app
 app = dash.Dash(
@@ -51,6 +61,18 @@ ICONS = {
     "Security": "shield-lock"
 }
 
+# Component id suffix of each KPI (cards, stores, update labels)
+KPI_SLUGS = {
+    "OEE": "oee",
+    "CO2/km": "co2",
+    "PM Risk": "pm-risk",
+    "SC Resilience": "sc-resilience",
+    "TVR": "tvr",
+    "Batt Efficiency": "batt-eff",
+    "Chg Utilization": "chg-util",
+    "Security": "security"
+}
+
 # Production lines configuration
 PRODUCTION_LINES = {
     "line1": {
@@ -95,6 +117,11 @@ UPDATE_FREQUENCIES = {
     "Security": 1800
 }
 
+# Shared production resources tracked per line
+RESOURCES = ['Robots', 'Personnel', 'Energy', 'Materials', 'Machines']
+RESOURCE_UPDATE_FREQUENCY = 60  # seconds
+BOTTLENECK_THRESHOLD = 85  # utilization (%) above which a resource becomes a bottleneck
+
 # Failure prediction model weights (based on KPI relationships)
 FAILURE_WEIGHTS = {
     "OEE": -0.4,
@@ -163,6 +190,12 @@ COMPONENT_KPI_MATRIX = {
     "Packaging System": {"OEE": 0.4, "PM Risk": 0.3, "TVR": 0.2}
 }
 
+# KPIs shown as contributing factors of each component, strongest influence first
+COMPONENT_FACTOR_KPIS = {
+    component: sorted(influences, key=influences.get, reverse=True)
+    for component, influences in COMPONENT_KPI_MATRIX.items()
+}
+
 # NEW: Maintenance schedule recommendations based on component
 MAINTENANCE_RECOMMENDATIONS = {
     "Robotic Arms": "Schedule calibration every 168 hours, full servicing every 720 hours",
@@ -190,6 +223,29 @@ MAINTENANCE_RECOMMENDATIONS = {
     "Packaging System": "Inspect packaging materials daily, maintain seals weekly"
 }
 
+# Simulator baselines by production line
+LINE_BASELINES = {
+    "line1": {"OEE": 82, "CO2/km": 100, "PM Risk": 35},  # Assembly Line
+    "line2": {"OEE": 88, "CO2/km": 90, "PM Risk": 25},  # Battery Line
+    "line3": {"OEE": 85, "CO2/km": 110, "PM Risk": 40},  # Paint Shop
+    "line4": {"OEE": 87, "CO2/km": 95, "PM Risk": 30}  # Final Assembly
+}
+
+# Maintenance crews per line (maintenance jobs that can be done per day)
+MAINTENANCE_CREWS = {
+    "line1": 2,
+    "line2": 1,
+    "line3": 1,
+    "line4": 2
+}
+
+# Maintenance cost model
+MAINTENANCE_DOWNTIME_HOURS = 4  # production stop per maintenance job
+UNIT_MARGIN = 50  # contribution lost per unit not produced
+UNPLANNED_FAILURE_COST = 40000  # repair and disruption cost of a breakdown
+WEEKEND_LOAD_FACTOR = 0.5  # share of normal production scheduled at weekends
+MAINTENANCE_HORIZON_DAYS = 14
+
 
 # ====================== HELPER FUNCTIONS ======================
 def get_kpi_status(value, target):
@@ -208,7 +264,7 @@ def get_kpi_status(value, target):
         return "critical", "#FF4136", "bi-arrow-down"
 
 
-def create_kpi_card(title, value, target, last_updated):
+def create_kpi_card(title, value, target, last_updated=None):
     status, color, trend_icon = get_kpi_status(value, target)
 
     # Special formatting for Security KPI
@@ -222,13 +278,16 @@ def create_kpi_card(title, value, target, last_updated):
         target_text = f"Target: {target}"
         value_text = f"{value:.1f}"
 
-    # Time since last update
-    if isinstance(last_updated, (int, float)):
-        last_updated = datetime.fromtimestamp(last_updated)
-    update_diff = (datetime.now() - last_updated).total_seconds()
-    minutes_ago = int(update_diff // 60)
-    seconds_ago = int(update_diff % 60)
-    update_text = f"Updated: {minutes_ago}m {seconds_ago}s ago"
+    # Time since last update (without a timestamp the browser fills it from kpi-timestamps)
+    if last_updated is None:
+        update_text = ""
+    else:
+        if isinstance(last_updated, (int, float)):
+            last_updated = datetime.fromtimestamp(last_updated)
+        update_diff = (datetime.now() - last_updated).total_seconds()
+        minutes_ago = int(update_diff // 60)
+        seconds_ago = int(update_diff % 60)
+        update_text = f"Updated: {minutes_ago}m {seconds_ago}s ago"
 
     return dbc.Card([
         dbc.CardBody([
@@ -260,7 +319,8 @@ def create_kpi_card(title, value, target, last_updated):
                     html.Span(status_text, className="kpi-delta", style={"color": color})
                 ], className="kpi-target"),
 
-                html.Div(update_text, className="kpi-update text-muted mt-1")
+                html.Div(update_text, id=f"kpi-updated-{KPI_SLUGS[title]}",
+                         className="kpi-update text-muted mt-1")
             ], className="position-relative h-100", style={"paddingLeft": "10px"})
         ])
     ], className="kpi-card shadow-lg", style={
@@ -271,28 +331,22 @@ def create_kpi_card(title, value, target, last_updated):
     })
 
 
-def generate_kpi_value(kpi_name, current_value, line_id):
+def charging_baseline(hour):
+    """Expected charging station utilization: busy day shift, quiet nights"""
+    base = 75 + np.where((8 <= np.asarray(hour)) & (np.asarray(hour) < 18), 10, -5)
+    return base if base.ndim else int(base)
+
+
+def generate_kpi_value(kpi_name, current_value, line_id, now=None):
     """Generate realistic KPI values with different update behaviors"""
-    now = datetime.now()
+    now = now or datetime.now()
     new_value = current_value
 
     # Base values vary by production line
-    if line_id == "line1":  # Assembly Line
-        base_oe = 82
-        base_em = 100
-        base_risk = 35
-    elif line_id == "line2":  # Battery Line
-        base_oe = 88
-        base_em = 90
-        base_risk = 25
-    elif line_id == "line3":  # Paint Shop
-        base_oe = 85
-        base_em = 110
-        base_risk = 40
-    else:  # Final Assembly
-        base_oe = 87
-        base_em = 95
-        base_risk = 30
+    baseline = LINE_BASELINES.get(line_id, LINE_BASELINES["line4"])
+    base_oe = baseline["OEE"]
+    base_em = baseline["CO2/km"]
+    base_risk = baseline["PM Risk"]
 
     if kpi_name == "OEE":
         fluctuation = random.gauss(0, 0.8)
@@ -316,8 +370,7 @@ def generate_kpi_value(kpi_name, current_value, line_id):
         fluctuation = random.gauss(0, 0.3)
         new_value = max(85, min(98, current_value + fluctuation))
     elif kpi_name == "Chg Utilization":
-        hour = now.hour
-        base_util = 75 + (10 if 8 <= hour < 18 else -5)
+        base_util = charging_baseline(now.hour)
         fluctuation = random.gauss(0, 2)
         new_value = max(65, min(90, base_util + fluctuation))
     elif kpi_name == "Security":
@@ -329,6 +382,26 @@ def generate_kpi_value(kpi_name, current_value, line_id):
     return new_value, now.timestamp()
 
 
+def generate_resource_utilization(current, kpis, now=None):
+    """Generate resource utilization (%) that follows the line's KPIs and shifts"""
+    now = now or datetime.now()
+    targets = [
+        kpis["OEE"] * 0.95,  # Robots
+        85 if 8 <= now.hour < 18 else 65,  # Personnel
+        kpis["Chg Utilization"] * 1.05,  # Energy
+        100 - kpis["SC Resilience"] * 30,  # Materials
+        kpis["OEE"] * 0.9 + kpis["TVR"] * 50  # Machines
+    ]
+    if current is None:
+        current = targets
+
+    # Mean-reverting walk towards the KPI-driven target
+    return [
+        max(40, min(100, value + 0.1 * (target - value) + random.gauss(0, 1.5)))
+        for value, target in zip(current, targets)
+    ]
+
+
 def generate_initial_data(line_id):
     """Generate realistic starting values for KPIs for a specific line"""
     now = datetime.now()
@@ -339,17 +412,108 @@ def generate_initial_data(line_id):
         "SC Resilience": random.uniform(0.75, 0.85),
         "TVR": random.uniform(0.10, 0.15),
         "Batt Efficiency": random.uniform(90, 94),
-        "Chg Utilization": 75 + (10 if 8 <= now.hour < 18 else -5),
+        "Chg Utilization": charging_baseline(now.hour),
         "Security": 0,
         "last_updated": {k: now.timestamp() for k in TARGETS.keys()}
     }
 
 
 # ====================== FACTORY ADAPTER FRAMEWORK ======================
+# Adapter health telemetry
+READ_LATENCY_BUCKETS_MS = np.array([1, 5, 10, 50, 100, 500, 1000, 5000], dtype=float)  # upper bounds
+ERROR_RATE_ALPHA = 0.05  # weight of each read in the error rate, ~ the last 20 reads
+STALE_AFTER_PERIODS = 2  # a KPI is stale once no sample arrived for this many update periods
+SLOW_READ_MS = 500  # p95 read latency above which a source counts as slow
+ERROR_RATE_WARNING = 0.1
+
+
+class AdapterHealth:
+    """Read telemetry of one adapter: latency histogram, error rate and per-KPI staleness
+
+    Read times are monotonic, so ages stay right across midnight and wall
+    clock adjustments. The sampler thread records reads while callbacks take
+    snapshots, hence the lock.
+    """
+
+    def __init__(self, periods=UPDATE_FREQUENCIES):
+        self.periods = dict(periods)
+        self.started = time.monotonic()
+        # One bucket per upper bound plus an open-ended last one
+        self.latency_counts = np.zeros(len(READ_LATENCY_BUCKETS_MS) + 1, dtype=np.int64)
+        self.max_latency = 0.0
+        self.reads = 0
+        self.errors = 0
+        self.error_rate = 0.0
+        self.last_error = None
+        self.last_read = None  # last successful read of anything
+        self.last_sample = {}  # source -> last read that delivered samples
+        self._lock = threading.Lock()
+
+    def record(self, source, started, samples=0, error=None):
+        """Account one read of `source` (a KPI name or "resources") that began at monotonic `started`"""
+        now = time.monotonic()
+        latency = (now - started) * 1000
+        with self._lock:
+            self.latency_counts[np.searchsorted(READ_LATENCY_BUCKETS_MS, latency)] += 1
+            self.max_latency = max(self.max_latency, latency)
+            self.reads += 1
+            self.error_rate += ERROR_RATE_ALPHA * ((error is not None) - self.error_rate)
+            if error is not None:
+                self.errors += 1
+                self.last_error = str(error)
+                return
+            self.last_read = now
+            if samples:
+                self.last_sample[source] = now
+
+    def latency_percentile(self, q):
+        """Upper bound (ms) of the bucket holding the q-quantile read, None before any read"""
+        total = self.latency_counts.sum()
+        if not total:
+            return None
+        bucket = int(np.searchsorted(np.cumsum(self.latency_counts), q * total))
+        return float(READ_LATENCY_BUCKETS_MS[bucket]) if bucket < len(READ_LATENCY_BUCKETS_MS) else self.max_latency
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            kpis = {}
+            for kpi, period in self.periods.items():
+                # KPIs that never delivered age from the adapter's creation
+                age = now - self.last_sample.get(kpi, self.started)
+                kpis[kpi] = {
+                    "age": age,
+                    "period": period,
+                    "staleness": age / period,
+                    "stale": age > STALE_AFTER_PERIODS * period,
+                    "received": kpi in self.last_sample
+                }
+            p95 = self.latency_percentile(0.95)
+            return {
+                "reads": self.reads,
+                "errors": self.errors,
+                "error_rate": self.error_rate,
+                "last_error": self.last_error,
+                "heartbeat": None if self.last_read is None else now - self.last_read,
+                "latency": {
+                    "buckets_ms": READ_LATENCY_BUCKETS_MS.tolist(),
+                    "counts": self.latency_counts.tolist(),
+                    "p50_ms": self.latency_percentile(0.5),
+                    "p95_ms": p95,
+                    "max_ms": self.max_latency
+                },
+                "kpis": kpis,
+                "stale": [kpi for kpi, state in kpis.items() if state["stale"]],
+                "slow": p95 is not None and p95 > SLOW_READ_MS,
+                "failing": self.error_rate > ERROR_RATE_WARNING
+            }
+
+
 class DataAdapter(ABC):
     def __init__(self, line_id):
         self.line_id = line_id
         self.connected = False
+        self.health = AdapterHealth()
 
     @abstractmethod
     def connect(self):
@@ -363,6 +527,49 @@ class DataAdapter(ABC):
     def get_status(self):
         pass
 
+    def backfill(self, hours):
+        """Return recent history as {kpi: (timestamps, values)} if the source keeps any"""
+        return {}
+
+    def read_kpi_series(self, kpi_name):
+        """Return (timestamps, values) of every sample since the previous read"""
+        value, timestamp = self.read_kpi(kpi_name)
+        return np.array([timestamp], dtype=float), np.array([value], dtype=float)
+
+    def read_resources(self):
+        """Return (utilization per entry of RESOURCES, timestamp), or None without a resource feed"""
+        return None
+
+    def backfill_resources(self, hours):
+        """Return recent resource history as (timestamps, utilization matrix) if available"""
+        return None
+
+    def poll_kpi(self, kpi_name):
+        """read_kpi_series, recorded in the adapter's health telemetry"""
+        started = time.monotonic()
+        try:
+            stamps, values = self.read_kpi_series(kpi_name)
+        except Exception as e:
+            self.health.record(kpi_name, started, error=e)
+            raise
+        self.health.record(kpi_name, started, samples=len(stamps))
+        return stamps, values
+
+    def poll_resources(self):
+        """read_resources, recorded in the adapter's health telemetry"""
+        started = time.monotonic()
+        try:
+            reading = self.read_resources()
+        except Exception as e:
+            self.health.record("resources", started, error=e)
+            raise
+        self.health.record("resources", started, samples=int(reading is not None))
+        return reading
+
+    def get_health(self):
+        """Structured read telemetry, see AdapterHealth.snapshot"""
+        return self.health.snapshot()
+
 
 class VirtualAdapter(DataAdapter):
     """Simulation adapter for development"""
@@ -371,6 +578,7 @@ class VirtualAdapter(DataAdapter):
         super().__init__(line_id)
         # Will be initialized later in callback
         self.last_values = None
+        self.resources = None
 
     def connect(self):
         self.connected = True
@@ -390,29 +598,61 @@ class VirtualAdapter(DataAdapter):
         self.last_values["last_updated"][kpi_name] = timestamp
         return new_value, timestamp
 
+    def backfill(self, hours):
+        """Simulate the past few hours so analytics start with a history"""
+        end = datetime.now().timestamp()
+        state = generate_initial_data(self.line_id)
+        series = {}
+        for kpi, freq in UPDATE_FREQUENCIES.items():
+            stamps = np.arange(end - hours * 3600, end, freq, dtype=float)
+            values = np.empty(len(stamps))
+            value = state[kpi]
+            for i, ts in enumerate(stamps):
+                value, _ = generate_kpi_value(kpi, value, self.line_id, datetime.fromtimestamp(ts))
+                values[i] = value
+            state[kpi] = value
+            state["last_updated"][kpi] = float(stamps[-1])
+            series[kpi] = (stamps, values)
+        self.last_values = state
+        return series
+
+    def read_resources(self):
+        if self.last_values is None:
+            self.last_values = generate_initial_data(self.line_id)
+        now = datetime.now()
+        self.resources = generate_resource_utilization(self.resources, self.last_values, now)
+        return self.resources, now.timestamp()
+
+    def backfill_resources(self, hours):
+        """Simulate resource utilization for the past few hours"""
+        if self.last_values is None:
+            self.last_values = generate_initial_data(self.line_id)
+        end = datetime.now().timestamp()
+        stamps = np.arange(end - hours * 3600, end, RESOURCE_UPDATE_FREQUENCY, dtype=float)
+        utilization = np.empty((len(stamps), len(RESOURCES)))
+        for i, ts in enumerate(stamps):
+            self.resources = generate_resource_utilization(
+                self.resources, self.last_values, datetime.fromtimestamp(ts))
+            utilization[i] = self.resources
+        return stamps, utilization
+
     def get_status(self):
         line_name = PRODUCTION_LINES[self.line_id]["name"]
         return {
             "status": "Connected",
             "mode": "Simulation",
-            "message": f"Virtual factory data for {line_name}",
-            "last_update": datetime.now().strftime("%H:%M:%S")
+            "message": f"Virtual factory data for {line_name}"
         }
 
 
 class OPCUAAdapter(DataAdapter):
     """Stub for real factory connection"""
 
-    def __init__(self, line_id):
-        super().__init__(line_id)
-        self.last_update = None
-
     def connect(self):
         try:
             # Security implementation would go here
             # self.client.set_security(SecurityPolicyTypes.Basic256Sha256_SignAndEncrypt)
             self.connected = True
-            self.last_update = datetime.now().strftime("%H:%M:%S")
             return True
         except Exception:
             self.connected = False
@@ -431,22 +671,494 @@ class OPCUAAdapter(DataAdapter):
         return {
             "status": status,
             "mode": "Production",
-            "message": "OPC-UA to factory equipment",
-            "last_update": self.last_update or "Never"
+            "message": "OPC-UA to factory equipment"
         }
 
 
-# Initialize adapters for all lines (using virtual for now)
-ADAPTERS = {
-    line_id: VirtualAdapter(line_id)
-    for line_id in PRODUCTION_LINES
-}
+# Recordings hold one file per line and KPI of (timestamp, value) records sorted by time
+RECORDINGS_DIR = os.environ.get("KPI_RECORDINGS_DIR", "recordings")
+RECORD_DTYPE = np.dtype([("ts", "<f8"), ("value", "<f8")])
+RESOURCE_RECORD_DTYPE = np.dtype([("ts", "<f8"), ("utilization", "<f8", (len(RESOURCES),))])
+REPLAY_SPEED = float(os.environ.get("REPLAY_SPEED", 1))
+REPLAY_SPEED_LIMITS = (1, 1000)
+REPLAY_CHUNK = 65536  # records handed to the sampler per KPI and poll at most
+
+
+def recording_path(directory, line_id, name):
+    return os.path.join(directory, line_id, f"{name}.f8")
+
+
+def open_recording(path, dtype):
+    """Memory-map a recording file, or return an empty array if there is none"""
+    count = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class ReplayAdapter(DataAdapter):
+    """Replays recorded KPI histories from disk on an accelerated clock
+
+    Recordings are memory-mapped and searched in place, so only the pages
+    around the replay position are read however long the recording is.
+    """
+
+    def __init__(self, line_id, directory=RECORDINGS_DIR, speed=REPLAY_SPEED):
+        super().__init__(line_id)
+        self.directory = directory
+        self.speed = float(np.clip(speed, *REPLAY_SPEED_LIMITS))
+        self.recordings = {}
+        self.resources = np.empty(0, dtype=RESOURCE_RECORD_DTYPE)
+        self.cursors = {}
+        self.origin = None
+        self.started = None
+
+    def connect(self):
+        try:
+            self.recordings = {
+                kpi: open_recording(recording_path(self.directory, self.line_id, slug), RECORD_DTYPE)
+                for kpi, slug in KPI_SLUGS.items()
+            }
+            self.resources = open_recording(
+                recording_path(self.directory, self.line_id, "resources"), RESOURCE_RECORD_DTYPE)
+        except Exception as e:
+            print(f"Error opening recordings: {str(e)}")
+            self.connected = False
+            return False
+
+        starts = [rec["ts"][0] for rec in self.recordings.values() if len(rec)]
+        self.connected = bool(starts)
+        if self.connected:
+            self.seek(min(starts))
+        return self.connected
+
+    def require_connection(self):
+        if not self.connected and not self.connect():
+            raise RuntimeError(f"No recordings for {self.line_id} in {self.directory}")
+
+    def seek(self, ts):
+        """Restart the replay clock at a recorded timestamp"""
+        self.origin = float(ts)
+        self.started = time.monotonic()
+        self.cursors = {kpi: bisect_right(rec["ts"], ts) for kpi, rec in self.recordings.items()}
+
+    def clock(self):
+        """Current replay position in recorded time"""
+        return self.origin + (time.monotonic() - self.started) * self.speed
+
+    def read_kpi_series(self, kpi_name):
+        self.require_connection()
+        stamps = self.recordings[kpi_name]["ts"]
+        start = self.cursors[kpi_name]
+        end = min(bisect_right(stamps, self.clock(), start), start + REPLAY_CHUNK)
+        self.cursors[kpi_name] = end
+        # Copies just the records being replayed out of the mapping
+        chunk = np.array(self.recordings[kpi_name][start:end])
+        return chunk["ts"], chunk["value"]
+
+    def read_kpi(self, kpi_name):
+        stamps, values = self.read_kpi_series(kpi_name)
+        if len(stamps):
+            return float(values[-1]), float(stamps[-1])
+        position = self.cursors[kpi_name] - 1
+        if position < 0:
+            raise ValueError(f"No recorded {kpi_name} before the replay position")
+        record = self.recordings[kpi_name][position]
+        return float(record["value"]), float(record["ts"])
+
+    def backfill(self, hours):
+        """Hand over the first hours of the recording and start the replay after them"""
+        self.require_connection()
+        end = self.origin + hours * 3600
+        series = {}
+        for kpi, rec in self.recordings.items():
+            count = bisect_right(rec["ts"], end)
+            chunk = np.array(rec[:count])
+            series[kpi] = (chunk["ts"], chunk["value"])
+        self.seek(end)
+        return series
+
+    def read_resources(self):
+        self.require_connection()
+        position = bisect_right(self.resources["ts"], self.clock()) - 1
+        if position < 0:
+            return None
+        record = self.resources[position]
+        return np.array(record["utilization"]), float(record["ts"])
+
+    def backfill_resources(self, hours):
+        self.require_connection()
+        stamps = self.resources["ts"]
+        start = bisect_right(stamps, self.origin - hours * 3600)
+        chunk = np.array(self.resources[start:bisect_right(stamps, self.origin, start)])
+        return chunk["ts"], chunk["utilization"]
+
+    def get_status(self):
+        line_name = PRODUCTION_LINES[self.line_id]["name"]
+        if not self.connected and not self.connect():
+            return {
+                "status": "Disconnected",
+                "mode": "Replay",
+                "message": f"No recordings for {line_name} in {self.directory}"
+            }
+        position = datetime.fromtimestamp(self.clock()).strftime("%Y-%m-%d %H:%M:%S")
+        return {
+            "status": "Connected",
+            "mode": "Replay",
+            "message": f"Replaying {line_name} at {self.speed:g}x (recorded time {position})"
+        }
+
+
+# ====================== ASSET SIMULATION ======================
+RUNNING, IDLE, DOWN = 0, 1, 2
+ASSET_SIMULATION_SCALE = int(os.environ.get("ASSET_SIMULATION_SCALE", 1))  # assets per line = assets x scale
+ASSET_KPIS = ["OEE", "TVR", "CO2/km"]  # line KPIs aggregated from the assets
+ASSET_REPAIR_SECONDS = 1200  # mean downtime per breakdown
+ASSET_IDLE_SECONDS = 180  # mean time starved of parts
+ASSET_STARVE_SECONDS = 3600  # mean running time between starvations
+ASSET_QUALITY = 0.985  # share of good parts
+ASSET_SPEED = 0.95  # mean speed relative to the ideal cycle time
+LINE_SPEED_SD = 0.1  # line-wide speed disturbances (e.g. material supply)
+LINE_SPEED_SECONDS = 600  # correlation time of those disturbances
+ASSET_KPI_WINDOW = 900  # seconds over which asset counters are averaged into line KPIs
+THROUGHPUT_WINDOW_MINUTES = 60  # minutes of throughput behind TVR
+IDLE_POWER_SHARE, DOWN_POWER_SHARE = 0.4, 0.05
+MAX_CATCHUP_STEPS = 3600
+
+
+ASSETS_PER_CELL = 6
+HIERARCHY_LEVELS = ("asset", "cell", "line", "plant")
+ASSET_COUNTERS = ("run_time", "planned_time", "ideal_time", "units", "good_units", "energy")
+STATE_NAMES = ("Running", "Idle", "Down")
+
+
+class AssetHierarchy:
+    """Asset -> cell -> line -> plant tree holding decayed counter sums per node.
+
+    Counters use forward decay: contributions are stored scaled by
+    exp(t / window) and reads scale back, so decay never rewrites the tree.
+    Each update adds its deltas to the asset and then to every ancestor, so
+    updating one asset costs O(depth) however large the plant is.
+    """
+
+    def __init__(self, asset_line, n_lines, assets_per_cell=ASSETS_PER_CELL, window=ASSET_KPI_WINDOW, start=0.0):
+        # Cells group consecutive assets of the same line
+        position = np.arange(len(asset_line)) - np.searchsorted(asset_line, asset_line)
+        cells_per_line = -(-np.bincount(asset_line, minlength=n_lines) // assets_per_cell)
+        first_cell = np.r_[0, np.cumsum(cells_per_line)[:-1]]
+        asset_cell = first_cell[asset_line] + position // assets_per_cell
+        self.cell_line = np.repeat(np.arange(n_lines), cells_per_line)
+        self.cell_index = position // assets_per_cell  # position of each asset's cell within its line
+        self.parents = [asset_cell, self.cell_line, np.zeros(n_lines, dtype=np.int64)]
+        self.sizes = [len(asset_line), len(self.cell_line), n_lines, 1]
+        # Children are contiguous, so each parent sums one slice of its level
+        self.first_child = [np.searchsorted(parent, np.arange(size)) for parent, size in zip(self.parents, self.sizes[1:])]
+        self.sums = [np.zeros((size, len(ASSET_COUNTERS))) for size in self.sizes]
+        self.states = [np.zeros((size, len(STATE_NAMES)), dtype=np.int64) for size in self.sizes]
+        self.window = window
+        self.origin = start
+
+    def reset(self, start):
+        """Drop all counters and restart the decay clock at `start`"""
+        for sums in self.sums:
+            sums[:] = 0
+        self.origin = start
+
+    def count_states(self, states):
+        """Recount every node's assets per state from scratch"""
+        counts = np.eye(len(STATE_NAMES), dtype=np.int64)[states]
+        self.states[0] = counts
+        for level, first in enumerate(self.first_child):
+            counts = np.add.reduceat(counts, first, axis=0)
+            self.states[level + 1] = counts
+
+    def add(self, contributions, timestamp, assets=None):
+        """Add counter contributions of `assets` (all assets if None) at `timestamp`"""
+        if timestamp - self.origin > 30 * self.window:
+            self._rebase(timestamp)
+        scaled = contributions * np.exp((timestamp - self.origin) / self.window)
+        if assets is None:
+            # Every asset changed: propagate level by level, summing each parent's slice
+            self.sums[0] += scaled
+            for level, first in enumerate(self.first_child):
+                scaled = np.add.reduceat(scaled, first, axis=0)
+                self.sums[level + 1] += scaled
+            return
+        nodes = assets
+        np.add.at(self.sums[0], nodes, scaled)
+        for level, parent in enumerate(self.parents):
+            nodes = parent[nodes]
+            np.add.at(self.sums[level + 1], nodes, scaled)
+
+    def move(self, assets, old_states, new_states):
+        """Record state changes of some assets in every ancestor's state counts"""
+        nodes = assets
+        for level in range(len(self.sizes)):
+            np.add.at(self.states[level], (nodes, old_states), -1)
+            np.add.at(self.states[level], (nodes, new_states), 1)
+            if level < len(self.parents):
+                nodes = self.parents[level][nodes]
+
+    def _rebase(self, timestamp):
+        # Keeps the stored exponent small; O(nodes) but only every 30 windows
+        factor = np.exp(-(timestamp - self.origin) / self.window)
+        for sums in self.sums:
+            sums *= factor
+        self.origin = timestamp
+
+    def counters(self, level, nodes, timestamp):
+        """Decayed counter sums of some nodes of a level, as {counter: array}"""
+        values = self.sums[HIERARCHY_LEVELS.index(level)][nodes] * np.exp(-(timestamp - self.origin) / self.window)
+        return dict(zip(ASSET_COUNTERS, np.atleast_2d(values).T))
+
+    def children(self, level, node):
+        """Indices of the child nodes of one node"""
+        depth = HIERARCHY_LEVELS.index(level)
+        return np.flatnonzero(self.parents[depth - 1] == node)
+
+
+def counter_kpis(counters, window=ASSET_KPI_WINDOW):
+    """OEE and its factors from decayed counters (works for any hierarchy level)"""
+    availability = counters["run_time"] / np.maximum(counters["planned_time"], 1e-9)
+    performance = counters["ideal_time"] / np.maximum(counters["run_time"], 1e-9)
+    quality = counters["good_units"] / np.maximum(counters["units"], 1e-9)
+    return {
+        "OEE": 100 * availability * performance * quality,
+        "availability": 100 * availability,
+        "performance": 100 * performance,
+        "quality": 100 * quality,
+        "units_per_hour": counters["units"] / window * 3600,
+        "energy_per_unit": counters["energy"] / np.maximum(counters["units"], 1e-9)
+    }
+
+
+class AssetFleet:
+    """State of every simulated asset as struct-of-arrays, stepped together.
+
+    Assets switch between running, idle and down as Markov processes with
+    rates calibrated so each line's expected OEE matches LINE_BASELINES. Line
+    KPIs are read from the line level of the asset hierarchy.
+    """
+
+    def __init__(self, scale=ASSET_SIMULATION_SCALE, seed=None, start=None):
+        self.rng = np.random.default_rng(seed)
+        counts = np.array([PRODUCTION_LINES[line_id]["assets"] * scale for line_id in LINE_IDS])
+        n_lines = len(LINE_IDS)
+        self.line = np.repeat(np.arange(n_lines), counts)
+        self.line_assets = counts
+        n = len(self.line)
+
+        # Per-line ideal cycle so a fully available line makes `avg_output` units per hour
+        line_cycle = np.array([3600 * PRODUCTION_LINES[line_id]["assets"] / PRODUCTION_LINES[line_id]["avg_output"]
+                               for line_id in LINE_IDS])
+        self.ideal_cycle = line_cycle[self.line] * np.exp(self.rng.normal(0, 0.1, n))
+        self.power_kw = self.rng.uniform(10, 20, n)
+        self.quality = np.clip(self.rng.normal(ASSET_QUALITY, 0.005, n), 0.9, 1.0)
+
+        # Breakdown rate solving OEE = availability x speed x quality for each line
+        availability = np.array([LINE_BASELINES[line_id]["OEE"] for line_id in LINE_IDS]) / (
+            100 * ASSET_SPEED * ASSET_QUALITY)
+        down_ratio = np.maximum(1 / availability - 1 - ASSET_IDLE_SECONDS / ASSET_STARVE_SECONDS, 0.005)
+        self.fail_rate = (down_ratio / ASSET_REPAIR_SECONDS)[self.line]
+        shares = np.stack([np.ones(n_lines), np.full(n_lines, ASSET_IDLE_SECONDS / ASSET_STARVE_SECONDS),
+                           down_ratio], axis=1)
+        shares /= shares.sum(axis=1, keepdims=True)
+        draw = self.rng.random(n)
+        cumulative = shares.cumsum(axis=1)[self.line]
+        self.state = (draw[:, None] >= cumulative[:, :2]).sum(axis=1).astype(np.int8)
+
+        self.speed = np.full(n_lines, ASSET_SPEED)
+        self.clock = start or datetime.now().timestamp()
+        # Decayed counters of every asset, cell, line and the plant
+        self.hierarchy = AssetHierarchy(self.line, n_lines, start=self.clock)
+        self.hierarchy.count_states(self.state)
+        # Nominal energy per unit: every asset running at its mean speed
+        nominal_power = np.bincount(self.line, self.power_kw, n_lines)
+        nominal_rate = np.bincount(self.line, ASSET_SPEED / self.ideal_cycle, n_lines)
+        self.nominal_energy_per_unit = nominal_power / 3600 / nominal_rate
+        self.co2_baseline = np.array([LINE_BASELINES[line_id]["CO2/km"] for line_id in LINE_IDS])
+        # Per-minute throughput statistics behind TVR
+        self.minute = int(self.clock // 60)
+        self.minute_units = np.zeros(n_lines)
+        self.throughput_mean = np.zeros(n_lines)
+        self.throughput_var = np.zeros(n_lines)
+        self.minutes_seen = 0
+
+    def __len__(self):
+        return len(self.state)
+
+    def step(self, dt=1.0):
+        """Advance every asset by dt seconds"""
+        n_lines = len(self.line_assets)
+        running = self.state == RUNNING
+        previous = self.state
+        u = self.rng.random(len(self))
+        p_fail = 1 - np.exp(-self.fail_rate * dt)
+        p_starve = 1 - np.exp(-dt / ASSET_STARVE_SECONDS)
+        p_resume = 1 - np.exp(-dt / ASSET_IDLE_SECONDS)
+        p_repair = 1 - np.exp(-dt / ASSET_REPAIR_SECONDS)
+        self.state = np.where(
+            running,
+            np.where(u < p_fail, DOWN, np.where(u < p_fail + p_starve, IDLE, RUNNING)),
+            np.where(u < np.where(self.state == DOWN, p_repair, p_resume), RUNNING, self.state)
+        ).astype(np.int8)
+        changed = np.flatnonzero(self.state != previous)
+        self.hierarchy.move(changed, previous[changed], self.state[changed])
+
+        # Line-wide speed follows a mean-reverting random walk
+        pull = 1 - np.exp(-dt / LINE_SPEED_SECONDS)
+        self.speed += pull * (ASSET_SPEED - self.speed) + LINE_SPEED_SD * np.sqrt(2 * pull) * self.rng.normal(size=n_lines)
+        self.speed = np.clip(self.speed, 0.3, 1.2)
+
+        cycle = self.ideal_cycle / self.speed[self.line]
+        units = np.where(running, dt / cycle, 0.0)
+        power = self.power_kw * np.choose(self.state, [1.0, IDLE_POWER_SHARE, DOWN_POWER_SHARE])
+
+        self.clock += dt
+        self.hierarchy.add(np.stack([running * dt, np.full(len(self), dt), units * self.ideal_cycle,
+                                     units, units * self.quality, power * dt / 3600], axis=1), self.clock)
+        self._count_throughput(np.bincount(self.line, units, n_lines))
+
+    def _count_throughput(self, line_units):
+        self.minute_units += line_units
+        minute = int(self.clock // 60)
+        if minute == self.minute:
+            return
+        self.minute = minute
+        weight = 1 / min(self.minutes_seen + 1, THROUGHPUT_WINDOW_MINUTES)
+        delta = self.minute_units - self.throughput_mean
+        self.throughput_mean += weight * delta
+        self.throughput_var += weight * (delta * (self.minute_units - self.throughput_mean) - self.throughput_var)
+        self.minutes_seen += 1
+        self.minute_units = np.zeros_like(self.minute_units)
+
+    def advance(self, now=None, dt=1.0):
+        """Step the fleet up to `now` in dt-second steps (coarser if far behind)"""
+        now = now or datetime.now().timestamp()
+        steps = int((now - self.clock) // dt)
+        if steps > MAX_CATCHUP_STEPS:
+            dt, steps = (now - self.clock) / MAX_CATCHUP_STEPS, MAX_CATCHUP_STEPS
+        for _ in range(steps):
+            self.step(dt)
+
+    def kpis(self):
+        """Current OEE, TVR and CO2/km of every line as {kpi: array over lines}"""
+        lines = counter_kpis(self.hierarchy.counters("line", slice(None), self.clock))
+        return {
+            "OEE": np.clip(lines["OEE"], *KPI_BOUNDS["OEE"]),
+            "TVR": np.clip(np.sqrt(self.throughput_var) / np.maximum(self.throughput_mean, 1e-9), *KPI_BOUNDS["TVR"]),
+            "CO2/km": np.clip(self.co2_baseline * lines["energy_per_unit"] / self.nominal_energy_per_unit,
+                              *KPI_BOUNDS["CO2/km"])
+        }
+
+    def node_kpis(self, level, nodes):
+        """OEE factors, output, energy and state counts of some hierarchy nodes"""
+        kpis = counter_kpis(self.hierarchy.counters(level, nodes, self.clock))
+        counts = np.atleast_2d(self.hierarchy.states[HIERARCHY_LEVELS.index(level)][nodes])
+        kpis.update({name: counts[:, i] for i, name in enumerate(STATE_NAMES)})
+        return kpis
+
+    def history(self, start, end, dt):
+        """Simulate from `start` to `end` and sample the asset KPIs at their update frequencies
+
+        Returns {line_id: {kpi: (timestamps, values)}}; the fleet is left at `end`.
+        """
+        self.clock = start
+        self.minute = int(start // 60)
+        self.hierarchy.reset(start)
+        stamps = {kpi: np.arange(start + UPDATE_FREQUENCIES[kpi], end, UPDATE_FREQUENCIES[kpi]) for kpi in ASSET_KPIS}
+        values = {kpi: np.empty((len(LINE_IDS), len(stamps[kpi]))) for kpi in ASSET_KPIS}
+        position = {kpi: 0 for kpi in ASSET_KPIS}
+        while self.clock + dt <= end:
+            self.step(dt)
+            current = None
+            for kpi in ASSET_KPIS:
+                i = position[kpi]
+                if i < len(stamps[kpi]) and stamps[kpi][i] <= self.clock:
+                    current = current or self.kpis()
+                    values[kpi][:, i] = current[kpi]
+                    position[kpi] = i + 1
+        return {
+            line_id: {kpi: (stamps[kpi][:position[kpi]], values[kpi][l, :position[kpi]]) for kpi in ASSET_KPIS}
+            for l, line_id in enumerate(LINE_IDS)
+        }
+
+
+FLEET = None
+FLEET_HISTORY = {}
+FLEET_LOCK = threading.Lock()
+
+
+def asset_fleet():
+    """The process-wide simulated fleet, created on first use"""
+    global FLEET
+    with FLEET_LOCK:
+        if FLEET is None:
+            FLEET = AssetFleet()
+        return FLEET
+
+
+def hierarchy_snapshot(level, nodes):
+    """KPIs of some hierarchy nodes, or None while no asset simulation is running"""
+    if FLEET is None:
+        return None
+    with FLEET_LOCK:
+        FLEET.advance()
+        return FLEET.node_kpis(level, nodes)
+
+
+def hierarchy_children(level, node):
+    """(children, their KPIs, their asset states) of a hierarchy node, read at once
+
+    States are only returned for assets. None while no asset simulation is running.
+    """
+    fleet = FLEET
+    if fleet is None:
+        return None
+    with FLEET_LOCK:
+        fleet.advance()
+        children = fleet.hierarchy.children(level, node)
+        child_level = HIERARCHY_LEVELS[HIERARCHY_LEVELS.index(level) - 1]
+        states = fleet.state[children].copy() if child_level == "asset" else None
+        return children, fleet.node_kpis(child_level, children), states
+
+
+class AssetSimulationAdapter(VirtualAdapter):
+    """Virtual adapter whose OEE, TVR and CO2/km come from the per-asset simulation"""
+
+    def read_kpi(self, kpi_name):
+        if kpi_name not in ASSET_KPIS:
+            return super().read_kpi(kpi_name)
+        fleet = asset_fleet()
+        now = datetime.now().timestamp()
+        with FLEET_LOCK:
+            fleet.advance(now)
+            value = float(fleet.kpis()[kpi_name][LINE_INDEX[self.line_id]])
+        if self.last_values is not None:
+            self.last_values[kpi_name] = value
+            self.last_values["last_updated"][kpi_name] = now
+        return value, now
+
+    def backfill(self, hours):
+        series = super().backfill(hours)
+        fleet = asset_fleet()
+        with FLEET_LOCK:
+            # One simulated history serves every line's backfill
+            if hours not in FLEET_HISTORY:
+                end = datetime.now().timestamp()
+                FLEET_HISTORY[hours] = fleet.history(end - hours * 3600, end, min(UPDATE_FREQUENCIES[k] for k in ASSET_KPIS))
+            series.update(FLEET_HISTORY[hours][self.line_id])
+        for kpi in ASSET_KPIS:
+            if len(series[kpi][1]):
+                self.last_values[kpi] = float(series[kpi][1][-1])
+        return series
+
+    def get_status(self):
+        status = super().get_status()
+        n_assets = int(asset_fleet().line_assets[LINE_INDEX[self.line_id]])
+        status["message"] = f"Asset simulation: {n_assets} assets on {PRODUCTION_LINES[self.line_id]['name']}"
+        return status
 
-# Initialize adapters for all lines (using virtual for now)
-ADAPTERS = {
-    line_id: VirtualAdapter(line_id)
-    for line_id in PRODUCTION_LINES
-}
 
 # NEW: Adapter management system
 ADAPTER_INSTANCES = {}
@@ -455,75 +1167,200 @@ def get_adapter(line_id, mode):
     if line_id not in ADAPTER_INSTANCES:
         ADAPTER_INSTANCES[line_id] = {
             'virtual': VirtualAdapter(line_id),
-            'production': OPCUAAdapter(line_id)
+            'production': OPCUAAdapter(line_id),
+            'replay': ReplayAdapter(line_id),
+            'assets': AssetSimulationAdapter(line_id)
         }
     return ADAPTER_INSTANCES[line_id][mode]
 
-# ====================== PREDICTIVE ANALYTICS FUNCTIONS ======================
-def predict_kpi_trend(current_value, target):
-    """Predict KPI trend for next 24 hours based on current trajectory"""
-    # Simple linear projection with random fluctuation
-    if current_value >= target:
-        trend = current_value - random.uniform(0.1, 0.5)
+# ====================== HISTORY IMPORT ======================
+IMPORT_CHUNK_ROWS = 500000  # rows converted at a time, bounding memory whatever the file size
+TIMESTAMP_COLUMN = "timestamp"
+LINE_COLUMN = "line_id"
+
+
+# pandas and pyarrow are only needed to import and export history, so they
+# are imported on first use instead of slowing down every worker's boot
+def load_pyarrow():
+    """(pyarrow, pyarrow.parquet), or (None, None) when pyarrow is not installed"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:  # Parquet import and export are optional
+        return None, None
+    return pyarrow, pyarrow.parquet
+
+
+def epoch_seconds(column):
+    """Vectorised conversion of a timestamp column or list to epoch seconds (NaN if invalid)
+
+    Numbers are taken as epoch seconds; naive date strings are read in the
+    server's local time, like the timestamps produced by the adapters.
+    """
+    import pandas as pd
+    column = pd.Series(column)
+    if pd.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype=float)
+    stamps = pd.to_datetime(column, errors="coerce")
+    if stamps.dt.tz is None:
+        stamps = stamps.dt.tz_localize(datetime.now().astimezone().tzinfo)
+    return ((stamps - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)).to_numpy(dtype=float)
+
+
+def kpi_rows(frame):
+    """Flatten an export chunk into (line index, KPI index, timestamp, value) arrays
+
+    Long exports have `kpi` and `value` columns; wide exports have one column
+    per KPI name. Unknown lines or KPIs get index -1.
+    """
+    import pandas as pd
+    stamps = epoch_seconds(frame[TIMESTAMP_COLUMN])
+    lines = pd.Categorical(frame[LINE_COLUMN].astype(str), categories=LINE_IDS).codes
+    if "kpi" in frame and "value" in frame:
+        kpis = pd.Categorical(frame["kpi"].astype(str), categories=KPI_NAMES).codes
+        values = pd.to_numeric(frame["value"], errors="coerce").to_numpy(dtype=float)
+        return lines, kpis, stamps, values
+
+    columns = [kpi for kpi in KPI_NAMES if kpi in frame]
+    values = frame[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    kpis = np.tile([KPI_INDEX[kpi] for kpi in columns], len(frame))
+    return (np.repeat(lines, len(columns)), kpis,
+            np.repeat(stamps, len(columns)), values.ravel())
+
+
+def read_export_chunks(path, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Yield DataFrame chunks of a CSV or Parquet export"""
+    import pandas as pd
+    if path.lower().endswith((".parquet", ".pq")):
+        pq = load_pyarrow()[1]
+        if pq is None:
+            raise RuntimeError("Parquet import requires pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
     else:
-        trend = current_value + random.uniform(0.2, 1.0)
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+class RecordingWriter:
+    """Appends imported samples to the per-line, per-KPI recording files
+
+    Samples that arrive in time order are appended as-is; files that
+    received older samples are sorted once when the import finishes.
+    """
 
-    # Cap values within reasonable range
-    return max(target * 0.7, min(target * 1.3, trend))
+    def __init__(self, directory=RECORDINGS_DIR):
+        self.directory = directory
+        self.last_ts = {}
+        self.unsorted = set()
+
+    def append(self, line_id, kpi, stamps, values):
+        path = recording_path(self.directory, line_id, KPI_SLUGS[kpi])
+        if path not in self.last_ts:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            existing = open_recording(path, RECORD_DTYPE)
+            self.last_ts[path] = existing["ts"][-1] if len(existing) else -np.inf
+        if stamps[0] < self.last_ts[path]:
+            self.unsorted.add(path)
+        self.last_ts[path] = max(self.last_ts[path], stamps[-1])
+
+        records = np.empty(len(stamps), dtype=RECORD_DTYPE)
+        records["ts"] = stamps
+        records["value"] = values
+        with open(path, "ab") as f:
+            records.tofile(f)
+
+    def finish(self):
+        """Sort the files that were appended out of order"""
+        for path in self.unsorted:
+            records = np.fromfile(path, dtype=RECORD_DTYPE)
+            records = records[np.argsort(records["ts"], kind="stable")]
+            records.tofile(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        self.unsorted.clear()
+
+
+def import_history(paths, directory=RECORDINGS_DIR, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Bulk-import KPI exports into the recording store, one chunk at a time"""
+    writer = RecordingWriter(directory)
+    summary = {"rows": 0, "imported": 0, "rejected": 0, "unknown_columns": set()}
+    for path in paths:
+        for frame in read_export_chunks(path, chunk_rows):
+            summary["rows"] += len(frame)
+            summary["unknown_columns"].update(
+                set(frame.columns) - set(KPI_NAMES) - {TIMESTAMP_COLUMN, LINE_COLUMN, "kpi", "value"})
+            lines, kpis, stamps, values = kpi_rows(frame)
+            valid = (lines >= 0) & (kpis >= 0) & np.isfinite(stamps) & np.isfinite(values)
+            summary["rejected"] += int((~valid).sum())
+            lines, kpis, stamps, values = lines[valid], kpis[valid], stamps[valid], values[valid]
+
+            # Group the chunk by (line, KPI) and order each group by time
+            keys = lines.astype(np.int64) * len(KPI_NAMES) + kpis
+            order = np.lexsort((stamps, keys))
+            keys, stamps, values = keys[order], stamps[order], values[order]
+            bounds = np.flatnonzero(np.diff(keys)) + 1
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(keys)]):
+                if end > start:
+                    line, kpi = divmod(int(keys[start]), len(KPI_NAMES))
+                    writer.append(LINE_IDS[line], KPI_NAMES[kpi], stamps[start:end], values[start:end])
+            summary["imported"] += len(keys)
+    writer.finish()
+    summary["unknown_columns"] = sorted(summary["unknown_columns"])
+    return summary
+
+
+# ====================== PREDICTIVE ANALYTICS FUNCTIONS ======================
+RISK_LOWER_IS_BETTER = ["PM Risk", "CO2/km", "TVR"]
 
 
 def calculate_failure_probability(data):
     """Calculate machine failure probability based on multiple KPIs"""
-    # Weighted combination of relevant KPIs
+    # Weighted combination of relevant KPIs (scalars or arrays of simulated values)
     score = 0
     total_weight = 0
 
     for kpi, weight in FAILURE_WEIGHTS.items():
         # Normalize KPI values to 0-1 range
-        normalized = data[kpi] / TARGETS[kpi] if TARGETS[kpi] > 0 else data[kpi]
-        score += normalized * weight
+        normalized = np.divide(data[kpi], TARGETS[kpi]) if TARGETS[kpi] > 0 else data[kpi]
+        score = score + normalized * weight
         total_weight += abs(weight)
 
     # Scale to 0-100 probability
-    probability = max(0, min(100, (score / total_weight) * 100))
-    return probability
+    probability = np.clip((score / total_weight) * 100, 0, 100)
+    return float(probability) if np.ndim(probability) == 0 else probability
 
 
-# NEW: Enhanced component failure prediction function
-def predict_component_failures(data, line_id):
-    """Calculate specific component failure probabilities based on KPIs"""
-    component_risks = {}
-    base_components = COMPONENT_FAILURE_PROBABILITIES[line_id]
-
-    for component, base_prob in base_components.items():
-        # Get KPI influences for this component
-        kpi_influences = COMPONENT_KPI_MATRIX.get(component, {})
-
-        # Calculate weighted risk based on current KPI values
-        if kpi_influences:
-            risk_modifier = 0
-            for kpi, influence in kpi_influences.items():
-                # Compare current KPI to target - higher risk if worse performance
-                if kpi in data and kpi in TARGETS:
-                    if TARGETS[kpi] == 0:  # Handle security case
-                        kpi_risk = data[kpi] * 10  # Each incident adds significant risk
-                    else:
-                        ratio = data[kpi] / TARGETS[kpi]
-                        # Invert ratio for metrics where lower is better (PM Risk, CO2, TVR)
-                        if kpi in ["PM Risk", "CO2/km", "TVR"]:
-                            kpi_risk = (ratio * 50) if ratio > 1 else 0
-                        else:  # For metrics where higher is better (OEE, SC Resilience, etc.)
-                            kpi_risk = 50 * (1 - ratio) if ratio < 1 else 0
-
-                    risk_modifier += kpi_risk * influence
-
-            # Calculate final risk with modifiers
-            final_risk = base_prob * 100 * (1 + risk_modifier / 100)
-            component_risks[component] = min(99.9, max(5, final_risk))  # Cap between 5% and 99.9%
-        else:
-            # Fallback to base probability if no influences defined
-            component_risks[component] = base_prob * 100
+def kpi_risk_contribution(kpi, value):
+    """Risk points a KPI adds to the components it influences (0 while on target)"""
+    if TARGETS[kpi] == 0:  # Handle security case
+        return value * 10  # Each incident adds significant risk
+
+    ratio = value / TARGETS[kpi]
+    # Invert ratio for metrics where lower is better (PM Risk, CO2, TVR)
+    if kpi in RISK_LOWER_IS_BETTER:
+        return (ratio * 50) if ratio > 1 else 0
+    # For metrics where higher is better (OEE, SC Resilience, etc.)
+    return 50 * (1 - ratio) if ratio < 1 else 0
 
+
+def component_risk(component, base_prob, contributions):
+    """Failure risk (%) of one component from the KPI risk contributions"""
+    # Get KPI influences for this component
+    kpi_influences = COMPONENT_KPI_MATRIX.get(component, {})
+    if not kpi_influences:
+        # Fallback to base probability if no influences defined
+        return base_prob * 100
+
+    # Calculate weighted risk based on current KPI values
+    risk_modifier = sum(contributions[kpi] * influence
+                        for kpi, influence in kpi_influences.items() if kpi in contributions)
+
+    # Calculate final risk with modifiers
+    final_risk = base_prob * 100 * (1 + risk_modifier / 100)
+    return min(99.9, max(5, final_risk))  # Cap between 5% and 99.9%
+
+
+def rank_component_failures(component_risks):
+    """Turn {component: risk} into failure predictions, highest risk first"""
     # Sort by risk (highest first)
     sorted_risks = sorted(component_risks.items(), key=lambda x: x[1], reverse=True)
 
@@ -542,166 +1379,1933 @@ def predict_component_failures(data, line_id):
     return failure_predictions
 
 
-def predict_bottlenecks(utilization):
-    """Identify predicted resource bottlenecks"""
-    bottlenecks = []
-    for i, util in enumerate(utilization):
-        # Project utilization for next shift (8 hours)
-        projected = util * (1 + random.uniform(0.05, 0.15))
+# NEW: Enhanced component failure prediction function
+def predict_component_failures(data, line_id):
+    """Calculate specific component failure probabilities based on KPIs"""
+    contributions = {kpi: kpi_risk_contribution(kpi, data[kpi]) for kpi in TARGETS if kpi in data}
+    component_risks = {
+        component: component_risk(component, base_prob, contributions)
+        for component, base_prob in COMPONENT_FAILURE_PROBABILITIES[line_id].items()
+    }
+    return rank_component_failures(component_risks)
+
+
+def predict_bottlenecks(utilization, projected, threshold=BOTTLENECK_THRESHOLD):
+    """Identify resources projected to exceed the bottleneck threshold next shift"""
+    utilization = np.asarray(utilization, dtype=float)
+    projected = np.asarray(projected, dtype=float)
+    severity = np.clip((projected - threshold) * 5, 0, 100)  # Scale severity
+
+    return [
+        {
+            "resource": RESOURCES[i],
+            "current": float(utilization[i]),
+            "projected": float(projected[i]),
+            "severity": float(severity[i])
+        }
+        for i in np.flatnonzero(projected > threshold)
+    ]
 
-        if projected > 85:
-            bottlenecks.append({
-                "resource": i,
-                "current": util,
-                "projected": projected,
-                "severity": min(100, (projected - 85) * 5)  # Scale severity
-            })
-    return bottlenecks
 
+def optimize_maintenance_windows(risks, hours, oee, crews, output,
+                                 horizon_days=MAINTENANCE_HORIZON_DAYS, start=None):
+    """Choose a maintenance day for every component of every line.
 
-def calculate_optimal_maintenance(data, risk_levels):
+    `risks` and `hours` are (lines, components) arrays from
+    predict_component_failures, padded with NaN where a line has fewer
+    components. Costs for every (line, component, day) are evaluated at once;
+    days are then assigned per line with a regret heuristic that respects the
+    daily crew capacity. Returns a (lines, components) array of day offsets,
+    -1 where nothing could be scheduled, and the cost tensor.
+    """
+    risks = np.asarray(risks, dtype=float)
+    hours = np.asarray(hours, dtype=float)
+    start = start or datetime.now()
+    days = np.arange(horizon_days)
+
+    # Failure rate implied by "risk % within `hours`", and its growth while waiting
+    probability = np.clip(np.nan_to_num(risks) / 100, 0, 0.999)
+    rate = -np.log1p(-probability) / np.maximum(np.nan_to_num(hours), 1)
+    failed_before = 1 - np.exp(-rate[..., None] * 24 * days)
+    condition = 100 * (1 - (1 - probability[..., None]) * (1 - failed_before))
+
+    planned = np.select([condition < 40, condition < 70], [2000, 4000], 12000)
+    weekday = np.array([(start + timedelta(days=int(d))).weekday() for d in days])
+    load = np.where(weekday >= 5, WEEKEND_LOAD_FACTOR, 1.0)
+    production_loss = (MAINTENANCE_DOWNTIME_HOURS * np.asarray(output, dtype=float)[:, None, None]
+                       * np.asarray(oee, dtype=float)[:, None, None] / 100 * UNIT_MARGIN * load)
+    cost = planned + production_loss + failed_before * UNPLANNED_FAILURE_COST
+    cost[np.isnan(risks)] = np.inf
+
+    schedule = np.full(risks.shape, -1)
+    for l in range(risks.shape[0]):
+        capacity = np.full(horizon_days, crews[l])
+        remaining = np.flatnonzero(~np.isnan(risks[l]))
+        while remaining.size:
+            feasible = np.where(capacity > 0, cost[l, remaining], np.inf)
+            best = np.sort(feasible, axis=1)[:, :2]
+            if np.isinf(best[:, 0]).all():
+                break  # crews are fully booked over the horizon
+            # Schedule first the component that would lose most if its best day were taken
+            regret = best[:, -1] - best[:, 0]
+            pick = int(np.argmax(np.where(np.isnan(regret), -np.inf, regret)))
+            day = int(np.argmin(feasible[pick]))
+            schedule[l, remaining[pick]] = day
+            capacity[day] -= 1
+            remaining = np.delete(remaining, pick)
+
+    return schedule, cost, condition
+
+
+def calculate_optimal_maintenance(data, failure_predictions, line_id,
+                                  horizon_days=MAINTENANCE_HORIZON_DAYS):
     """Calculate optimal maintenance windows based on cost-risk analysis"""
-    optimal_windows = []
-    current_risk = data["PM Risk"]
-    oee_value = data["OEE"]
-
-    for day, risk in enumerate(risk_levels):
-        # Calculate cost of maintenance at this risk level
-        if risk < 40:
-            cost = 2000
-        elif risk < 70:
-            cost = 4000
-        else:
-            cost = 12000
+    plans = plan_maintenance({line_id: (data, failure_predictions)}, horizon_days)
+    return plans[line_id]
 
-        # Opportunity cost (lost production)
-        production_loss = (100 - oee_value) * 100  # Simplified model
 
-        # Total cost
-        total_cost = cost + production_loss
+def plan_maintenance(line_inputs, horizon_days=MAINTENANCE_HORIZON_DAYS):
+    """Plan maintenance for several lines at once.
 
-        # Optimal if in low-risk and low-production-loss window
-        if risk < 50 and production_loss < 3000:
-            optimal_windows.append(day)
+    `line_inputs` maps line_id to (KPI data, predict_component_failures output).
+    Returns {line_id: [maintenance window, ...]} ordered by date.
+    """
+    line_ids = list(line_inputs)
+    n_components = max(len(predictions) for _, predictions in line_inputs.values())
+    risks = np.full((len(line_ids), n_components), np.nan)
+    hours = np.full_like(risks, np.nan)
+    for l, line_id in enumerate(line_ids):
+        predictions = line_inputs[line_id][1]
+        risks[l, :len(predictions)] = [p["risk"] for p in predictions]
+        hours[l, :len(predictions)] = [p["hours"] for p in predictions]
+
+    start = datetime.now()
+    schedule, cost, condition = optimize_maintenance_windows(
+        risks, hours,
+        oee=[line_inputs[line_id][0]["OEE"] for line_id in line_ids],
+        crews=[MAINTENANCE_CREWS.get(line_id, 1) for line_id in line_ids],
+        output=[PRODUCTION_LINES[line_id]["avg_output"] for line_id in line_ids],
+        horizon_days=horizon_days,
+        start=start
+    )
 
-    return optimal_windows
+    plans = {}
+    for l, line_id in enumerate(line_ids):
+        windows = []
+        for c, prediction in enumerate(line_inputs[line_id][1]):
+            day = schedule[l, c]
+            if day < 0:
+                continue
+            windows.append({
+                "component": prediction["component"],
+                "day": int(day),
+                "date": (start + timedelta(days=int(day))).strftime("%Y-%m-%d"),
+                "risk": float(condition[l, c, day]),
+                "cost": float(cost[l, c, day])
+            })
+        plans[line_id] = sorted(windows, key=lambda w: (w["day"], -w["risk"]))
+    return plans
+
+
+# ====================== KPI HISTORY & FORECASTING ======================
+KPI_NAMES = list(TARGETS.keys())
+LINE_IDS = list(PRODUCTION_LINES.keys())
+KPI_INDEX = {kpi: i for i, kpi in enumerate(KPI_NAMES)}
+LINE_INDEX = {line_id: i for i, line_id in enumerate(LINE_IDS)}
+UPDATE_PERIODS = np.array([UPDATE_FREQUENCIES[kpi] for kpi in KPI_NAMES], dtype=float)
+
+# Physical ranges of each KPI (same limits the simulator clamps to)
+KPI_BOUNDS = {
+    "OEE": (60, 95),
+    "CO2/km": (80, 150),
+    "PM Risk": (10, 95),
+    "SC Resilience": (0.4, 0.95),
+    "TVR": (0.05, 0.3),
+    "Batt Efficiency": (85, 98),
+    "Chg Utilization": (65, 90),
+    "Security": (0, 2)
+}
 
+HISTORY_CAPACITY = 4096  # samples kept in memory per line and KPI
+WARMUP_HOURS = 48  # simulated history loaded when the sampler starts
+FORECAST_HORIZON_HOURS = 24
+SEASON_LENGTH = 24  # hourly seasonal buckets, one day per cycle
 
-# ====================== APP LAYOUT ======================
-app.layout = dbc.Container(fluid=True, children=[
-    dcc.Location(id='url', refresh=False),
-    dcc.Store(id='kpi-data', data=generate_initial_data('line1')),
-    dcc.Interval(id='interval', interval=5 * 1000, n_intervals=0),
-    dcc.Store(id='fullscreen-store', data={'is_fullscreen': False}),
 
-    # NEW: Add this store for tracking adapter modes
-    dcc.Store(
-        id='adapter-modes-store',
-        data={line_id: 'virtual' for line_id in PRODUCTION_LINES}
-    ),
+def hours_of_day(timestamps):
+    """Local hour of day for an array of UNIX timestamps (at the server's current UTC offset)"""
+    offset = datetime.now().astimezone().utcoffset().total_seconds()
+    return ((np.atleast_1d(np.asarray(timestamps, dtype=float)) + offset) // 3600 % 24).astype(np.intp)
 
-    # Navigation Sidebar
-    dbc.Row([
-        dbc.Col(
-            dbc.Nav(
-                [
-                    dbc.NavLink(
-                        [
-                            html.I(className="bi bi-speedometer2 me-2"),
-                            "Dashboard"
-                        ],
-                        href="/",
-                        active="exact",
-                        className="py-3"
-                    ),
-                    dbc.NavLink(
-                        [
-                            html.I(className="bi bi-graph-up me-2"),
-                            "Production Analytics"
-                        ],
-                        href="/analytics",
-                        active="exact",
-                        className="py-3"
-                    )
-                ],
-                vertical=True,
-                pills=True,
-                className="sidebar bg-dark"
-            ),
-            width=2,
-            className="p-0"
-        ),
 
-        # Main Content
-        dbc.Col(
-            id="main-content",
-            children=[
-                # Header
-dbc.Row([
-    dbc.Col(
-        html.Div([
-            html.H1("KPI Dashboard", className="display-4 fw-bold mb-0"),
-            html.Small("Real-time Production Monitoring", className="text-muted"),
-            dbc.Select(
-                id="line-selector",
-                options=[
-                    {"label": f"{PRODUCTION_LINES[line]['name']}", "value": line}
-                    for line in PRODUCTION_LINES
-                ],
-                value="line1",
-                className="mt-2 w-100",
-                size="sm"
-            )
-        ]),
-        width=8  # Changed from 10 to 8
-    ),
-    dbc.Col(
-        html.Div([  # New wrapper Div
-            # Production mode toggle switch
-            dbc.Switch(
-                id="production-mode-toggle",
-                label="Production Mode",
-                value=False,
-                className="mb-2"  # Margin bottom
-            ),
-            # Existing fullscreen button
-            dbc.Button(
-                html.I(className="bi bi-arrows-fullscreen"),
-                id="fullscreen-btn",
-                color="link",
-                className="p-2",  # Removed mt-4
-                style={"zIndex": 1000}
-            )
-        ], className="d-flex flex-column align-items-end"),  # Vertical alignment
-        width=4,  # Changed from 2 to 4
-        className="d-flex align-items-center justify-content-end"
-    )
-], className="mb-4 p-3 header-bg"),
+class KPIHistory:
+    """Ring buffers holding the most recent samples of every line and KPI"""
 
-                # Page Content
-                html.Div(id='page-content', className="mt-3"),
+    def __init__(self, n_lines, n_kpis, capacity=HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = np.full((n_lines, n_kpis, capacity), np.nan)
+        self.values = np.full((n_lines, n_kpis, capacity), np.nan)
+        self.count = np.zeros((n_lines, n_kpis), dtype=np.int64)
 
-                # Footer
-                dbc.Row(dbc.Col(
-                    html.Div([
-                        html.Hr(className="mb-2"),
-                        html.P([
-                            "Designed by ",
-                            html.Strong("Pratik Sonavane",
-                                        style={"background": "linear-gradient(45deg, #4facfe, #00f2fe)",
-                                               "-webkit-background-clip": "text",
-                                               "color": "transparent"}),
-                            " - Production Intelligence System"
-                        ], className="text-center"),
-                        html.P("© 2025 AUTOVISTA - Real-time Production Monitoring",
-                               className="text-center text-muted")
-                    ], className="p-3")
-                ))
-            ],
-            width=10,
-            style={"padding": "0 20px", "height": "100vh"}
-        )
-    ], className="g-0"),
+    def append(self, li, ki, timestamps, values):
+        """Append one sample to each (line, KPI) pair; pairs must be unique"""
+        pos = self.count[li, ki] % self.capacity
+        self.timestamps[li, ki, pos] = timestamps
+        self.values[li, ki, pos] = values
+        self.count[li, ki] += 1
+
+    def series(self, li, ki):
+        """Samples of one line and KPI in chronological order"""
+        n = int(min(self.count[li, ki], self.capacity))
+        order = (np.arange(self.count[li, ki] - n, self.count[li, ki]) % self.capacity)
+        return self.timestamps[li, ki, order], self.values[li, ki, order]
+
+
+# (name, bucket width in seconds, buckets retained): 1-min for a week, hourly for a quarter, daily for 5 years
+ROLLUP_TIERS = (
+    ("1min", 60, 7 * 24 * 60),
+    ("1h", 3600, 90 * 24),
+    ("1d", 86400, 5 * 365),
+)
+
+
+class KPIRollups:
+    """Per-bucket count/sum/min/max of every line and KPI at several resolutions.
+
+    Each tier is a ring of buckets addressed by bucket number, so appending a
+    sample updates one slot per tier and old buckets are overwritten once
+    they fall out of the tier's retention.
+    """
+
+    def __init__(self, n_lines, n_kpis, tiers=ROLLUP_TIERS):
+        self.tiers = tiers
+        self.start, self.count, self.total, self.low, self.high = {}, {}, {}, {}, {}
+        for name, _, capacity in tiers:
+            self.start[name] = np.full((n_lines, n_kpis, capacity), np.nan)
+            self.count[name] = np.zeros((n_lines, n_kpis, capacity), dtype=np.int64)
+            self.total[name] = np.zeros((n_lines, n_kpis, capacity))
+            self.low[name] = np.full((n_lines, n_kpis, capacity), np.inf)
+            self.high[name] = np.full((n_lines, n_kpis, capacity), -np.inf)
+
+    def append(self, li, ki, stamps, values):
+        """Add one sample per (line, KPI) pair to the open bucket of every tier"""
+        for name, width, capacity in self.tiers:
+            starts = np.floor(stamps / width) * width
+            slots = (starts // width % capacity).astype(np.int64)
+            current = self.start[name][li, ki, slots]
+            # Samples older than the bucket now held in their slot are past retention
+            keep = ~(current > starts)
+            l, k, slot, start, value = li[keep], ki[keep], slots[keep], starts[keep], values[keep]
+            fresh = self.start[name][l, k, slot] != start
+            self.reset(name, l[fresh], k[fresh], slot[fresh], start[fresh])
+            self.count[name][l, k, slot] += 1
+            self.total[name][l, k, slot] += value
+            self.low[name][l, k, slot] = np.minimum(self.low[name][l, k, slot], value)
+            self.high[name][l, k, slot] = np.maximum(self.high[name][l, k, slot], value)
+
+    def reset(self, name, li, ki, slots, starts):
+        self.start[name][li, ki, slots] = starts
+        self.count[name][li, ki, slots] = 0
+        self.total[name][li, ki, slots] = 0.0
+        self.low[name][li, ki, slots] = np.inf
+        self.high[name][li, ki, slots] = -np.inf
+
+    def load(self, li, ki, name, starts, means, lows, highs, counts):
+        """Store precomputed buckets of one pair, e.g. aggregated from a recording"""
+        width, capacity = next((w, c) for n, w, c in self.tiers if n == name)
+        recent = starts > starts[-1] - capacity * width
+        starts, slots = starts[recent], (starts[recent] // width % capacity).astype(np.int64)
+        self.start[name][li, ki, slots] = starts
+        self.count[name][li, ki, slots] = counts[recent]
+        self.total[name][li, ki, slots] = means[recent] * counts[recent]
+        self.low[name][li, ki, slots] = lows[recent]
+        self.high[name][li, ki, slots] = highs[recent]
+
+    def query(self, li, ki, start, end, resolution):
+        """Buckets of one pair in [start, end) at `resolution` seconds, or None below the finest tier
+
+        Reads the coarsest tier whose buckets are no wider than `resolution`
+        and merges its buckets further when `resolution` is wider still.
+        """
+        eligible = [(name, width) for name, width, _ in self.tiers if width <= resolution]
+        if not eligible:
+            return None
+        name, width = max(eligible, key=lambda tier: tier[1])
+        starts = self.start[name][li, ki]
+        slots = np.flatnonzero((starts >= np.floor(start / width) * width) & (starts < end))
+        slots = slots[np.argsort(starts[slots])]
+        starts, counts = starts[slots], self.count[name][li, ki, slots]
+        totals, lows, highs = self.total[name][li, ki, slots], self.low[name][li, ki, slots], self.high[name][li, ki, slots]
+
+        if len(slots) and resolution > width:
+            groups = np.floor(starts / resolution) * resolution
+            bounds = np.flatnonzero(np.r_[True, np.diff(groups) != 0])
+            starts, counts = groups[bounds], np.add.reduceat(counts, bounds)
+            totals = np.add.reduceat(totals, bounds)
+            lows, highs = np.minimum.reduceat(lows, bounds), np.maximum.reduceat(highs, bounds)
+        return {"tier": name, "ts": starts, "mean": totals / np.maximum(counts, 1),
+                "min": lows, "max": highs, "count": counts}
+
+
+class HoltWintersForecaster:
+    """Incremental damped Holt-Winters model for every (line, KPI) pair.
+
+    Smoothing constants are per hour and converted to per-sample weights from
+    the elapsed time, so KPIs sampled every 30 s and every 30 min share one
+    parameter set. Each new sample updates its series and refreshes its 24 h
+    forecast in O(1); all series in a batch are updated together.
+    """
+
+    def __init__(self, n_lines, n_kpis, alpha=0.05, beta=0.05, gamma=0.6, phi=0.9,
+                 variance_decay=0.05, z=1.645):
+        shape = (n_lines, n_kpis)
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.phi = phi
+        self.variance_decay = variance_decay
+        self.level = np.zeros(shape)
+        self.trend = np.zeros(shape)
+        self.season = np.zeros(shape + (SEASON_LENGTH,))
+        self.variance = np.zeros(shape)
+        self.last_ts = np.zeros(shape)
+        self.initialized = np.zeros(shape, dtype=bool)
+
+        horizon = FORECAST_HORIZON_HOURS + 1
+        self.mean = np.zeros(shape + (horizon,))
+        self.lower = np.zeros(shape + (horizon,))
+        self.upper = np.zeros(shape + (horizon,))
+
+        steps = np.arange(horizon)
+        self._damping = np.cumsum(phi ** steps) - 1
+        # Holt prediction-interval growth: 1 + sum_{j<h} (alpha * (1 + j * beta))^2
+        growth = (alpha * (1 + steps * beta)) ** 2
+        growth[0] = 0
+        self._spread = z * np.sqrt(1 + np.concatenate(([0.0], np.cumsum(growth)[:-1])))
+
+        self._floor = np.array([KPI_BOUNDS[kpi][0] for kpi in KPI_NAMES], dtype=float)
+        self._ceiling = np.array([KPI_BOUNDS[kpi][1] for kpi in KPI_NAMES], dtype=float)
+
+    def update(self, li, ki, timestamps, values):
+        """Feed one new sample to each (line, KPI) pair and return the one-step errors"""
+        hours = hours_of_day(timestamps)
+        fresh = ~self.initialized[li, ki]
+        residuals = np.zeros(len(li))
+
+        if fresh.any():
+            l, k = li[fresh], ki[fresh]
+            self.level[l, k] = values[fresh]
+            self.trend[l, k] = 0.0
+            self.season[l, k] = 0.0
+            self.variance[l, k] = 0.0
+            self.initialized[l, k] = True
+
+        known = ~fresh
+        if known.any():
+            l, k, y, h = li[known], ki[known], values[known], hours[known]
+            dt = np.clip((timestamps[known] - self.last_ts[l, k]) / 3600.0, 1e-6, 24.0)
+            a = 1 - (1 - self.alpha) ** dt
+            b = 1 - (1 - self.beta) ** dt
+            g = 1 - (1 - self.gamma) ** dt
+            decay = self.phi ** dt
+
+            level, trend, season = self.level[l, k], self.trend[l, k], self.season[l, k, h]
+            projected = level + trend * decay * dt
+            error = y - (projected + season)
+
+            new_level = projected + a * (y - season - projected)
+            new_trend = decay * trend + b * ((new_level - level) / dt - decay * trend)
+            self.season[l, k, h] = season + g * (y - new_level - season)
+
+            # Keep the seasonal profile centred so the level carries the mean
+            offset = self.season[l, k].mean(axis=-1)
+            self.season[l, k] -= offset[:, None]
+            self.level[l, k] = new_level + offset
+            self.trend[l, k] = new_trend
+            self.variance[l, k] += self.variance_decay * (error ** 2 - self.variance[l, k])
+            residuals[known] = error
+
+        self.last_ts[li, ki] = timestamps
+        self._refresh(li, ki, hours)
+        return residuals
+
+    def _refresh(self, li, ki, hours):
+        """Recompute the stored 24 h forecast of the given series"""
+        steps = np.arange(FORECAST_HORIZON_HOURS + 1)
+        buckets = (hours[:, None] + steps) % SEASON_LENGTH
+        season = self.season[li[:, None], ki[:, None], buckets]
+        mean = self.level[li, ki][:, None] + self.trend[li, ki][:, None] * self._damping + season
+        spread = np.sqrt(self.variance[li, ki])[:, None] * self._spread
+
+        floor = self._floor[ki][:, None]
+        ceiling = self._ceiling[ki][:, None]
+        self.mean[li, ki] = np.clip(mean, floor, ceiling)
+        self.lower[li, ki] = np.clip(mean - spread, floor, ceiling)
+        self.upper[li, ki] = np.clip(mean + spread, floor, ceiling)
+
+
+# ====================== ANOMALY DETECTION ======================
+ANOMALY_LOG_SIZE = 500  # events kept across all lines
+
+# Minimum single-sample jump that counts as a spike (PM Risk jumps by 5-15)
+SPIKE_THRESHOLDS = {
+    "PM Risk": 5.0
+}
+
+ANOMALY_LABELS = {
+    "z-score": "OUTLIER",
+    "cusum-up": "DRIFT UP",
+    "cusum-down": "DRIFT DOWN",
+    "spike": "SPIKE"
+}
+
+
+class StreamingAnomalyDetector:
+    """EWMA z-score, two-sided CUSUM and spike detection per (line, KPI).
+
+    Runs on the forecaster's one-step residuals so the day/night seasonality
+    is not reported as an anomaly. State is O(1) per series and events go to
+    a bounded log shared by every viewer.
+    """
+
+    def __init__(self, n_lines, n_kpis, mean_decay=0.1, variance_decay=0.02, z_threshold=4.0,
+                 cusum_slack=1.0, cusum_threshold=10.0, spike_z=2.5, warmup=30,
+                 log_size=ANOMALY_LOG_SIZE):
+        shape = (n_lines, n_kpis)
+        self.mean_decay = mean_decay
+        self.variance_decay = variance_decay
+        self.z_threshold = z_threshold
+        self.cusum_slack = cusum_slack
+        self.cusum_threshold = cusum_threshold
+        self.spike_z = spike_z
+        self.warmup = warmup
+        self.mean = np.zeros(shape)
+        self.variance = np.zeros(shape)
+        self.cusum_high = np.zeros(shape)
+        self.cusum_low = np.zeros(shape)
+        self.previous = np.full(shape, np.nan)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.spike_jump = np.array([SPIKE_THRESHOLDS.get(kpi, np.inf) for kpi in KPI_NAMES])
+        # Noise floor so flat series (e.g. Security at 0) still produce finite scores
+        self.min_std = np.array([(KPI_BOUNDS[kpi][1] - KPI_BOUNDS[kpi][0]) * 0.005 for kpi in KPI_NAMES])
+        self.events = deque(maxlen=log_size)
+        self.event_count = 0
+        self.line_event_count = np.zeros(n_lines, dtype=np.int64)
+
+    def update(self, li, ki, timestamps, values, residuals):
+        """Score one sample per (line, KPI) pair and log any anomalies"""
+        std = np.maximum(np.sqrt(self.variance[li, ki]), self.min_std[ki])
+        z = (residuals - self.mean[li, ki]) / std
+        ready = self.count[li, ki] >= self.warmup
+
+        high = np.maximum(0, self.cusum_high[li, ki] + z - self.cusum_slack)
+        low = np.maximum(0, self.cusum_low[li, ki] - z - self.cusum_slack)
+        jump = values - self.previous[li, ki]
+
+        spike = ready & (jump >= self.spike_jump[ki]) & (z > self.spike_z)
+        flags = {
+            "z-score": ready & (np.abs(z) > self.z_threshold) & ~spike,
+            "cusum-up": ready & (high > self.cusum_threshold),
+            "cusum-down": ready & (low > self.cusum_threshold),
+            "spike": spike
+        }
+
+        # Reset the CUSUM of series that alarmed, and stop anomalies skewing the baseline
+        self.cusum_high[li, ki] = np.where(flags["cusum-up"] | ~ready, 0, high)
+        self.cusum_low[li, ki] = np.where(flags["cusum-down"] | ~ready, 0, low)
+        delta = np.where(ready, np.clip(z, -self.z_threshold, self.z_threshold), z) * std
+        self.mean[li, ki] += self.mean_decay * delta
+        self.variance[li, ki] += self.variance_decay * (delta ** 2 - self.variance[li, ki])
+        self.previous[li, ki] = values
+        self.count[li, ki] += 1
+
+        for kind, hits in flags.items():
+            for j in np.flatnonzero(hits):
+                self._log(kind, li[j], ki[j], timestamps[j], values[j], z[j])
+
+    def _log(self, kind, l, k, timestamp, value, score):
+        kpi = KPI_NAMES[k]
+        self.events.append({
+            "timestamp": float(timestamp),
+            "line_id": LINE_IDS[l],
+            "kpi": kpi,
+            "type": kind,
+            "value": float(value),
+            "score": float(score)
+        })
+        self.event_count += 1
+        self.line_event_count[l] += 1
+
+    def recent(self, line_id, limit=10):
+        """Newest events of one line, newest first"""
+        found = [event for event in self.events if event["line_id"] == line_id]
+        found.sort(key=lambda event: event["timestamp"], reverse=True)
+        return found[:limit]
+
+
+# ====================== ALERT RULES ======================
+ALERT_LOG_SIZE = 500  # alerts kept across all lines
+RATE_TIME_CONSTANT = 900  # seconds of smoothing applied to rates of change
+
+# Conditions: "below"/"above" compare the value, "rate_below"/"rate_above" its change per hour.
+# Thresholds are absolute or a ratio of the KPI target; an alert opens once the condition
+# has held for `hold` seconds and closes when the value is back past `clear` (hysteresis).
+ALERT_RULES = [
+    {"name": "Below 90% of target", "severity": "critical", "condition": "below",
+     "kpis": [kpi for kpi, target in TARGETS.items() if target > 0 and kpi not in RISK_LOWER_IS_BETTER],
+     "target_ratio": 0.9, "clear_ratio": 0.95, "hold": 300},
+    {"name": "Above 110% of target", "severity": "critical", "condition": "above",
+     "kpis": [kpi for kpi, target in TARGETS.items() if target > 0 and kpi in RISK_LOWER_IS_BETTER],
+     "target_ratio": 1.1, "clear_ratio": 1.05, "hold": 300},
+    {"name": "Security incident", "severity": "critical", "condition": "above",
+     "kpis": [kpi for kpi, target in TARGETS.items() if target == 0],
+     "threshold": 0, "clear": 0, "hold": 0},
+    {"name": "PM Risk rising fast", "severity": "warning", "condition": "rate_above",
+     "kpis": ["PM Risk"], "threshold": 40, "clear": 5, "hold": 0},
+    {"name": "OEE falling fast", "severity": "warning", "condition": "rate_below",
+     "kpis": ["OEE"], "threshold": -10, "clear": -2, "hold": 300},
+]
+ALERT_DIRECTIONS = {"below": -1, "above": 1, "rate_below": -1, "rate_above": 1}
+
+
+class AlertRuleEngine:
+    """Evaluates every alert rule against every sampled (line, KPI) pair at once.
+
+    Rules are compiled into (rule, KPI) threshold matrices, so one array pass
+    per sample checks all rules for all lines. An alert stays open, and is not
+    raised again, until its condition clears.
+    """
+
+    def __init__(self, n_lines, n_kpis, rules=ALERT_RULES, time_constant=RATE_TIME_CONSTANT,
+                 log_size=ALERT_LOG_SIZE):
+        n_rules = len(rules)
+        self.rules = rules
+        self.time_constant = time_constant
+        self.applies = np.zeros((n_rules, n_kpis), dtype=bool)
+        self.trigger = np.full((n_rules, n_kpis), np.nan)
+        self.clear = np.full((n_rules, n_kpis), np.nan)
+        for r, rule in enumerate(rules):
+            for kpi in rule["kpis"]:
+                k = KPI_INDEX[kpi]
+                self.applies[r, k] = True
+                if "target_ratio" in rule:
+                    self.trigger[r, k] = TARGETS[kpi] * rule["target_ratio"]
+                    self.clear[r, k] = TARGETS[kpi] * rule["clear_ratio"]
+                else:
+                    self.trigger[r, k] = rule["threshold"]
+                    self.clear[r, k] = rule["clear"]
+        self.direction = np.array([ALERT_DIRECTIONS[rule["condition"]] for rule in rules], dtype=float)
+        self.uses_rate = np.array([rule["condition"].startswith("rate") for rule in rules])
+        self.hold = np.array([rule["hold"] for rule in rules], dtype=float)
+
+        self.active = np.zeros((n_rules, n_lines, n_kpis), dtype=bool)
+        self.pending_since = np.full((n_rules, n_lines, n_kpis), np.nan)
+        self.rate = np.zeros((n_lines, n_kpis))
+        self.previous_value = np.full((n_lines, n_kpis), np.nan)
+        self.previous_ts = np.full((n_lines, n_kpis), np.nan)
+        self.open_alerts = {}
+        self.events = deque(maxlen=log_size)
+        self.version = 0
+
+    def update(self, li, ki, timestamps, values):
+        """Check one sample per (line, KPI) pair against every rule; returns newly opened alerts"""
+        dt = timestamps - self.previous_ts[li, ki]
+        moved = dt > 0
+        step = np.divide(values - self.previous_value[li, ki], dt, out=np.zeros_like(values), where=moved)
+        weight = np.where(moved, 1 - np.exp(-np.where(moved, dt, 0) / self.time_constant), 0)
+        self.rate[li, ki] += weight * (step * 3600 - self.rate[li, ki])
+        self.previous_value[li, ki] = values
+        self.previous_ts[li, ki] = timestamps
+
+        # (rule, sample) matrices; multiplying by the direction turns every check into "greater than"
+        measured = np.where(self.uses_rate[:, None], self.rate[li, ki], values) * self.direction[:, None]
+        breach = self.applies[:, ki] & (measured > self.trigger[:, ki] * self.direction[:, None])
+        cleared = measured <= self.clear[:, ki] * self.direction[:, None]
+
+        active = self.active[:, li, ki]
+        pending = np.where(breach, np.fmin(self.pending_since[:, li, ki], timestamps), np.nan)
+        opened = breach & ~active & (timestamps - pending >= self.hold[:, None])
+        resolved = active & cleared
+        self.active[:, li, ki] = (active | opened) & ~resolved
+        self.pending_since[:, li, ki] = pending
+
+        for r, j in zip(*np.nonzero(resolved)):
+            alert = self.open_alerts.pop((r, li[j], ki[j]))
+            alert["resolved"] = float(timestamps[j])
+            self.version += 1
+        new_alerts = []
+        for r, j in zip(*np.nonzero(opened)):
+            new_alerts.append(self._open(r, li[j], ki[j], timestamps[j], values[j]))
+        return new_alerts
+
+    def _open(self, r, l, k, timestamp, value):
+        rule = self.rules[r]
+        alert = {
+            "rule": rule["name"],
+            "severity": rule["severity"],
+            "line_id": LINE_IDS[l],
+            "kpi": KPI_NAMES[k],
+            "opened": float(timestamp),
+            "value": float(value),
+            "rate": float(self.rate[l, k]) if self.uses_rate[r] else None,
+            "threshold": float(self.trigger[r, k]),
+            "resolved": None
+        }
+        self.open_alerts[(r, l, k)] = alert
+        self.events.append(alert)
+        self.version += 1
+        return alert
+
+    def active_alerts(self, line_id=None):
+        """Open alerts (of one line, or plant-wide), newest first"""
+        found = [a for a in self.open_alerts.values() if line_id in (None, a["line_id"])]
+        return sorted(found, key=lambda alert: alert["opened"], reverse=True)
+
+    def recent(self, limit=20):
+        """Most recently opened alerts, open or resolved, newest first"""
+        return sorted(self.events, key=lambda alert: alert["opened"], reverse=True)[:limit]
+
+
+# ====================== RESOURCE UTILIZATION MODEL ======================
+RESOURCE_HISTORY_CAPACITY = 1024  # one-minute samples kept per line and resource
+TREND_WINDOW_HOURS = 4  # samples used for each trend fit
+SHIFT_HOURS = 8  # projection horizon (next shift)
+
+
+class ResourceTrendModel:
+    """Least-squares utilization trend for every (line, resource) pair.
+
+    Fits are refreshed only for lines that received new samples and cached,
+    so every reader sees the same projection until the next sample arrives.
+    """
+
+    def __init__(self, n_lines, n_resources, window_hours=TREND_WINDOW_HOURS, shift_hours=SHIFT_HOURS):
+        shape = (n_lines, n_resources)
+        self.window_hours = window_hours
+        self.shift_hours = shift_hours
+        self.history = KPIHistory(n_lines, n_resources, RESOURCE_HISTORY_CAPACITY)
+        self.current = np.zeros(shape)
+        self.projected = np.zeros(shape)
+        self.slope = np.zeros(shape)
+        self.last_ts = np.zeros(n_lines)
+        self.version = np.zeros(n_lines, dtype=np.int64)
+
+    def update(self, li, timestamps, utilization, refit=True):
+        """Append one utilization vector per line (lines must be unique)"""
+        n_resources = utilization.shape[1]
+        self.history.append(np.repeat(li, n_resources), np.tile(np.arange(n_resources), len(li)),
+                            np.repeat(timestamps, n_resources), utilization.ravel())
+        self.current[li] = utilization
+        self.last_ts[li] = timestamps
+        if refit:
+            self.fit(li)
+
+    def fit(self, li):
+        """Refit the trend of all resources of the given lines in one pass"""
+        stamps = self.history.timestamps[li]
+        values = self.history.values[li]
+        now = self.last_ts[li][:, None, None]
+        window = (stamps > now - self.window_hours * 3600) & ~np.isnan(values)
+
+        hours = np.where(window, (stamps - now) / 3600.0, 0.0)
+        values = np.where(window, values, 0.0)
+        n = window.sum(axis=-1)
+        sum_t, sum_y = hours.sum(axis=-1), values.sum(axis=-1)
+        sum_tt, sum_ty = (hours ** 2).sum(axis=-1), (hours * values).sum(axis=-1)
+
+        denom = n * sum_tt - sum_t ** 2
+        valid = denom > 1e-9
+        slope = np.where(valid, (n * sum_ty - sum_t * sum_y) / np.where(valid, denom, 1.0), 0.0)
+        # Intercept is the fitted utilization now, since time is measured from the last sample
+        fitted_now = np.where(n > 0, (sum_y - slope * sum_t) / np.maximum(n, 1), self.current[li])
+
+        # Average utilization over the next shift is the fitted value at its midpoint
+        self.slope[li] = slope
+        self.projected[li] = np.clip(fitted_now + slope * self.shift_hours / 2, 0, 110)
+        self.version[li] += 1
+
+
+# ====================== MONTE CARLO RISK ENGINE ======================
+MONTE_CARLO_PATHS = 10000
+RISK_PERCENTILES = (10, 50, 90)
+CRITICAL_RISK = 60  # failure risk (%) marked as critical on the forecast
+
+
+def simulate_kpi_paths(line_id, data, n_paths, horizon_hours, rng, start=None):
+    """Simulate hourly KPI trajectories with the virtual factory dynamics.
+
+    Vectorised counterpart of generate_kpi_value: returns {kpi: (n_paths,
+    horizon_hours + 1) array} starting from the current values in `data`.
+    Random walks are advanced by their aggregated hourly step and PM Risk
+    is stepped at its native rate so spikes can chain as in the simulator.
+    """
+    start = start or datetime.now()
+    baseline = LINE_BASELINES.get(line_id, LINE_BASELINES["line4"])
+    steps = horizon_hours + 1
+    hours = (start.hour + np.arange(1, steps)) % 24
+    paths = {kpi: np.empty((n_paths, steps)) for kpi in KPI_NAMES}
+    for kpi in KPI_NAMES:
+        paths[kpi][:, 0] = data[kpi]
+
+    def per_hour(kpi):
+        return 3600.0 / UPDATE_FREQUENCIES[kpi]
+
+    # Independent fluctuations around the line baseline
+    noise = rng.standard_normal((n_paths, steps - 1))
+    paths["OEE"][:, 1:] = np.clip(baseline["OEE"] + 0.8 * noise, 60, 95)
+    noise = rng.standard_normal((n_paths, steps - 1))
+    paths["CO2/km"][:, 1:] = np.clip(baseline["CO2/km"] + 1.5 * noise, 80, 150)
+    noise = rng.standard_normal((n_paths, steps - 1))
+    paths["Chg Utilization"][:, 1:] = np.clip(charging_baseline(hours) + 2 * noise, 65, 90)
+
+    # Bounded random walks
+    for kpi, sigma, low, high in (("SC Resilience", 0.02, 0.4, 0.95),
+                                  ("TVR", 0.005, 0.05, 0.3),
+                                  ("Batt Efficiency", 0.3, 85, 98)):
+        walk = rng.standard_normal((n_paths, steps - 1)) * sigma * np.sqrt(per_hour(kpi))
+        value = paths[kpi][:, 0]
+        for h in range(1, steps):
+            value = np.clip(value + walk[:, h - 1], low, high)
+            paths[kpi][:, h] = value
+
+    # PM Risk: 5% chance per reading of a spike on top of the current value
+    value = paths["PM Risk"][:, 0].copy()
+    readings = int(per_hour("PM Risk"))
+    for h in range(1, steps):
+        for _ in range(readings):
+            spike = rng.random(n_paths) < 0.05
+            value = np.where(spike,
+                             np.minimum(95, value + rng.uniform(5, 15, n_paths)),
+                             np.clip(baseline["PM Risk"] + 2 * rng.standard_normal(n_paths), 10, 95))
+        paths["PM Risk"][:, h] = value
+
+    # Security: 1% chance per reading of one or two incidents
+    incident = rng.random((n_paths, steps - 1)) < 0.01
+    paths["Security"][:, 1:] = np.where(incident, rng.integers(1, 3, (n_paths, steps - 1)), 0)
+    return paths
+
+
+class MonteCarloRiskEngine:
+    """Failure-risk percentiles per line from simulated KPI trajectories.
+
+    Projections run on a worker thread and are cached per (line, snapshot
+    version); submitting a newer snapshot for a line replaces any pending
+    one, so the engine never falls behind the sampler.
+    """
+
+    def __init__(self, n_paths=MONTE_CARLO_PATHS, horizon_hours=FORECAST_HORIZON_HOURS,
+                 percentiles=RISK_PERCENTILES):
+        self.n_paths = n_paths
+        self.horizon_hours = horizon_hours
+        self.percentiles = percentiles
+        self._results = {}
+        self._pending = {}
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._rng = np.random.default_rng()
+
+    def reset_after_fork(self):
+        """Fresh worker thread, lock and random stream in a forked process"""
+        self._pending = {}
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._rng = np.random.default_rng()
+
+    def submit(self, line_id, data, version):
+        """Queue a projection unless this version is already cached"""
+        with self._wakeup:
+            cached = self._results.get(line_id)
+            if cached is not None and cached["version"] == version:
+                return
+            self._pending[line_id] = (version, data)
+            self._wakeup.notify()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="monte-carlo-risk", daemon=True)
+                self._thread.start()
+
+    def result(self, line_id):
+        """Latest projection of a line, or None before the first one completes"""
+        return self._results.get(line_id)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._pending:
+                    self._wakeup.wait()
+                line_id, (version, data) = self._pending.popitem()
+            try:
+                result = self.project(line_id, data)
+                result["version"] = version
+                self._results[line_id] = result
+            except Exception as e:
+                print(f"Error projecting failure risk: {str(e)}")
+
+    def project(self, line_id, data):
+        """Simulate the next hours and summarise failure risk per hour"""
+        paths = simulate_kpi_paths(line_id, data, self.n_paths, self.horizon_hours, self._rng)
+        risk = calculate_failure_probability(paths)
+        quantiles = np.percentile(risk, self.percentiles, axis=0)
+        return {
+            "hours": list(range(self.horizon_hours + 1)),
+            "percentiles": {p: quantiles[i] for i, p in enumerate(self.percentiles)},
+            "mean": risk.mean(axis=0),
+            "critical_share": (risk > CRITICAL_RISK).mean(axis=0)
+        }
+
+
+# ====================== DERIVED METRIC GRAPH ======================
+def same_value(a, b):
+    """Equality check that treats incomparable values (e.g. arrays) as changed"""
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+class DerivedMetricGraph:
+    """Derived metrics of one line, recomputed only when their inputs change.
+
+    Each node names the KPIs and nodes it reads. After a sample, nodes are
+    visited in registration (dependency) order and only those with a changed
+    input are recomputed; a node whose result is unchanged stops propagation.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.values = {}
+        self.versions = {}
+        self.recomputed = Counter()
+
+    def add(self, name, depends_on, compute):
+        """Register a node; nodes it depends on must already be registered"""
+        self.nodes[name] = (tuple(depends_on), compute)
+
+    def update(self, data, changed_kpis):
+        """Propagate changed KPIs through the graph and return the changed nodes"""
+        dirty = set(changed_kpis)
+        changed = set()
+        for name, (depends_on, compute) in self.nodes.items():
+            if name in self.values and dirty.isdisjoint(depends_on):
+                continue
+            value = compute(data, {dep: self.values[dep] for dep in depends_on if dep in self.nodes})
+            self.recomputed[name] += 1
+            if name in self.values and same_value(value, self.values[name]):
+                continue
+            self.values[name] = value
+            self.versions[name] = self.versions.get(name, 0) + 1
+            dirty.add(name)
+            changed.add(name)
+        return changed
+
+
+def build_line_metrics(line_id):
+    """Dependency graph of the derived metrics shown for a production line"""
+    graph = DerivedMetricGraph()
+
+    for kpi in KPI_NAMES:
+        graph.add(f"status:{kpi}", [kpi],
+                  lambda data, _, kpi=kpi: (kpi, get_kpi_status(data[kpi], TARGETS[kpi])[0], f"{data[kpi]:.1f}"))
+        graph.add(f"kpi_risk:{kpi}", [kpi],
+                  lambda data, _, kpi=kpi: kpi_risk_contribution(kpi, data[kpi]))
+
+    graph.add("insights_key", [f"status:{kpi}" for kpi in KPI_NAMES],
+              lambda _, inputs: tuple(inputs[f"status:{kpi}"] for kpi in KPI_NAMES))
+    graph.add("failure_probability", list(FAILURE_WEIGHTS),
+              lambda data, _: calculate_failure_probability(data))
+
+    components = COMPONENT_FAILURE_PROBABILITIES[line_id]
+    for component, base_prob in components.items():
+        influences = [f"kpi_risk:{kpi}" for kpi in COMPONENT_KPI_MATRIX.get(component, {})]
+        graph.add(f"component_risk:{component}", influences,
+                  lambda _, inputs, component=component, base_prob=base_prob: component_risk(
+                      component, base_prob,
+                      {name.split(":", 1)[1]: value for name, value in inputs.items()}))
+
+    graph.add("component_failures", [f"component_risk:{c}" for c in components],
+              lambda _, inputs: rank_component_failures(
+                  {name.split(":", 1)[1]: value for name, value in inputs.items()}))
+    graph.add("maintenance_plan", ["component_failures", "OEE"],
+              lambda data, inputs: calculate_optimal_maintenance(data, inputs["component_failures"], line_id))
+    return graph
+
+
+# ====================== KPI SAMPLER ======================
+class KPISampler:
+    """Background poller that reads every line on the KPI schedule.
+
+    The sampler is the single writer of KPI values: it appends each new sample
+    to the history and advances the analytics engines once, and callbacks only
+    read the resulting snapshots, whatever the number of viewers.
+    """
+
+    def __init__(self, mode='virtual', tick=1.0):
+        self.mode = mode
+        self.tick = tick
+        n_lines, n_kpis = len(LINE_IDS), len(KPI_NAMES)
+        self.values = np.array([[generate_initial_data(line_id)[kpi] for kpi in KPI_NAMES]
+                                for line_id in LINE_IDS], dtype=float)
+        self.last_updated = np.zeros((n_lines, n_kpis))
+        self.history = KPIHistory(n_lines, n_kpis)
+        self.rollups = KPIRollups(n_lines, n_kpis)
+        self.forecaster = HoltWintersForecaster(n_lines, n_kpis)
+        self.detector = StreamingAnomalyDetector(n_lines, n_kpis)
+        self.alerts = AlertRuleEngine(n_lines, n_kpis)
+        self.resource_model = ResourceTrendModel(n_lines, len(RESOURCES))
+        self.resources_polled = np.zeros(n_lines)
+        self.risk_engine = MonteCarloRiskEngine()
+        self.line_versions = np.zeros(n_lines, dtype=np.int64)
+        self.kpi_versions = np.zeros((n_lines, n_kpis), dtype=np.int64)
+        self.derived = {line_id: build_line_metrics(line_id) for line_id in LINE_IDS}
+        self._dirty = np.zeros((n_lines, n_kpis), dtype=bool)
+        self._warming_up = False
+        self.version = 0
+        # Versions are per process, so ETags built from them carry this token too
+        self.token = os.urandom(4).hex()
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the sampling thread once per process"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="kpi-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def reset_after_fork(self):
+        """Forget the parent's thread and locks so a forked worker can start its own"""
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.token = os.urandom(4).hex()
+        self.risk_engine.reset_after_fork()
+
+    def _run(self):
+        self._warming_up = True
+        try:
+            self.warm_up()
+        except Exception as e:
+            print(f"Error loading KPI history: {str(e)}")
+        self._warming_up = False
+        with self._lock:
+            for line_id in LINE_IDS:
+                self.derived[line_id].update(self.snapshot(line_id), KPI_NAMES)
+        self.submit_risk(range(len(LINE_IDS)))
+        while not self._stop.is_set():
+            try:
+                self.sample_once()
+            except Exception as e:
+                print(f"Error sampling KPIs: {str(e)}")
+            self._stop.wait(self.tick)
+
+    def load_recorded_rollups(self):
+        """Seed the rollup tiers from recorded history kept on disk"""
+        for line_id in LINE_IDS:
+            for kpi in KPI_NAMES:
+                recording = open_recording(recording_path(RECORDINGS_DIR, line_id, KPI_SLUGS[kpi]), RECORD_DTYPE)
+                if not len(recording):
+                    continue
+                stamps = recording["ts"]
+                for name, width, capacity in self.rollups.tiers:
+                    # Only the part of the recording within the tier's retention is read
+                    first = bisect_left(stamps, stamps[-1] - capacity * width)
+                    chunks = ((np.array(recording[i:i + EXPORT_CHUNK_ROWS]["ts"]),
+                               np.array(recording[i:i + EXPORT_CHUNK_ROWS]["value"]))
+                              for i in range(first, len(recording), EXPORT_CHUNK_ROWS))
+                    buckets = list(aggregate_chunks(chunks, width))
+                    with self._lock:
+                        self.rollups.load(LINE_INDEX[line_id], KPI_INDEX[kpi], name,
+                                          *[np.concatenate(part) for part in zip(*buckets)])
+
+    def warm_up(self, hours=WARMUP_HOURS):
+        """Replay each adapter's recent history through the analytics engines"""
+        if self.mode != 'replay':
+            # A replay feeds its recording through ingest() instead
+            self.load_recorded_rollups()
+        li, ki, series = [], [], []
+        for line_id in LINE_IDS:
+            backfill = get_adapter(line_id, self.mode).backfill(hours)
+            for kpi, (stamps, values) in backfill.items():
+                if len(stamps):
+                    li.append(LINE_INDEX[line_id])
+                    ki.append(KPI_INDEX[kpi])
+                    series.append((stamps, values))
+        if not series:
+            return
+
+        self.ingest_series(np.array(li), np.array(ki), series)
+        self.warm_up_resources()
+
+    def warm_up_resources(self, hours=TREND_WINDOW_HOURS):
+        """Load recent resource utilization so the first projection has a trend"""
+        lines, series = [], []
+        for line_id in LINE_IDS:
+            backfill = get_adapter(line_id, self.mode).backfill_resources(hours)
+            if backfill is not None and len(backfill[0]):
+                lines.append(LINE_INDEX[line_id])
+                series.append(backfill)
+        if not series:
+            return
+
+        lines = np.array(lines)
+        lengths = np.array([len(stamps) for stamps, _ in series])
+        with self._lock:
+            model = self.resource_model
+            for step in range(lengths.max()):
+                active = np.flatnonzero(lengths > step)
+                model.update(lines[active], np.array([series[i][0][step] for i in active]),
+                             np.array([series[i][1][step] for i in active]), refit=False)
+            model.fit(lines)
+            self.resources_polled[lines] = model.last_ts[lines]
+
+    def sample_once(self, now=None):
+        """Read every KPI that is due according to UPDATE_FREQUENCIES"""
+        now = now or datetime.now().timestamp()
+        self.sample_resources(now)
+        clocks = np.array([self.line_clock(line_id, now)[0] for line_id in LINE_IDS])
+        with self._lock:
+            li, ki = np.nonzero(clocks[:, None] - self.last_updated >= UPDATE_PERIODS)
+        if not len(li):
+            return
+
+        series = []
+        for l, k in zip(li, ki):
+            adapter = get_adapter(LINE_IDS[l], self.mode)
+            try:
+                series.append(adapter.poll_kpi(KPI_NAMES[k]))
+            except Exception as e:
+                print(f"Error updating {KPI_NAMES[k]}: {str(e)}")
+                # Keep the current value but move the timestamp to avoid repeated errors
+                series.append((np.array([clocks[l]]), np.array([self.values[l, k]])))
+        self.ingest_series(li, ki, series)
+
+    def sample_resources(self, now):
+        """Read resource utilization of every line that is due"""
+        due = np.flatnonzero(now - self.resources_polled >= RESOURCE_UPDATE_FREQUENCY)
+        lines, stamps, rows = [], [], []
+        for l in due:
+            self.resources_polled[l] = now
+            try:
+                reading = get_adapter(LINE_IDS[l], self.mode).poll_resources()
+            except Exception as e:
+                print(f"Error reading resources: {str(e)}")
+                continue
+            if reading is not None:
+                lines.append(l)
+                rows.append(reading[0])
+                stamps.append(reading[1])
+        if lines:
+            with self._lock:
+                self.resource_model.update(np.array(lines), np.array(stamps, dtype=float),
+                                           np.array(rows, dtype=float))
+
+    def ingest_series(self, li, ki, series):
+        """Apply (timestamps, values) arrays per (line, KPI) pair in time order"""
+        keep = [i for i, (stamps, _) in enumerate(series) if len(stamps)]
+        if not keep:
+            return
+        li, ki = li[keep], ki[keep]
+        series = [series[i] for i in keep]
+        lengths = np.array([len(stamps) for stamps, _ in series])
+        stamps = np.full((len(series), lengths.max()), np.nan)
+        values = np.full_like(stamps, np.nan)
+        for i, (ts, vals) in enumerate(series):
+            stamps[i, :len(ts)] = ts
+            values[i, :len(vals)] = vals
+
+        # Derived metrics and risk are refreshed once, after the last sample
+        last = lengths.max() - 1
+        for step in range(lengths.max()):
+            active = lengths > step
+            self.ingest(li[active], ki[active], stamps[active, step], values[active, step],
+                        publish=step == last)
+
+    def ingest(self, li, ki, stamps, values, publish=True):
+        """Apply one sample per (line, KPI) pair to the snapshot and engines"""
+        with self._lock:
+            # Versions only move when the value does, so unchanged KPIs keep their subscribers idle
+            changed = values != self.values[li, ki]
+            self.kpi_versions[li[changed], ki[changed]] += 1
+            self.values[li, ki] = values
+            self.last_updated[li, ki] = stamps
+            self.history.append(li, ki, stamps, values)
+            self.rollups.append(li, ki, stamps, values)
+            residuals = self.forecaster.update(li, ki, stamps, values)
+            self.detector.update(li, ki, stamps, values, residuals)
+            opened = self.alerts.update(li, ki, stamps, values)
+            self.version += 1
+            self.line_versions[np.unique(li)] += 1
+            if self._warming_up:
+                return
+            for alert in opened:
+                logging.getLogger(__name__).warning(
+                    "Alert [%s] %s: %s - %s (%.2f)", alert['severity'], PRODUCTION_LINES[alert['line_id']]['name'],
+                    alert['kpi'], alert['rule'], alert['value'])
+            self._dirty[li[changed], ki[changed]] = True
+            if not publish:
+                return
+            # Only metrics that read a changed KPI are recomputed
+            dirty_lines, dirty_kpis = np.nonzero(self._dirty)
+            self._dirty[:] = False
+            for l in np.unique(dirty_lines):
+                line_id = LINE_IDS[l]
+                kpis = [KPI_NAMES[k] for k in dirty_kpis[dirty_lines == l]]
+                self.derived[line_id].update(self.snapshot(line_id), kpis)
+        risk_kpis = [KPI_INDEX[kpi] for kpi in FAILURE_WEIGHTS]
+        self.submit_risk(np.unique(dirty_lines[np.isin(dirty_kpis, risk_kpis)]))
+
+    def submit_risk(self, lines):
+        """Queue Monte Carlo risk projections for lines whose risk inputs changed"""
+        for l in lines:
+            line_id = LINE_IDS[l]
+            self.risk_engine.submit(line_id, self.snapshot(line_id), int(self.line_versions[l]))
+
+    def snapshot(self, line_id):
+        """Current KPI values of a line in the `kpi-data` store format"""
+        li = LINE_INDEX[line_id]
+        with self._lock:
+            data = {kpi: float(self.values[li, ki]) for kpi, ki in KPI_INDEX.items()}
+            data["last_updated"] = {kpi: float(self.last_updated[li, ki]) for kpi, ki in KPI_INDEX.items()}
+        return data
+
+    def line_clock(self, line_id, now=None):
+        """(current time, speed) of a line's data source
+
+        KPI timestamps are in the source's time: a replay's position in the
+        recording, which advances `speed` times faster than the wall clock.
+        """
+        now = now or datetime.now().timestamp()
+        adapter = get_adapter(line_id, self.mode)
+        if self.mode == 'replay' and adapter.connected:
+            return adapter.clock(), adapter.speed
+        return now, 1.0
+
+    def next_due(self, line_id, now=None, kpis=None):
+        """Seconds until the next KPI of a line (or of `kpis`) is due to be sampled"""
+        clock, speed = self.line_clock(line_id, now)
+        columns = [KPI_INDEX[kpi] for kpi in kpis] if kpis else slice(None)
+        with self._lock:
+            due = self.last_updated[LINE_INDEX[line_id], columns] + UPDATE_PERIODS[columns]
+        return max(0.0, float(due.min() - clock) / speed)
+
+    def state(self, line_id):
+        """Snapshot of a line together with its change counters"""
+        li = LINE_INDEX[line_id]
+        with self._lock:
+            versions = {
+                "kpis": {kpi: int(self.kpi_versions[li, ki]) for kpi, ki in KPI_INDEX.items()},
+                "samples": int(self.line_versions[li]),
+                "anomalies": int(self.detector.line_event_count[li]),
+                "alerts": int(self.alerts.version)
+            }
+            return self.snapshot(line_id), versions
+
+    def metrics_state(self, line_id, names):
+        """Snapshot of a line with some derived metrics, their versions and the sample version, read at once"""
+        with self._lock:
+            derived = self.derived[line_id]
+            return (self.snapshot(line_id), {name: derived.values.get(name) for name in names},
+                    {name: derived.versions.get(name, 0) for name in names},
+                    int(self.line_versions[LINE_INDEX[line_id]]))
+
+    def line_version(self, line_id):
+        """Sample version of a line with the versions of all its derived metrics"""
+        with self._lock:
+            return (int(self.line_versions[LINE_INDEX[line_id]]),
+                    sorted(self.derived[line_id].versions.items()))
+
+    def metric_version(self, line_id, name):
+        """Change counter of a derived metric of a line"""
+        with self._lock:
+            return self.derived[line_id].versions.get(name, 0)
+
+    def metric(self, line_id, name):
+        """Cached derived metric of a line (None until first computed); treat as read-only"""
+        with self._lock:
+            return self.derived[line_id].values.get(name)
+
+    def alert_log(self, limit=20):
+        """Open alerts across the plant and the most recent alerts, newest first"""
+        with self._lock:
+            return self.alerts.active_alerts(), self.alerts.recent(limit)
+
+    def anomalies(self, line_id, limit=10):
+        """Most recent anomaly events of a line, newest first"""
+        with self._lock:
+            return self.detector.recent(line_id, limit)
+
+    def resources(self, line_id):
+        """Current and next-shift resource utilization of a line"""
+        li = LINE_INDEX[line_id]
+        model = self.resource_model
+        with self._lock:
+            return {
+                "current": model.current[li].tolist(),
+                "projected": model.projected[li].tolist(),
+                "slope": model.slope[li].tolist(),
+                "version": int(model.version[li])
+            }
+
+    def failure_risk(self, line_id):
+        """Cached Monte Carlo failure-risk projection of a line (None until ready)"""
+        return self.risk_engine.result(line_id)
+
+    def rollup(self, line_id, kpi, start, end, resolution):
+        """Bucketed history of one line and KPI from the coarsest adequate rollup tier"""
+        with self._lock:
+            return self.rollups.query(LINE_INDEX[line_id], KPI_INDEX[kpi], start, end, resolution)
+
+    def recent_series(self, line_id, kpi):
+        """Copy of the in-memory samples of one line and KPI, oldest first"""
+        with self._lock:
+            return self.history.series(LINE_INDEX[line_id], KPI_INDEX[kpi])
+
+    def forecast(self, line_id):
+        """24 h forecasts of a line as {kpi: {"mean", "lower", "upper"}}, one point per hour"""
+        li = LINE_INDEX[line_id]
+        with self._lock:
+            return {
+                kpi: {
+                    "mean": self.forecaster.mean[li, ki].copy(),
+                    "lower": self.forecaster.lower[li, ki].copy(),
+                    "upper": self.forecaster.upper[li, ki].copy()
+                }
+                for kpi, ki in KPI_INDEX.items()
+            }
+
+
+SAMPLER = KPISampler(mode=os.environ.get('KPI_SOURCE', 'virtual'))
+
+
+@server.before_request
+def start_sampler():
+    # Started lazily so each worker process runs its own sampling thread
+    SAMPLER.start()
+
+
+def reset_after_fork():
+    """Per-process state for workers forked from a preloaded app (gunicorn --preload)
+
+    Threads do not survive fork and locks can be copied while held, so each
+    worker drops them, along with adapter connections and the asset fleet.
+    """
+    global FLEET, FLEET_LOCK
+    SAMPLER.reset_after_fork()
+    ANALYTICS_RUNNER.reset_after_fork()
+    ADAPTER_INSTANCES.clear()
+    FLEET = None
+    FLEET_HISTORY.clear()
+    FLEET_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):  # not available on Windows
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+# ====================== HISTORY EXPORT ======================
+EXPORT_CHUNK_ROWS = 100000  # samples converted and sent at a time
+EXPORT_RESOLUTIONS = {"raw": None, "1min": 60, "1h": 3600, "1d": 86400}
+EXPORT_COLUMNS = {
+    "raw": ["timestamp", "line_id", "kpi", "value"],
+    "aggregated": ["timestamp", "line_id", "kpi", "mean", "min", "max", "count"]
+}
+
+
+def history_chunks(line_id, kpi, start, end, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield (timestamps, values) of one line and KPI within [start, end), oldest first
+
+    Recorded history is read from the memory-mapped recording; samples the
+    sampler took after the end of the recording follow from memory.
+    """
+    recording = open_recording(recording_path(RECORDINGS_DIR, line_id, KPI_SLUGS[kpi]), RECORD_DTYPE)
+    stamps = recording["ts"]
+    first = bisect_left(stamps, start)
+    last = bisect_left(stamps, end, first)
+    for i in range(first, last, chunk_rows):
+        chunk = np.array(recording[i:min(i + chunk_rows, last)])
+        yield chunk["ts"], chunk["value"]
+
+    recorded_until = stamps[-1] if len(stamps) else -np.inf
+    ts, values = SAMPLER.recent_series(line_id, kpi)
+    keep = (ts > recorded_until) & (ts >= start) & (ts < end)
+    if keep.any():
+        yield ts[keep], values[keep]
+
+
+def aggregate_chunks(chunks, width):
+    """Reduce time-ordered chunks to (bucket start, mean, min, max, count) per bucket
+
+    The last bucket of a chunk may continue in the next one, so its samples
+    are carried over until the bucket is complete.
+    """
+    carry_ts, carry_values = np.empty(0), np.empty(0)
+    for ts, values in chunks:
+        ts, values = np.r_[carry_ts, ts], np.r_[carry_values, values]
+        buckets = np.floor(ts / width) * width
+        starts = np.flatnonzero(np.r_[True, np.diff(buckets) != 0])
+        cut = starts[-1]
+        carry_ts, carry_values = ts[cut:], values[cut:]
+        if cut:
+            yield bucket_stats(buckets[:cut], values[:cut], starts[:-1])
+    if len(carry_ts):
+        yield bucket_stats(np.floor(carry_ts / width) * width, carry_values, np.array([0]))
+
+
+def bucket_stats(buckets, values, starts):
+    counts = np.diff(np.r_[starts, len(values)])
+    return (buckets[starts], np.add.reduceat(values, starts) / counts,
+            np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts), counts)
+
+
+def export_frames(line_ids, kpis, start, end, resolution):
+    """Yield DataFrames of the selected history, one chunk at a time"""
+    import pandas as pd
+    width = EXPORT_RESOLUTIONS[resolution]
+    for line_id in line_ids:
+        for kpi in kpis:
+            chunks = history_chunks(line_id, kpi, start, end)
+            if width is None:
+                for ts, values in chunks:
+                    yield pd.DataFrame({
+                        "timestamp": pd.to_datetime(ts, unit="s", utc=True),
+                        "line_id": line_id, "kpi": kpi, "value": values
+                    })
+                continue
+            for ts, mean, low, high, count in aggregate_chunks(chunks, width):
+                yield pd.DataFrame({
+                    "timestamp": pd.to_datetime(ts, unit="s", utc=True),
+                    "line_id": line_id, "kpi": kpi,
+                    "mean": mean, "min": low, "max": high, "count": count
+                })
+
+
+def stream_csv(frames, columns):
+    yield ",".join(columns) + "\n"
+    for frame in frames:
+        yield frame.to_csv(header=False, index=False)
+
+
+class StreamSink(io.RawIOBase):
+    """Write-only file that hands its bytes back in pieces as they are written"""
+
+    def __init__(self):
+        super().__init__()
+        self.pending = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.pending)
+        self.pending.clear()
+        return data
+
+
+def stream_parquet(frames, columns):
+    pa, pq = load_pyarrow()
+    # Sampled timestamps carry sub-microsecond parts, so they keep pandas' nanoseconds
+    fields = [("timestamp", pa.timestamp("ns", tz="UTC")), ("line_id", pa.string()), ("kpi", pa.string())]
+    fields += [(name, pa.int64() if name == "count" else pa.float64()) for name in columns[3:]]
+    schema = pa.schema(fields)
+    sink = StreamSink()
+    # Every chunk becomes one row group that is sent as soon as it is encoded
+    with pq.ParquetWriter(sink, schema) as writer:
+        for frame in frames:
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def parse_export_time(text, default):
+    """Epoch seconds of a start/end parameter; raises ValueError unless it is a finite time"""
+    if not text:
+        return default
+    try:
+        value = float(text)
+    except ValueError:
+        value = float(epoch_seconds([text])[0])
+    if not np.isfinite(value):
+        raise ValueError(f"Invalid time: {text}")
+    return value
+
+
+@server.route("/api/export")
+def export_history():
+    """Stream KPI history as CSV or Parquet without buffering the result"""
+    args = flask.request.args
+    line_ids = args.get("lines", ",".join(LINE_IDS)).split(",")
+    kpis = args.get("kpis", ",".join(KPI_NAMES)).split(",")
+    resolution = args.get("resolution", "raw")
+    fmt = args.get("format", "csv")
+    try:
+        start = parse_export_time(args.get("start"), -np.inf)
+        end = parse_export_time(args.get("end"), np.inf)
+    except (ValueError, TypeError):
+        return flask.jsonify({"error": "start and end must be epoch seconds or dates"}), 400
+
+    unknown = [v for v in line_ids if v not in PRODUCTION_LINES] + [v for v in kpis if v not in TARGETS]
+    if unknown:
+        return flask.jsonify({"error": f"Unknown lines or KPIs: {', '.join(unknown)}"}), 400
+    if resolution not in EXPORT_RESOLUTIONS:
+        return flask.jsonify({"error": f"resolution must be one of {', '.join(EXPORT_RESOLUTIONS)}"}), 400
+    if fmt not in ("csv", "parquet"):
+        return flask.jsonify({"error": "format must be csv or parquet"}), 400
+    if fmt == "parquet" and load_pyarrow()[1] is None:
+        return flask.jsonify({"error": "Parquet export requires pyarrow"}), 501
+
+    columns = EXPORT_COLUMNS["raw" if resolution == "raw" else "aggregated"]
+    frames = export_frames(line_ids, kpis, start, end, resolution)
+    stream = stream_csv(frames, columns) if fmt == "csv" else stream_parquet(frames, columns)
+    try:
+        # The first chunk is encoded before the status goes out, so a failing export still gets an error
+        first = next(stream)
+    except Exception as e:
+        print(f"Error exporting history: {str(e)}")
+        return flask.jsonify({"error": f"Export failed: {str(e)}"}), 500
+    return flask.Response(
+        itertools.chain([first], stream),
+        mimetype="text/csv" if fmt == "csv" else "application/vnd.apache.parquet",
+        headers={"Content-Disposition": f"attachment; filename=kpi-history-{resolution}.{fmt}"}
+    )
+
+
+# ====================== BATCH ANALYTICS ======================
+ANALYTICS_WORKERS = int(os.environ.get("ANALYTICS_WORKERS", os.cpu_count() or 1))
+PARALLEL_MIN_LINES = 64  # below this, handing lines to worker processes costs more than it saves
+ANALYTICS_INPUTS = ("values", "base", "influence", "influenced", "crews", "output")
+
+
+def kpi_risk_contributions(values):
+    """kpi_risk_contribution of a (lines, KPIs) array at once; missing (NaN) KPIs add no risk"""
+    targets = np.array([TARGETS[kpi] for kpi in KPI_NAMES])
+    lower_is_better = np.isin(KPI_NAMES, RISK_LOWER_IS_BETTER)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = values / targets
+    contributions = np.where(lower_is_better, np.where(ratio > 1, ratio * 50, 0),
+                             np.where(ratio < 1, 50 * (1 - ratio), 0))
+    return np.nan_to_num(np.where(targets == 0, values * 10, contributions))
+
+
+def component_tables(profiles):
+    """Component names, base probabilities and KPI influences of each line's profile
+
+    Arrays are (lines, components[, KPIs]) padded with NaN to the longest line;
+    `influenced` is False for components without KPI influences.
+    """
+    names = [list(COMPONENT_FAILURE_PROBABILITIES[profile]) for profile in profiles]
+    width = max(len(components) for components in names)
+    base = np.full((len(profiles), width), np.nan)
+    influence = np.zeros((len(profiles), width, len(KPI_NAMES)))
+    for l, (profile, components) in enumerate(zip(profiles, names)):
+        for c, component in enumerate(components):
+            base[l, c] = COMPONENT_FAILURE_PROBABILITIES[profile][component]
+            for kpi, weight in COMPONENT_KPI_MATRIX.get(component, {}).items():
+                influence[l, c, KPI_INDEX[kpi]] = weight
+    influenced = np.array([[bool(COMPONENT_KPI_MATRIX.get(component)) for component in components]
+                           + [False] * (width - len(components)) for components in names])
+    return names, base, influence, influenced
+
+
+def analytics_block(values, base, influence, influenced, crews, output, start, horizon_days):
+    """Failure probability, ranked component risks and maintenance days of a block of lines
+
+    Vectorised equivalent of calculate_failure_probability,
+    predict_component_failures and plan_maintenance for every line in the block.
+    """
+    probability = calculate_failure_probability({kpi: values[:, i] for i, kpi in enumerate(KPI_NAMES)})
+    modifier = np.einsum("lck,lk->lc", influence, kpi_risk_contributions(values))
+    risk = np.where(influenced, np.clip(base * 100 * (1 + modifier / 100), 5, 99.9), base * 100)
+    order = np.argsort(-risk, axis=1, kind="stable")  # padding (NaN) sorts last
+    risk = np.take_along_axis(risk, order, axis=1)
+    hours = np.trunc(np.maximum(1, (100 - risk) * 1.2))
+    schedule, cost, condition = optimize_maintenance_windows(
+        risk, hours, values[:, KPI_INDEX["OEE"]], crews, output, horizon_days, start)
+    day = np.maximum(schedule, 0)[..., None]
+    scheduled = schedule >= 0
+    return {
+        "probability": probability,
+        "order": order,
+        "risk": risk,
+        "hours": hours,
+        "day": schedule,
+        "condition": np.where(scheduled, np.take_along_axis(condition, day, axis=2)[..., 0], np.nan),
+        "cost": np.where(scheduled, np.take_along_axis(cost, day, axis=2)[..., 0], np.nan)
+    }
+
+
+class SharedArrays:
+    """Named NumPy arrays laid out in one shared-memory block
+
+    Created by the parent (name=None) and attached by worker processes by
+    name, so inputs and results are never pickled.
+    """
+
+    def __init__(self, specs, name=None):
+        from multiprocessing import shared_memory
+        self.specs = specs
+        sizes = [int(np.prod(shape)) * np.dtype(dtype).itemsize for _, shape, dtype in specs]
+        offsets = np.r_[0, np.cumsum(sizes)[:-1]].astype(int)
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=max(sum(sizes), 1))
+        self.arrays = {key: np.ndarray(shape, dtype, buffer=self.memory.buf, offset=offset)
+                       for (key, shape, dtype), offset in zip(specs, offsets)}
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def close(self, unlink=False):
+        self.arrays = {}  # views must go before the buffer is released
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def analytics_worker(input_specs, input_name, output_specs, output_name, lo, hi, start, horizon_days):
+    """Process-pool task: compute lines [lo, hi) from shared inputs into shared outputs"""
+    inputs = SharedArrays(input_specs, input_name)
+    outputs = SharedArrays(output_specs, output_name)
+    try:
+        block = analytics_block(*(inputs.arrays[key][lo:hi] for key in ANALYTICS_INPUTS), start, horizon_days)
+        for key, value in block.items():
+            outputs.arrays[key][lo:hi] = value
+    finally:
+        inputs.close()
+        outputs.close()
+
+
+class LineAnalyticsRunner:
+    """Failure risk and maintenance plans of many lines, partitioned across a process pool.
+
+    Lines are split into one contiguous block per worker; inputs and results
+    travel through shared memory. Small batches run in the calling thread.
+    Per-line results are kept in `cache` keyed by the line's KPI values and
+    the planning date, since maintenance windows carry calendar dates.
+    """
+
+    def __init__(self, workers=ANALYTICS_WORKERS, min_parallel_lines=PARALLEL_MIN_LINES):
+        self.workers = workers
+        self.min_parallel_lines = min_parallel_lines
+        self.cache = {}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def reset_after_fork(self):
+        # The parent's pool processes belong to the parent
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # Pool processes come from a fresh forkserver (spawn where there is none), never
+        # from this multi-threaded process, whose held locks fork would copy; the server
+        # imports this module once, which does not start the sampler
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with self._lock:
+            if self._pool is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                context = multiprocessing.get_context(method)
+                if method == "forkserver":
+                    context.set_forkserver_preload([__name__])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    def run(self, values, profiles, horizon_days=MAINTENANCE_HORIZON_DAYS, start=None):
+        """Analytics arrays for a (lines, KPIs) value array; `profiles` names each line's components"""
+        start = start or datetime.now()
+        names, base, influence, influenced = component_tables(profiles)
+        inputs = {
+            "values": np.asarray(values, dtype=float),
+            "base": base,
+            "influence": influence,
+            "influenced": influenced,
+            "crews": np.array([MAINTENANCE_CREWS.get(profile, 1) for profile in profiles]),
+            "output": np.array([PRODUCTION_LINES[profile]["avg_output"] for profile in profiles], dtype=float)
+        }
+        n_lines, width = base.shape
+        if self.workers <= 1 or n_lines < self.min_parallel_lines:
+            return names, analytics_block(*(inputs[key] for key in ANALYTICS_INPUTS), start, horizon_days)
+
+        input_specs = [(key, inputs[key].shape, inputs[key].dtype.str) for key in ANALYTICS_INPUTS]
+        output_specs = [("probability", (n_lines,), "<f8"), ("order", (n_lines, width), "<i8"),
+                        ("risk", (n_lines, width), "<f8"), ("hours", (n_lines, width), "<f8"),
+                        ("day", (n_lines, width), "<i8"), ("condition", (n_lines, width), "<f8"),
+                        ("cost", (n_lines, width), "<f8")]
+        shared_inputs = SharedArrays(input_specs)
+        shared_outputs = SharedArrays(output_specs)
+        try:
+            for key in ANALYTICS_INPUTS:
+                shared_inputs.arrays[key][...] = inputs[key]
+            bounds = np.linspace(0, n_lines, min(self.workers, n_lines) + 1).astype(int)
+            tasks = [self._executor().submit(analytics_worker, input_specs, shared_inputs.name,
+                                             output_specs, shared_outputs.name, int(lo), int(hi),
+                                             start, horizon_days)
+                     for lo, hi in zip(bounds[:-1], bounds[1:])]
+            for task in tasks:
+                task.result()
+            return names, {key: array.copy() for key, array in shared_outputs.arrays.items()}
+        finally:
+            shared_inputs.close(unlink=True)
+            shared_outputs.close(unlink=True)
+
+    def line_results(self, snapshots, horizon_days=MAINTENANCE_HORIZON_DAYS):
+        """{line_id: failure probability, component predictions and maintenance plan}
+
+        Lines whose KPI values are unchanged since the last run on the same
+        day come from the cache; the others are computed together in one batch.
+        """
+        start = datetime.now()
+        values = {line_id: tuple(float(data.get(kpi, np.nan)) for kpi in KPI_NAMES)
+                  for line_id, data in snapshots.items()}
+        keys = {line_id: (start.date(), horizon_days) + value for line_id, value in values.items()}
+        stale = [line_id for line_id, key in keys.items() if self.cache.get(line_id, (None,))[0] != key]
+        if stale:
+            names, result = self.run([values[line_id] for line_id in stale], stale, horizon_days, start)
+            for l, line_id in enumerate(stale):
+                self.cache[line_id] = (keys[line_id], analytics_records(names[l], result, l, start))
+        return {line_id: self.cache[line_id][1] for line_id in snapshots}
+
+
+def analytics_records(components, result, l, start):
+    """One line of LineAnalyticsRunner.run output in the per-line functions' formats"""
+    predictions, windows = [], []
+    for c, index in enumerate(result["order"][l]):
+        risk = result["risk"][l, c]
+        if not np.isfinite(risk):
+            continue  # padding of a line with fewer components
+        component = components[index]
+        predictions.append({
+            "component": component,
+            "risk": float(risk),
+            "hours": int(result["hours"][l, c]),
+            "recommendation": MAINTENANCE_RECOMMENDATIONS.get(component, "Schedule maintenance check")
+        })
+        day = int(result["day"][l, c])
+        if day >= 0:
+            windows.append({
+                "component": component,
+                "day": day,
+                "date": (start + timedelta(days=day)).strftime("%Y-%m-%d"),
+                "risk": float(result["condition"][l, c]),
+                "cost": float(result["cost"][l, c])
+            })
+    return {
+        "failure_probability": float(result["probability"][l]),
+        "component_failures": predictions,
+        "maintenance_plan": sorted(windows, key=lambda w: (w["day"], -w["risk"]))
+    }
+
+
+ANALYTICS_RUNNER = LineAnalyticsRunner()
+
+
+# ====================== REST API ======================
+LINES_MAX_AGE = 3600  # line configuration only changes with a deploy
+LINES_ETAG = "lines-" + hashlib.sha1(json.dumps(PRODUCTION_LINES, sort_keys=True).encode()).hexdigest()[:12]
+RISK_INPUT_KPIS = [kpi for kpi in KPI_NAMES
+                   if kpi in FAILURE_WEIGHTS or any(kpi in m for m in COMPONENT_KPI_MATRIX.values())]
+
+
+def cached_json(etag, max_age, build):
+    """JSON response tagged with `etag`; the body is only built if the client's copy is stale"""
+    headers = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={int(max_age)}"}
+    if etag in flask.request.if_none_match:
+        return flask.Response(status=304, headers=headers)
+    return flask.Response(json.dumps(build()), mimetype="application/json", headers=headers)
+
+
+def unknown_line(line_id):
+    return flask.jsonify({"error": f"Unknown line: {line_id}"}), 404
+
+
+@server.route("/api/lines")
+def api_lines():
+    return cached_json(LINES_ETAG, LINES_MAX_AGE, lambda: [
+        {"id": line_id, **line} for line_id, line in PRODUCTION_LINES.items()
+    ])
+
+
+@server.route("/api/lines/<line_id>/kpis")
+def api_line_kpis(line_id):
+    """Latest KPI snapshot of a line, cacheable until its next KPI is due"""
+    if line_id not in PRODUCTION_LINES:
+        return unknown_line(line_id)
+    # The body is built from the same read as the ETag
+    data, versions = SAMPLER.state(line_id)
+
+    def build():
+        return {
+            "line_id": line_id,
+            "kpis": {
+                kpi: {
+                    "value": data[kpi],
+                    "target": TARGETS[kpi],
+                    "status": get_kpi_status(data[kpi], TARGETS[kpi])[0],
+                    "last_updated": data["last_updated"][kpi],
+                    "update_frequency": UPDATE_FREQUENCIES[kpi]
+                }
+                for kpi in KPI_NAMES
+            }
+        }
+
+    etag = f"{SAMPLER.token}-{line_id}-{versions['samples']}"
+    return cached_json(etag, SAMPLER.next_due(line_id), build)
+
+
+@server.route("/api/lines/<line_id>/components/risk")
+def api_component_risk(line_id):
+    """Component failure predictions of a line, cacheable until a risk input is due"""
+    if line_id not in PRODUCTION_LINES:
+        return unknown_line(line_id)
+    # The body is built from the same read as the ETag
+    data, metrics, metric_versions, samples = SAMPLER.metrics_state(
+        line_id, ("failure_probability", "component_failures"))
+    versions = list(metric_versions.values())
+    if 0 in versions:
+        # Until the derived metrics exist the body is computed from the live snapshot
+        versions.append(samples)
+
+    def build():
+        probability = metrics["failure_probability"]
+        return {
+            "line_id": line_id,
+            "failure_probability": calculate_failure_probability(data) if probability is None else probability,
+            "components": metrics["component_failures"] or predict_component_failures(data, line_id)
+        }
+
+    etag = f"{SAMPLER.token}-{line_id}-risk-" + "-".join(map(str, versions))
+    return cached_json(etag, SAMPLER.next_due(line_id, kpis=RISK_INPUT_KPIS), build)
+
+
+@server.route("/api/lines/<line_id>/health")
+def api_line_health(line_id):
+    """Read telemetry of the line's adapter: latency histogram, error rate and KPI staleness"""
+    if line_id not in PRODUCTION_LINES:
+        return unknown_line(line_id)
+    adapter = get_adapter(line_id, SAMPLER.mode)
+    return flask.jsonify({"line_id": line_id, **adapter.get_status(), "health": adapter.get_health()})
+
+
+@server.route("/api/analytics")
+def api_analytics():
+    """Failure risk, component predictions and maintenance plans of every line in one batch"""
+    states = {line_id: SAMPLER.metrics_state(line_id, ("maintenance_plan",)) for line_id in LINE_IDS}
+    # Lines without a maintenance plan yet are computed from their live snapshot
+    versions = [metric_versions["maintenance_plan"] or f"s{samples}"
+                for _, _, metric_versions, samples in states.values()]
+    etag = f"{SAMPLER.token}-analytics-{datetime.now():%Y%m%d}-" + "-".join(map(str, versions))
+    max_age = min(SAMPLER.next_due(line_id, kpis=RISK_INPUT_KPIS) for line_id in LINE_IDS)
+    return cached_json(etag, max_age, lambda: ANALYTICS_RUNNER.line_results(
+        {line_id: state[0] for line_id, state in states.items()}))
+
+
+# ====================== DOWNSAMPLING ======================
+DEFAULT_CHART_POINTS = 1000  # used until the browser reports the chart width
+MAX_CHART_POINTS = 2000
+
+
+def lttb(x, y, n_out):
+    """Indices kept by Largest-Triangle-Three-Buckets downsampling of (x, y)
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the previously kept point and
+    the mean of the next bucket.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    counts = np.diff(edges)
+    # Buckets end before the last point, so the sums stop there too
+    mean_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    ax, ay = x[0], y[0]
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        cx, cy = (mean_x[b + 1], mean_y[b + 1]) if b + 1 < n_out - 2 else (x[-1], y[-1])
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        i = lo + int(np.argmax(area))
+        selected[b + 1] = i
+        ax, ay = x[i], y[i]
+    return selected
+
+
+def minmax_envelope(y, n_out):
+    """Indices of the minimum and maximum of each of n_out / 2 equal buckets"""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    size = -(-n // (n_out // 2))
+    rows = -(-n // size)
+    padded = np.full(rows * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(rows, size)
+    offsets = np.arange(rows) * size
+    return np.unique(np.r_[offsets + np.nanargmin(padded, axis=1), offsets + np.nanargmax(padded, axis=1)])
+
+
+def downsample(x, y, n_out, method="lttb"):
+    """Downsampled copies of (x, y) with at most n_out points; NaNs are dropped"""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    keep = np.isfinite(x) & np.isfinite(y)
+    x, y = x[keep], y[keep]
+    index = lttb(x, y, n_out) if method == "lttb" else minmax_envelope(y, n_out)
+    return x[index], y[index]
+
+
+def chart_points(width):
+    """Points per trace for a chart `width` pixels wide"""
+    return int(np.clip(width or DEFAULT_CHART_POINTS, 3, MAX_CHART_POINTS))
+
+
+# ====================== APP LAYOUT ======================
+INITIAL_DATA = generate_initial_data('line1')
+REFRESH_SLACK_SECONDS = 1.5  # lets the sampler pick up a due KPI before the client asks
+MAX_REFRESH_SECONDS = 60
+
+# KPIs read by the maintenance and component risk panels
+RISK_PANEL_KPIS = [kpi for kpi in KPI_NAMES if any(kpi in m for m in COMPONENT_KPI_MATRIX.values())]
+
+app.layout = dbc.Container(fluid=True, children=[
+    dcc.Location(id='url', refresh=False),
+    dcc.Store(id='kpi-data', data=INITIAL_DATA),
+    dcc.Store(id='kpi-timestamps', data=INITIAL_DATA["last_updated"]),
+    dcc.Store(id='kpi-versions'),
+    dcc.Store(id='kpi-group-risk'),
+    dcc.Store(id='analytics-kpi-data'),
+    dcc.Store(id='analytics-group-risk'),
+    dcc.Store(id='alert-version'),
+    *[dcc.Store(id=f"kpi-store-{slug}", data={"value": INITIAL_DATA[kpi]}) for kpi, slug in KPI_SLUGS.items()],
+    dcc.Interval(id='interval', interval=5 * 1000, n_intervals=0),
+    dcc.Interval(id='clock', interval=1000, n_intervals=0),
+    dcc.Store(id='refresh-tick'),
+    html.Button(id='visibility-resume', n_clicks=0, style={"display": "none"}),
+    dcc.Store(id='fullscreen-store', data={'is_fullscreen': False}),
+
+    # NEW: Add this store for tracking adapter modes
+    dcc.Store(
+        id='adapter-modes-store',
+        data={line_id: SAMPLER.mode for line_id in PRODUCTION_LINES}
+    ),
+
+    # Navigation Sidebar
+    dbc.Row([
+        dbc.Col(
+            dbc.Nav(
+                [
+                    dbc.NavLink(
+                        [
+                            html.I(className="bi bi-speedometer2 me-2"),
+                            "Dashboard"
+                        ],
+                        href="/",
+                        active="exact",
+                        className="py-3"
+                    ),
+                    dbc.NavLink(
+                        [
+                            html.I(className="bi bi-graph-up me-2"),
+                            "Production Analytics"
+                        ],
+                        href="/analytics",
+                        active="exact",
+                        className="py-3"
+                    )
+                ],
+                vertical=True,
+                pills=True,
+                className="sidebar bg-dark"
+            ),
+            width=2,
+            className="p-0"
+        ),
+
+        # Main Content
+        dbc.Col(
+            id="main-content",
+            children=[
+                # Header
+dbc.Row([
+    dbc.Col(
+        html.Div([
+            html.H1("KPI Dashboard", className="display-4 fw-bold mb-0"),
+            html.Small("Real-time Production Monitoring", className="text-muted"),
+            dbc.Select(
+                id="line-selector",
+                options=[
+                    {"label": f"{PRODUCTION_LINES[line]['name']}", "value": line}
+                    for line in PRODUCTION_LINES
+                ],
+                value="line1",
+                className="mt-2 w-100",
+                size="sm"
+            )
+        ]),
+        width=8  # Changed from 10 to 8
+    ),
+    dbc.Col(
+        html.Div([  # New wrapper Div
+            # Production mode toggle switch
+            dbc.Switch(
+                id="production-mode-toggle",
+                label="Production Mode",
+                value=False,
+                className="mb-2"  # Margin bottom
+            ),
+            # Existing fullscreen button
+            dbc.Button(
+                html.I(className="bi bi-arrows-fullscreen"),
+                id="fullscreen-btn",
+                color="link",
+                className="p-2",  # Removed mt-4
+                style={"zIndex": 1000}
+            )
+        ], className="d-flex flex-column align-items-end"),  # Vertical alignment
+        width=4,  # Changed from 2 to 4
+        className="d-flex align-items-center justify-content-end"
+    )
+], className="mb-4 p-3 header-bg"),
+
+                # Page Content
+                html.Div(id='page-content', className="mt-3"),
+
+                # Footer
+                dbc.Row(dbc.Col(
+                    html.Div([
+                        html.Hr(className="mb-2"),
+                        html.P([
+                            "Designed by ",
+                            html.Strong("Pratik Sonavane",
+                                        style={"background": "linear-gradient(45deg, #4facfe, #00f2fe)",
+                                               "-webkit-background-clip": "text",
+                                               "color": "transparent"}),
+                            " - Production Intelligence System"
+                        ], className="text-center"),
+                        html.P("© 2025 AUTOVISTA - Real-time Production Monitoring",
+                               className="text-center text-muted")
+                    ], className="p-3")
+                ))
+            ],
+            width=10,
+            style={"padding": "0 20px", "height": "100vh"}
+        )
+    ], className="g-0"),
 ], style={
     "backgroundColor": "#0d1117",
     "color": "#f0f6fc",
@@ -713,6 +3317,98 @@ dbc.Row([
 
 
 # ====================== PAGE LAYOUTS ======================
+HISTORY_RANGES = {"6h": 6, "24h": 24, "7d": 168, "30d": 720}  # hours
+HISTORY_DEFAULT_KPIS = ["OEE", "PM Risk", "Batt Efficiency", "Chg Utilization"]
+HISTORY_COLORS = ["#4facfe", "#00f2fe", "#ff7de9", "#ffd700", "#7fff7f", "#ba55d3", "#ff8c42", "#dc143c"]
+HIERARCHY_COLUMNS = [
+    {"name": "Node", "id": "node"},
+    {"name": "State", "id": "state"},
+    {"name": "OEE %", "id": "OEE", "type": "numeric", "format": {"specifier": ".1f"}},
+    {"name": "Avail. %", "id": "availability", "type": "numeric", "format": {"specifier": ".1f"}},
+    {"name": "Perf. %", "id": "performance", "type": "numeric", "format": {"specifier": ".1f"}},
+    {"name": "Quality %", "id": "quality", "type": "numeric", "format": {"specifier": ".1f"}},
+    {"name": "Units/h", "id": "units_per_hour", "type": "numeric", "format": {"specifier": ".1f"}},
+    {"name": "kWh/unit", "id": "energy_per_unit", "type": "numeric", "format": {"specifier": ".2f"}},
+    {"name": "Running", "id": "Running", "type": "numeric"},
+    {"name": "Idle", "id": "Idle", "type": "numeric"},
+    {"name": "Down", "id": "Down", "type": "numeric"}
+]
+HIERARCHY_TABLE_STYLE = {
+    "style_header": {"backgroundColor": "#161b22", "color": "#f0f6fc", "fontWeight": "bold"},
+    "style_cell": {"backgroundColor": "#0d1117", "color": "#c9d1d9", "border": "1px solid #30363d",
+                   "fontSize": "0.85rem", "padding": "4px 8px"},
+    "style_data_conditional": [{"if": {"filter_query": "{OEE} < 75", "column_id": "OEE"}, "color": "#ff6b6b"}]
+}
+MAINTENANCE_COLUMNS = [
+    {"name": "Component", "id": "component"},
+    {"name": "Priority", "id": "priority"},
+    {"name": "Risk %", "id": "risk", "type": "numeric", "format": {"specifier": ".1f"}},
+    {"name": "Hours to failure", "id": "hours", "type": "numeric"},
+    {"name": "Recommended schedule", "id": "recommendation"}
+]
+FAILURE_COLUMNS = MAINTENANCE_COLUMNS[:1] + MAINTENANCE_COLUMNS[2:4] + [
+    {"name": "Contributing factors", "id": "factors"}
+]
+WINDOW_COLUMNS = [
+    {"name": "Day", "id": "date"},
+    {"name": "Component", "id": "component"},
+    {"name": "Risk %", "id": "risk", "type": "numeric", "format": {"specifier": ".1f"}},
+    {"name": "Est. cost", "id": "cost", "type": "numeric", "format": {"specifier": "$,.0f"}}
+]
+ANOMALY_COLUMNS = [
+    {"name": "Time", "id": "time"},
+    {"name": "Type", "id": "type"},
+    {"name": "KPI", "id": "kpi"},
+    {"name": "Value", "id": "value", "type": "numeric", "format": {"specifier": ".2f"}},
+    {"name": "z", "id": "score", "type": "numeric", "format": {"specifier": "+.1f"}}
+]
+# Component tables colour risk and time to failure in the planner's red/amber/green bands
+RISK_TABLE_STYLE = {
+    **HIERARCHY_TABLE_STYLE,
+    "style_cell": {**HIERARCHY_TABLE_STYLE["style_cell"], "textAlign": "left",
+                   "whiteSpace": "normal", "height": "auto"},
+    "style_data_conditional": [
+        {"if": {"filter_query": "{risk} > 50", "column_id": ["risk", "priority"]}, "color": "#ff4136"},
+        {"if": {"filter_query": "{risk} >= 30 && {risk} <= 50", "column_id": ["risk", "priority"]},
+         "color": "#ffdc00"},
+        {"if": {"filter_query": "{risk} < 30", "column_id": ["risk", "priority"]}, "color": "#2ecc40"},
+        {"if": {"filter_query": "{hours} < 24", "column_id": "hours"}, "color": "#ff4136"},
+        {"if": {"filter_query": "{hours} >= 24 && {hours} < 72", "column_id": "hours"}, "color": "#ffdc00"},
+        {"if": {"filter_query": "{type} = OUTLIER || {type} = SPIKE", "column_id": "type"},
+         "color": "#ff4136"},
+        {"if": {"filter_query": "{type} contains DRIFT", "column_id": "type"}, "color": "#ffdc00"}
+    ]
+}
+BUSY_STYLE, IDLE_STYLE = {"display": "inline-block"}, {"display": "none"}  # background job indicator
+# Plain-dict figure shown until a chart's own callback returns
+SKELETON_FIGURE = {
+    "data": [],
+    "layout": {
+        "paper_bgcolor": "rgba(0,0,0,0)",
+        "plot_bgcolor": "rgba(0,0,0,0)",
+        "font": {"color": "#8b949e"},
+        "xaxis": {"visible": False},
+        "yaxis": {"visible": False},
+        "annotations": [{"text": "Loading...", "showarrow": False,
+                         "xref": "paper", "yref": "paper", "x": 0.5, "y": 0.5}]
+    }
+}
+
+
+def busy_indicator(component_id):
+    """Spinner shown in a card header while its background callback runs"""
+    return html.Span([dbc.Spinner(size="sm", color="info", spinner_class_name="me-1"), "Computing"],
+                     id=component_id, className="ms-auto small text-muted", style=IDLE_STYLE)
+
+
+def skeleton_rows(count):
+    """Placeholder rows shown until a panel's content is computed"""
+    return [
+        dbc.Placeholder(animation="glow", className="w-100 mb-2", style={"height": "28px"})
+        for _ in range(count)
+    ]
+
+
 def dashboard_layout():
     return html.Div([
         # KPI Grid with unique IDs and loading indicators
@@ -735,16 +3431,59 @@ def dashboard_layout():
             dbc.Col(
                 dbc.Card([
                     dbc.CardHeader("Performance Insights & Recommendations", className="fw-bold fs-5"),
-                    dbc.CardBody(
+                    dbc.CardBody([
                         html.Div(id="dashboard-insights", children=[
                             dbc.Alert("Loading insights...", color="info")
                         ]),
+                        dcc.Store(id='insights-key')
+                    ],
                         style={"maxHeight": "300px", "overflowY": "auto"}
                     )
                 ], className="shadow-lg")
             )
         ),
 
+        # Plant-wide alerts raised by the sampler's rule engine
+        dbc.Row(
+            dbc.Col(
+                dbc.Card([
+                    dbc.CardHeader([
+                        html.I(className="bi bi-bell me-2"),
+                        "Plant Alerts"
+                    ], className="fw-bold d-flex align-items-center"),
+                    dbc.CardBody(
+                        html.Div(skeleton_rows(2), id="alert-panel"),
+                        style={"maxHeight": "300px", "overflowY": "auto"}
+                    )
+                ], className="mt-3 shadow-sm")
+            )
+        ),
+
+        # Plant -> line -> cell -> asset drill-down of the per-asset simulation
+        dbc.Row(
+            dbc.Col(
+                dbc.Card([
+                    dbc.CardHeader([
+                        html.I(className="bi bi-diagram-3 me-2"),
+                        "Plant Hierarchy"
+                    ], className="fw-bold d-flex align-items-center"),
+                    dbc.CardBody([
+                        html.Div(skeleton_rows(2), id="hierarchy-lines"),
+                        dcc.Store(id='drill-line'),
+                        html.Div([
+                            html.H6(id="hierarchy-drill-title", className="mt-3"),
+                            dash_table.DataTable(id='cell-table', columns=HIERARCHY_COLUMNS[:1] + HIERARCHY_COLUMNS[2:],
+                                                 sort_action="native", page_size=8, **HIERARCHY_TABLE_STYLE),
+                            html.Small("Select a cell to list its assets", className="text-muted"),
+                            dash_table.DataTable(id='asset-table', columns=HIERARCHY_COLUMNS[:-3],
+                                                 sort_action="native", page_size=ASSETS_PER_CELL,
+                                                 **HIERARCHY_TABLE_STYLE)
+                        ], id="hierarchy-drill", style={"display": "none"})
+                    ])
+                ], className="mt-3 shadow-sm")
+            )
+        ),
+
         # Factory Connection Status Panel
         dbc.Row(
             dbc.Col(
@@ -765,11 +3504,16 @@ def analytics_layout():
                 dbc.Card([
                     dbc.CardHeader([
                         html.I(className="bi bi-graph-up me-2"),
-                        "Performance Forecast"
+                        "Performance Forecast",
+                        busy_indicator("forecast-busy")
                     ], className="fw-bold fs-5 d-flex align-items-center"),
                     dbc.CardBody(
-                        dcc.Graph(id="efficiency-forecast", config={"displayModeBar": False},
-                                  style={"height": "500px"})  # Increased height
+                        dcc.Loading(
+                            dcc.Graph(id="efficiency-forecast", figure=SKELETON_FIGURE,
+                                      config={"displayModeBar": False},
+                                      style={"height": "500px"}),  # Increased height
+                            type="dot", color="#4facfe"
+                        )
                     )
                 ], className="shadow-lg mb-4", style={
                     "background": "linear-gradient(135deg, #1a1a2e, #16213e)",
@@ -779,6 +3523,53 @@ def analytics_layout():
             )
         ]),
 
+        # KPI history (full width), downsampled to the chart width
+        dbc.Row([
+            dbc.Col(
+                dbc.Card([
+                    dbc.CardHeader([
+                        html.I(className="bi bi-clock-history me-2"),
+                        "KPI History"
+                    ], className="fw-bold fs-5 d-flex align-items-center"),
+                    dbc.CardBody([
+                        dbc.Row([
+                            dbc.Col(dcc.Dropdown(
+                                id="history-kpis",
+                                options=[{"label": kpi, "value": kpi} for kpi in KPI_NAMES],
+                                value=HISTORY_DEFAULT_KPIS,
+                                multi=True,
+                                className="text-dark"
+                            ), width=6),
+                            dbc.Col(dbc.RadioItems(
+                                id="history-range",
+                                options=[{"label": label, "value": label} for label in HISTORY_RANGES],
+                                value="24h",
+                                inline=True
+                            ), width=3),
+                            dbc.Col(dbc.RadioItems(
+                                id="history-downsampling",
+                                options=[{"label": "LTTB", "value": "lttb"},
+                                         {"label": "Min/Max", "value": "minmax"}],
+                                value="lttb",
+                                inline=True
+                            ), width=3)
+                        ], className="mb-2 align-items-center"),
+                        dcc.Store(id="history-width"),
+                        dcc.Loading(
+                            dcc.Graph(id="kpi-history", figure=SKELETON_FIGURE,
+                                      config={"displayModeBar": True, "displaylogo": False},
+                                      style={"height": "400px"}),
+                            type="dot", color="#4facfe"
+                        )
+                    ])
+                ], className="shadow-lg mb-4", style={
+                    "background": "linear-gradient(135deg, #1a1a2e, #16213e)",
+                    "border": "1px solid #2a3a5a"
+                }),
+                width=12
+            )
+        ]),
+
         # Second row: Production Trends and Resource Utilization (half width each)
         dbc.Row([
             # Production Trends
@@ -789,8 +3580,12 @@ def analytics_layout():
                         "Production Trends"
                     ], className="fw-bold fs-5 d-flex align-items-center"),
                     dbc.CardBody(
-                        dcc.Graph(id="production-trends", config={"displayModeBar": False},
-                                  style={"height": "400px"})
+                        dcc.Loading(
+                            dcc.Graph(id="production-trends", figure=SKELETON_FIGURE,
+                                      config={"displayModeBar": False},
+                                      style={"height": "400px"}),
+                            type="dot", color="#4facfe"
+                        )
                     )
                 ], className="shadow-lg mb-4", style={
                     "background": "linear-gradient(135deg, #1a1a2e, #0f3460)",
@@ -807,8 +3602,12 @@ def analytics_layout():
                         "Resource Utilization"
                     ], className="fw-bold fs-5 d-flex align-items-center"),
                     dbc.CardBody(
-                        dcc.Graph(id="resource-utilization", config={"displayModeBar": False},
-                                  style={"height": "400px"})
+                        dcc.Loading(
+                            dcc.Graph(id="resource-utilization", figure=SKELETON_FIGURE,
+                                      config={"displayModeBar": False},
+                                      style={"height": "400px"}),
+                            type="dot", color="#4facfe"
+                        )
                     )
                 ], className="shadow-lg mb-4", style={
                     "background": "linear-gradient(135deg, #1a1a2e, #0f3460)",
@@ -824,10 +3623,26 @@ def analytics_layout():
                 dbc.Card([
                     dbc.CardHeader([
                         html.I(className="bi bi-tools me-2"),
-                        "Predictive Maintenance Planner"
+                        "Predictive Maintenance Planner",
+                        busy_indicator("maintenance-busy")
                     ], className="fw-bold fs-5 d-flex align-items-center"),
                     dbc.CardBody([
-                        html.Div(id="maintenance-forecast", className="maintenance-planner")
+                        html.Div([
+                            html.Span("Next 24 Hours", className="badge bg-danger me-2"),
+                            html.Span("24-72 Hours", className="badge bg-warning me-2"),
+                            html.Span("72+ Hours", className="badge bg-success")
+                        ], className="text-center mb-3"),
+                        html.Div(id="maintenance-status"),
+                        dcc.Loading(
+                            html.Div([
+                                dash_table.DataTable(id='maintenance-table', columns=MAINTENANCE_COLUMNS,
+                                                     **RISK_TABLE_STYLE),
+                                html.H6(id='maintenance-windows-title', className="mt-4 mb-2"),
+                                dash_table.DataTable(id='maintenance-windows', columns=WINDOW_COLUMNS,
+                                                     **RISK_TABLE_STYLE)
+                            ], className="maintenance-planner"),
+                            type="dot", color="#4facfe"
+                        )
                     ], style={"padding": "20px"})
                 ], className="shadow-lg mb-4", style={
                     "background": "linear-gradient(135deg, #1a1a2e, #1b1b2f)",
@@ -843,10 +3658,31 @@ def analytics_layout():
                 dbc.Card([
                     dbc.CardHeader([
                         html.I(className="bi bi-exclamation-triangle me-2"),
-                        "Component Failure Prediction"
+                        "Component Failure Prediction",
+                        busy_indicator("component-busy")
                     ], className="fw-bold fs-5 d-flex align-items-center"),
                     dbc.CardBody(
-                        html.Div(id="anomaly-detection", className="component-failure")
+                        dcc.Loading(
+                            html.Div([
+                                dbc.Row([
+                                    dbc.Col([
+                                        html.H5("Component Failure Risk Analysis", className="mb-3"),
+                                        dash_table.DataTable(id='failure-table', columns=FAILURE_COLUMNS,
+                                                             **RISK_TABLE_STYLE)
+                                    ], width=7),
+                                    dbc.Col([
+                                        html.H5("Failure Timeline", className="mb-3"),
+                                        dcc.Graph(id='failure-timeline', figure=SKELETON_FIGURE,
+                                                  style={"height": "300px"}, config={'displayModeBar': False})
+                                    ], width=5)
+                                ]),
+                                html.H5("Recent KPI Anomalies", className="mt-3 mb-3"),
+                                dash_table.DataTable(id='anomaly-table', columns=ANOMALY_COLUMNS,
+                                                     **RISK_TABLE_STYLE),
+                                html.Div(id="component-status", className="mt-2")
+                            ], className="component-failure"),
+                            type="dot", color="#4facfe"
+                        )
                     )
                 ], className="shadow-lg", style={
                     "background": "linear-gradient(135deg, #1a1a2e, #1b1b2f)",
@@ -858,191 +3694,271 @@ def analytics_layout():
     ])
 
 
+# Both pages are built once at import; navigation only toggles their visibility
+DASHBOARD_PAGE = dashboard_layout()
+ANALYTICS_PAGE = analytics_layout()
+app.layout['page-content'].children = [
+    html.Div(DASHBOARD_PAGE, id='page-dashboard'),
+    html.Div(ANALYTICS_PAGE, id='page-analytics', style={"display": "none"})
+]
+
+# The layout never changes after import, so serialise it once for every page load
+LAYOUT_JSON = to_json_plotly(app.layout)
+
+
+def serve_cached_layout():
+    return flask.Response(LAYOUT_JSON, mimetype="application/json")
+
+
+server.view_functions[app.config.routes_pathname_prefix + "_dash-layout"] = serve_cached_layout
+
+
+# ====================== BACKGROUND ANALYTICS ======================
+BACKGROUND_CACHE_DIR = os.environ.get("KPI_CACHE_DIR", "cache")
+BACKGROUND_RESULT_TTL = 600  # seconds a computed panel stays in the result cache
+
+
+def background_line_version():
+    """Versions of the line a background job computes, read from the callback request
+
+    Panels also read the process's forecasts and derived metrics, which change
+    after the snapshot passed as input, so cached results are keyed by them too.
+    """
+    payload = flask.request.get_json(silent=True) or {}
+    for item in payload.get("inputs", []) + payload.get("state", []):
+        value = item.get("value") if isinstance(item, dict) else None
+        line_id = value.get("line_id") if isinstance(value, dict) else value
+        if isinstance(line_id, str) and line_id in LINE_INDEX:
+            return [line_id, SAMPLER.line_version(line_id)]
+    return None
+
+
+try:  # imported at load: background callbacks need their manager when they are registered
+    import diskcache
+    cache = diskcache.Cache(BACKGROUND_CACHE_DIR)
+    # Creating the cache connects to its database; closing it before workers fork
+    # leaves each process to open its own connection on first use
+    cache.close()
+    # Results are cached by callback inputs (the line and its data snapshot), the
+    # sampler's token and the line's sample and metric versions
+    BACKGROUND_MANAGER = dash.DiskcacheManager(
+        cache,
+        cache_by=[lambda: SAMPLER.token, background_line_version],
+        expire=BACKGROUND_RESULT_TTL
+    )
+except ImportError:  # without diskcache the analytics callbacks run in the request worker
+    BACKGROUND_MANAGER = None
+
+
+def background_options(busy_id):
+    """Callback options running an analytics panel as a background job, if available
+
+    The job runs in its own process, shows `busy_id` while running and is
+    cancelled when the user switches line or page.
+    """
+    if BACKGROUND_MANAGER is None:
+        return {}
+    return dict(
+        background=True,
+        manager=BACKGROUND_MANAGER,
+        running=[(Output(busy_id, 'style'), BUSY_STYLE, IDLE_STYLE)],
+        cancel=[Input('line-selector', 'value'), Input('url', 'pathname')]
+    )
+
+
 # ====================== CALLBACKS ======================
-@app.callback(
-    Output('page-content', 'children'),
+# Navigation only toggles which prebuilt page is visible, without a server round trip
+app.clientside_callback(
+    """
+    function(pathname) {
+        const analytics = pathname === "/analytics";
+        return [
+            analytics ? {"display": "none"} : {},
+            analytics ? {} : {"display": "none"}
+        ];
+    }
+    """,
+    [Output('page-dashboard', 'style'),
+     Output('page-analytics', 'style')],
     [Input('url', 'pathname')]
 )
-def render_page_content(pathname):
-    if pathname == "/":
-        return dashboard_layout()
-    elif pathname == "/analytics":
-        return analytics_layout()
-    return dashboard_layout()
+
+# Analytics panels only receive data while their page is shown, so no
+# (background) analytics job is started for a hidden page
+ANALYTICS_GATE = """
+    function(value, pathname) {
+        return pathname === "/analytics" ? value : window.dash_clientside.no_update;
+    }
+"""
+app.clientside_callback(
+    ANALYTICS_GATE,
+    Output('analytics-kpi-data', 'data'),
+    [Input('kpi-data', 'data'),
+     Input('url', 'pathname')]
+)
+app.clientside_callback(
+    ANALYTICS_GATE,
+    Output('analytics-group-risk', 'data'),
+    [Input('kpi-group-risk', 'data'),
+     Input('url', 'pathname')]
+)
 
 
 @app.callback(
-    Output('kpi-data', 'data'),
-    [Input('interval', 'n_intervals'),
+    [Output('interval', 'interval'),
+     Output('kpi-data', 'data'),
+     Output('kpi-timestamps', 'data'),
+     Output('kpi-versions', 'data'),
+     Output('kpi-group-risk', 'data'),
+     Output('alert-version', 'data')] +
+    [Output(f"kpi-store-{slug}", 'data') for slug in KPI_SLUGS.values()],
+    [Input('refresh-tick', 'data'),
      Input('line-selector', 'value')],
-    [State('kpi-data', 'data'),
-     State('adapter-modes-store', 'data')]  # Add adapter modes state
+    [State('kpi-versions', 'data')]
 )
-def update_kpi_data(n, line_id, current_data, adapter_modes):
-    # Get mode for current line
-    mode = adapter_modes.get(line_id, 'virtual')
+def update_kpi_data(tick, line_id, previous):
+    # The sampler reads the adapters in the background; serve its latest snapshot
+    SAMPLER.start()
+    data, versions = SAMPLER.state(line_id)
+
+    # Next refresh when the line's next KPI is due (plus one sampler tick of slack)
+    next_refresh = int(min(MAX_REFRESH_SECONDS, SAMPLER.next_due(line_id) + REFRESH_SLACK_SECONDS) * 1000)
+
+    # Only replace the stores whose KPIs changed since this client's last refresh
+    if previous is None or previous.get("line_id") != line_id:
+        previous = {"kpis": {}, "samples": None, "anomalies": None}
+    changed = {kpi for kpi in KPI_NAMES if versions["kpis"][kpi] != previous["kpis"].get(kpi)}
+    new_samples = versions["samples"] != previous["samples"]
+    risk_changed = bool(changed.intersection(RISK_PANEL_KPIS)) or versions["anomalies"] != previous["anomalies"]
+    alerts_changed = versions["alerts"] != previous.get("alerts")
+    if not changed and not new_samples and not risk_changed and not alerts_changed:
+        return [next_refresh] + [no_update] * (5 + len(KPI_SLUGS))
+
+    versions["line_id"] = line_id
+    # Ages are measured against the source's clock (a replay runs in recorded time)
+    clock, speed = SAMPLER.line_clock(line_id)
+    timestamps = dict(data["last_updated"], now=clock, speed=speed)
+    group_risk = {kpi: data[kpi] for kpi in RISK_PANEL_KPIS}
+    group_risk.update(line_id=line_id, anomalies=versions["anomalies"])
+    return [
+        next_refresh,
+        data if changed else no_update,
+        timestamps if new_samples else no_update,
+        versions,
+        group_risk if risk_changed else no_update,
+        versions["alerts"] if alerts_changed else no_update
+    ] + [
+        {"value": data[kpi], "version": versions["kpis"][kpi]} if kpi in changed else no_update
+        for kpi in KPI_SLUGS
+    ]
 
-    # Get adapter for selected production line and mode
-    adapter = get_adapter(line_id, mode)
 
-    # If we don't have data yet, initialize from adapter
-    if current_data is None:
-        # For the first run, we need to simulate initial data
-        # We'll read all KPIs to initialize
-        initial_data = generate_initial_data(line_id)
-        # But we also want to set the adapter's last_values
-        if hasattr(adapter, 'last_values'):
-            adapter.last_values = copy.deepcopy(initial_data)
-        return initial_data
-
-    # Create a deep copy to avoid mutation issues
-    new_data = copy.deepcopy(current_data)
-
-    # Update KPIs using the adapter
-    now = datetime.now().timestamp()
-    for kpi, freq in UPDATE_FREQUENCIES.items():
-        last_update = new_data["last_updated"][kpi]
-        time_diff = now - last_update
-
-        if time_diff >= freq:
-            try:
-                # Use the adapter to get updated value
-                new_value, update_time = adapter.read_kpi(kpi)
-                new_data[kpi] = new_value
-                new_data["last_updated"][kpi] = update_time
+# Create callbacks for each KPI card
+kpi_callbacks = {kpi: f"kpi-card-{slug}" for kpi, slug in KPI_SLUGS.items()}
 
-                # For virtual adapter, update its internal state
-                if mode == 'virtual' and hasattr(adapter, 'last_values'):
-                    adapter.last_values[kpi] = new_value
-                    adapter.last_values["last_updated"][kpi] = update_time
+for kpi, card_id in kpi_callbacks.items():
+    @app.callback(
+        Output(card_id, 'children'),
+        [Input(f"kpi-store-{KPI_SLUGS[kpi]}", 'data')]
+    )
+    def update_card(store, kpi=kpi):
+        if store is None:
+            return create_kpi_card(kpi, 0, TARGETS[kpi])
+        return create_kpi_card(kpi, store["value"], TARGETS[kpi])
 
-            except Exception as e:
-                print(f"Error updating {kpi}: {str(e)}")
-                # If there's an error, just keep the current value
-                # but update the timestamp to now to avoid repeated errors
-                new_data["last_updated"][kpi] = now
 
-    return new_data
+# "Updated ... ago" labels are rendered in the browser so cards only re-render on new values.
+# The server sends its source clock with the timestamps; the browser advances it by
+# the time passed since they arrived, at the source's speed
+app.clientside_callback(
+    """
+    function(n, timestamps) {
+        const kpis = %s;
+        if (!timestamps) {
+            return kpis.map(() => window.dash_clientside.no_update);
+        }
+        const received = window.kpiTimestampsReceived = window.kpiTimestampsReceived || new WeakMap();
+        if (!received.has(timestamps)) {
+            received.set(timestamps, Date.now() / 1000);
+        }
+        const now = timestamps.now === undefined ? Date.now() / 1000 :
+            timestamps.now + (Date.now() / 1000 - received.get(timestamps)) * timestamps.speed;
+        return kpis.map(kpi => {
+            const diff = Math.max(0, now - timestamps[kpi]);
+            return `Updated: ${Math.floor(diff / 60)}m ${Math.floor(diff %% 60)}s ago`;
+        });
+    }
+    """ % json.dumps(list(KPI_SLUGS)),
+    [Output(f"kpi-updated-{slug}", 'children') for slug in KPI_SLUGS.values()],
+    [Input('clock', 'n_intervals'),
+     Input('kpi-timestamps', 'data')]
+)
+
+
+# Refreshes only reach the server while the page is visible (Page Visibility API);
+# hidden tabs stop both timers and assets/visibility.js resumes them on return
+app.clientside_callback(
+    """
+    function(n, resumed) {
+        if (document.hidden) {
+            return [window.dash_clientside.no_update, true, true];
+        }
+        return [Date.now(), false, false];
+    }
+    """,
+    [Output('refresh-tick', 'data'),
+     Output('interval', 'disabled'),
+     Output('clock', 'disabled')],
+    [Input('interval', 'n_intervals'),
+     Input('visibility-resume', 'n_clicks')]
+)
 
 
-# Create callbacks for each KPI card
-kpi_callbacks = {
-    "OEE": "kpi-card-oee",
-    "CO2/km": "kpi-card-co2",
-    "PM Risk": "kpi-card-pm-risk",
-    "SC Resilience": "kpi-card-sc-resilience",
-    "TVR": "kpi-card-tvr",
-    "Batt Efficiency": "kpi-card-batt-eff",
-    "Chg Utilization": "kpi-card-chg-util",
-    "Security": "kpi-card-security"
+INSIGHT_STYLES = {
+    "critical": ("CRITICAL", "danger"),
+    "good": ("WARNING", "warning"),
+    "excellent": ("OPTIMAL", "success")
 }
 
-for kpi, card_id in kpi_callbacks.items():
-    @app.callback(
-        Output(card_id, 'children'),
-        [Input('kpi-data', 'data')]
-    )
-    def update_card(data, kpi=kpi):
-        if data is None:
-            return create_kpi_card(kpi, 0, TARGETS[kpi], datetime.now())
-        last_updated = data["last_updated"].get(kpi, datetime.now().timestamp())
-        return create_kpi_card(kpi, data[kpi], TARGETS[kpi], last_updated)
-
 
-@app.callback(
-    Output('dashboard-insights', 'children'),
-    [Input('kpi-data', 'data'),
-     Input('line-selector', 'value'),
-     Input('url', 'pathname')],
-    prevent_initial_call=False
-)
-def update_dashboard_insights(data, line_id, pathname):
-    # Only update if we're on the dashboard page
-    if pathname != "/":
-        raise PreventUpdate
+def insights_key(data):
+    """What the insights panel depends on: each KPI's status bucket and displayed value"""
+    return tuple(
+        (kpi, get_kpi_status(data[kpi], TARGETS[kpi])[0], f"{data[kpi]:.1f}")
+        for kpi in TARGETS
+    )
 
-    if data is None:
-        return dbc.Alert("Waiting for initial data...", color="warning")
-
-    line_info = PRODUCTION_LINES[line_id]
-
-    # Performance insights - DECISION-ORIENTED DESIGN
-    insights = []
-
-    # Calculate all statuses first
-    statuses = {}
-    for kpi in TARGETS:
-        status, color, _ = get_kpi_status(data[kpi], TARGETS[kpi])
-        statuses[kpi] = {"status": status, "color": color, "value": data[kpi]}
-
-    # Critical alerts
-    critical_insights = []
-    for kpi in statuses:
-        if statuses[kpi]["status"] == "critical":
-            critical_insights.append(
-                dbc.Alert(
-                    [
-                        html.Div([
-                            html.I(className=f"bi bi-{ICONS[kpi]} me-2"),
-                            html.Span(f"{kpi}: ", className="fw-bold"),
-                            html.Span(f"{statuses[kpi]['value']:.1f}"),
-                            dbc.Badge("CRITICAL", color="danger", className="ms-2")
-                        ], className="d-flex align-items-center"),
-                        html.Div(
-                            f"Action: {get_action_recommendation(kpi)}",
-                            className="text-dark mt-1 small"
-                        )
-                    ],
-                    color="danger",
-                    className="mb-3 p-3"
-                )
-            )
 
-    # Warning alerts
-    warning_insights = []
-    for kpi in statuses:
-        if statuses[kpi]["status"] == "good":
-            warning_insights.append(
-                dbc.Alert(
-                    [
-                        html.Div([
-                            html.I(className=f"bi bi-{ICONS[kpi]} me-2"),
-                            html.Span(f"{kpi}: ", className="fw-bold"),
-                            html.Span(f"{statuses[kpi]['value']:.1f}"),
-                            dbc.Badge("WARNING", color="warning", className="ms-2")
-                        ], className="d-flex align-items-center"),
-                        html.Div(
-                            f"Action: {get_action_recommendation(kpi)}",
-                            className="text-dark mt-1 small"
-                        )
-                    ],
-                    color="warning",
-                    className="mb-3 p-3"
-                )
-            )
+@lru_cache(maxsize=1024)
+def render_insight_alert(kpi, status, value_text):
+    """One insight alert; cached and shared across sessions"""
+    label, color = INSIGHT_STYLES[status]
+    action = ("Maintain current performance" if status == "excellent"
+              else f"Action: {get_action_recommendation(kpi)}")
+    return dbc.Alert(
+        [
+            html.Div([
+                html.I(className=f"bi bi-{ICONS[kpi]} me-2"),
+                html.Span(f"{kpi}: ", className="fw-bold"),
+                html.Span(value_text),
+                dbc.Badge(label, color=color, className="ms-2")
+            ], className="d-flex align-items-center"),
+            html.Div(action, className="text-dark mt-1 small")
+        ],
+        color=color,
+        className="mb-3 p-3"
+    )
 
-    # Positive statuses
-    positive_insights = []
-    for kpi in statuses:
-        if statuses[kpi]["status"] == "excellent":
-            positive_insights.append(
-                dbc.Alert(
-                    [
-                        html.Div([
-                            html.I(className=f"bi bi-{ICONS[kpi]} me-2"),
-                            html.Span(f"{kpi}: ", className="fw-bold"),
-                            html.Span(f"{statuses[kpi]['value']:.1f}"),
-                            dbc.Badge("OPTIMAL", color="success", className="ms-2")
-                        ], className="d-flex align-items-center"),
-                        html.Div("Maintain current performance", className="text-dark mt-1 small")
-                    ],
-                    color="success",
-                    className="mb-3 p-3"
-                )
-            )
 
-    # Combine insights - critical first, then warnings, then positives
-    all_insights = critical_insights + warning_insights + positive_insights
+@lru_cache(maxsize=256)
+def render_insights(key):
+    """Full insights panel for an insights_key: critical first, then warnings, then positives"""
+    all_insights = [
+        render_insight_alert(kpi, status, value_text)
+        for bucket in ("critical", "good", "excellent")
+        for kpi, status, value_text in key
+        if status == bucket
+    ]
 
     # If no insights, show a success message
     if not all_insights:
@@ -1063,6 +3979,167 @@ def update_dashboard_insights(data, line_id, pathname):
     return all_insights
 
 
+@app.callback(
+    [Output('dashboard-insights', 'children'),
+     Output('insights-key', 'data')],
+    [Input('kpi-data', 'data'),
+     Input('line-selector', 'value'),
+     Input('url', 'pathname')],
+    [State('insights-key', 'data')],
+    prevent_initial_call=False
+)
+def update_dashboard_insights(data, line_id, pathname, previous_key):
+    # Only update if we're on the dashboard page
+    if pathname != "/":
+        raise PreventUpdate
+
+    if data is None:
+        return dbc.Alert("Waiting for initial data...", color="warning"), None
+
+    # Statuses and rounded values decide the panel; skip the render when they are unchanged
+    key = SAMPLER.metric(line_id, "insights_key") or insights_key(data)
+    stored_key = [list(item) for item in key]
+    if stored_key == previous_key:
+        return no_update, no_update
+
+    return render_insights(key), stored_key
+
+
+ALERT_COLORS = {"critical": "danger", "warning": "warning"}
+
+
+def alert_row(alert, resolved=False):
+    line_name = PRODUCTION_LINES[alert["line_id"]]["name"]
+    opened = datetime.fromtimestamp(alert["opened"]).strftime("%H:%M:%S")
+    detail = f"rate {alert['rate']:+.1f}/h" if alert["rate"] is not None else f"{alert['value']:.2f}"
+    return dbc.Alert([
+        html.Strong(f"{line_name} · {alert['kpi']}: "),
+        f"{alert['rule']} ({detail}, threshold {alert['threshold']:g})",
+        html.Small(f" since {opened}" if not resolved else f" {opened} - resolved",
+                   className="ms-2 text-muted")
+    ], color="secondary" if resolved else ALERT_COLORS[alert["severity"]],
+        className="py-1 px-2 mb-1")
+
+
+@app.callback(
+    Output('alert-panel', 'children'),
+    [Input('alert-version', 'data')]
+)
+def update_alert_panel(version):
+    # Alerts are evaluated by the sampler; this only renders its log
+    active, recent = SAMPLER.alert_log()
+    resolved = [alert for alert in recent if alert["resolved"] is not None][:5]
+    rows = [alert_row(alert) for alert in active]
+    if not rows:
+        rows = [dbc.Alert("No open alerts", color="success", className="py-1 px-2 mb-1")]
+    if resolved:
+        rows.append(html.H6("Recently resolved", className="mt-2 text-muted"))
+        rows.extend(alert_row(alert, resolved=True) for alert in resolved)
+    return rows
+
+
+def hierarchy_rows(kpis, labels, states=None):
+    """DataTable rows from node KPIs, one per label; row ids are the node positions"""
+    rows = []
+    for i, label in enumerate(labels):
+        row = {column["id"]: round(float(kpis[column["id"]][i]), 3)
+               for column in HIERARCHY_COLUMNS[2:8]}
+        row.update({name: int(kpis[name][i]) for name in STATE_NAMES})
+        row["node"] = label
+        row["id"] = i
+        if states is not None:
+            row["state"] = STATE_NAMES[states[i]]
+        rows.append(row)
+    return rows
+
+
+def node_summary(title, kpis, button_id=None):
+    body = [
+        html.Div(title, className="fw-bold"),
+        html.Div(f"OEE {kpis['OEE'][0]:.1f}% · {kpis['units_per_hour'][0]:.0f} units/h", className="small"),
+        html.Div([
+            dbc.Badge(f"{int(kpis[name][0])} {name.lower()}", color=color, className="me-1")
+            for name, color in zip(STATE_NAMES, ("success", "warning", "danger"))
+        ])
+    ]
+    if button_id is None:
+        return dbc.Card(dbc.CardBody(body, className="p-2"), className="h-100 border-info")
+    return dbc.Button(body, id=button_id, color="dark", outline=True, className="w-100 h-100 text-start p-2")
+
+
+@app.callback(
+    Output('hierarchy-lines', 'children'),
+    [Input('refresh-tick', 'data')]
+)
+def update_hierarchy_overview(tick):
+    plant = hierarchy_snapshot("plant", [0])
+    if plant is None:
+        return dbc.Alert("Asset hierarchy is available with the per-asset simulator (KPI_SOURCE=assets)",
+                         color="secondary", className="py-1 px-2 mb-0")
+    lines = hierarchy_snapshot("line", slice(None))
+    line_kpis = [{name: values[i:i + 1] for name, values in lines.items()} for i in range(len(LINE_IDS))]
+    return dbc.Row(
+        [dbc.Col(node_summary("Plant", plant), width=4)] +
+        [dbc.Col(node_summary(PRODUCTION_LINES[line_id]["name"], kpis, {"type": "drill-line", "index": line_id}),
+                 width=2)
+         for line_id, kpis in zip(LINE_IDS, line_kpis)],
+        className="g-2"
+    )
+
+
+@app.callback(
+    Output('drill-line', 'data'),
+    [Input({"type": "drill-line", "index": ALL}, 'n_clicks'),
+     Input('line-selector', 'value')],
+    [State('drill-line', 'data')]
+)
+def select_drill_line(clicks, selected, current):
+    # The dashboard's line opens its drill-down; a line card click toggles another one
+    if callback_context.triggered_id in (None, 'line-selector'):
+        return selected
+    # The line cards are re-rendered every refresh, which fires this with no clicks
+    if not any(clicks):
+        raise PreventUpdate
+    line_id = callback_context.triggered_id["index"]
+    return None if line_id == current else line_id
+
+
+@app.callback(
+    [Output('cell-table', 'data'),
+     Output('hierarchy-drill-title', 'children'),
+     Output('hierarchy-drill', 'style')],
+    [Input('drill-line', 'data'),
+     Input('refresh-tick', 'data')]
+)
+def update_cell_table(line_id, tick):
+    drill = hierarchy_children("line", LINE_INDEX[line_id]) if line_id else None
+    if drill is None:
+        return [], None, {"display": "none"}
+    cells, kpis, _ = drill
+    labels = [f"Cell {index + 1:02d}" for index in range(len(cells))]
+    title = f"{PRODUCTION_LINES[line_id]['name']}: {len(cells)} cells"
+    return hierarchy_rows(kpis, labels), title, {"display": "block"}
+
+
+@app.callback(
+    Output('asset-table', 'data'),
+    [Input('cell-table', 'active_cell'),
+     Input('refresh-tick', 'data')],
+    [State('drill-line', 'data')]
+)
+def update_asset_table(active_cell, tick, line_id):
+    if not active_cell or not line_id:
+        return []
+    # row_id survives native sorting and paging, unlike the row index
+    position = active_cell["row_id"]
+    line = hierarchy_children("line", LINE_INDEX[line_id])
+    if line is None or position is None or position >= len(line[0]):  # selection left over from another line
+        return []
+    assets, kpis, states = hierarchy_children("cell", line[0][position])
+    labels = [f"Cell {position + 1:02d} / Asset {i + 1}" for i in range(len(assets))]
+    return hierarchy_rows(kpis, labels, states)
+
+
 def get_action_recommendation(kpi):
     """Return decision-focused recommendations for each KPI"""
     recommendations = {
@@ -1152,602 +4229,799 @@ def update_fullscreen_button(data):
     return html.I(className="bi bi-fullscreen")
 
 
+# Chart shapes are fixed, so each figure is built and validated by plotly once
+# at import and kept as a plain dict; callbacks only write their arrays into
+# copies of the trace dicts. Dash serialises the dicts with plotly's JSON
+# encoder, which uses orjson (with native NumPy support) when it is installed.
+def figure_template(fig):
+    """Plain-dict spec of a validated figure"""
+    return fig.to_dict()
+
+
+def fill_figure(template, traces, **layout):
+    """Figure from a template: `traces` are per-trace overrides, `layout` top-level layout overrides
+
+    Template dicts are shared, so overrides replace whole values instead of
+    mutating nested ones.
+    """
+    return {
+        "data": [{**trace, **values} for trace, values in zip(template["data"], traces)],
+        "layout": {**template["layout"], **layout} if layout else template["layout"]
+    }
+
+
+def status_figure_template(title):
+    """Empty figure carrying a status message as its title"""
+    status_fig = go.Figure()
+    status_fig.update_layout(
+        template="plotly_dark",
+        height=300,
+        title=title,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return figure_template(status_fig)
+
+
+LOADING_FIGURE = status_figure_template("Loading data...")
+ERROR_FIGURE = status_figure_template("Error")
+
+
+def loading_figure():
+    """Placeholder figure while data is not available yet"""
+    return LOADING_FIGURE
+
+
+def error_figure(e):
+    """Figure reporting an error while building a chart"""
+    return fill_figure(ERROR_FIGURE, [], title={**ERROR_FIGURE["layout"]["title"], "text": f"Error: {str(e)}"})
+
+
+def trends_template():
+    categories = list(TARGETS.keys())
+    fig_trends = go.Figure()
+
+    # Current values (filled per line)
+    fig_trends.add_trace(go.Scatterpolar(
+        r=[0] * len(categories),
+        theta=categories,
+        fill='toself',
+        name='Current',
+        line=dict(width=2)
+    ))
+
+    # Add target values
+    fig_trends.add_trace(go.Scatterpolar(
+        r=[TARGETS[k] for k in categories],
+        theta=categories,
+        fill='toself',
+        name='Target',
+        line=dict(color='#00f2fe', dash='dash'),
+        opacity=0.7
+    ))
+
+    # Predicted values (24-hour projection, filled per line)
+    fig_trends.add_trace(go.Scatterpolar(
+        r=[0] * len(categories),
+        theta=categories,
+        fill='toself',
+        name='Predicted (24h)',
+        line=dict(color='#ff7de9', dash='dot'),
+        opacity=0.9
+    ))
+
+    fig_trends.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 100],
+                tickfont=dict(size=9)  # Smaller font size
+            ),
+            angularaxis=dict(
+                tickfont=dict(size=9),  # Smaller font size
+                gridcolor='rgba(255,255,255,0.1)'  # Added grid
+            )
+        ),
+        showlegend=True,
+        template="plotly_dark",
+        height=400,
+        title=dict(
+            text="Performance Trends",
+            y=0.98,  # Position title near the top of the plot area
+            x=0.5,
+            xanchor='center',
+            yanchor='top'
+        ),
+        margin=dict(l=40, r=40, t=100, b=40),  # Increased top margin to make space for title and legend
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.15,  # Position legend above the plot area, relative to the top of the plot
+            xanchor="center",
+            x=0.5,  # Center legend horizontally
+            font=dict(size=10),
+            bgcolor='rgba(0,0,0,0.5)',  # Add a slight background for readability
+            bordercolor='rgba(255,255,255,0.1)',
+            borderwidth=1
+        )
+    )
+    return figure_template(fig_trends)
+
+
+TRENDS_FIGURE = trends_template()
+
+
+# Each analytics panel has its own callback so panels load independently
 @app.callback(
-    [Output('production-trends', 'figure'),
-     Output('efficiency-forecast', 'figure'),
-     Output('resource-utilization', 'figure'),
-     Output('maintenance-forecast', 'children'),
-     Output('anomaly-detection', 'children')],
+    Output('production-trends', 'figure'),
     [Input('kpi-data', 'data'),
      Input('line-selector', 'value'),
-     Input('url', 'pathname')],
-    prevent_initial_call=True
+     Input('url', 'pathname')]
 )
-def update_analytics_page(data, line_id, pathname):
+def update_production_trends(data, line_id, pathname):
     # Only update if we're on the analytics page
     if pathname != "/analytics":
         raise PreventUpdate
-
-    # Return placeholder if no data
     if data is None:
-        empty_fig = go.Figure()
-        empty_fig.update_layout(
-            template="plotly_dark",
-            height=300,
-            title="Loading data...",
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)'
-        )
-        anomaly_placeholder = dbc.Alert("Loading data...", color="info")
-        maintenance_placeholder = dbc.Alert("Loading maintenance data...", color="info")
-        return empty_fig, empty_fig, empty_fig, maintenance_placeholder, anomaly_placeholder
+        return loading_figure()
 
     try:
         line_info = PRODUCTION_LINES[line_id]
 
         # 1. Production Trends with Prediction
         categories = list(TARGETS.keys())
-        fig_trends = go.Figure()
-
-        # Add current values
-        fig_trends.add_trace(go.Scatterpolar(
-            r=[data[k] for k in categories],
-            theta=categories,
-            fill='toself',
-            name='Current',
-            line=dict(color=line_info["color"], width=2)
-        ))
-
-        # Add target values
-        fig_trends.add_trace(go.Scatterpolar(
-            r=[TARGETS[k] for k in categories],
-            theta=categories,
-            fill='toself',
-            name='Target',
-            line=dict(color='#00f2fe', dash='dash'),
-            opacity=0.7
-        ))
-
-        # Add predicted values (24-hour projection)
-        predicted_values = [predict_kpi_trend(data[k], TARGETS[k]) for k in categories]
-        fig_trends.add_trace(go.Scatterpolar(
-            r=predicted_values,
-            theta=categories,
-            fill='toself',
-            name='Predicted (24h)',
-            line=dict(color='#ff7de9', dash='dot'),
-            opacity=0.9
-        ))
-
-        fig_trends.update_layout(
-            polar=dict(
-                radialaxis=dict(
-                    visible=True,
-                    range=[0, 100],
-                    tickfont=dict(size=9)  # Smaller font size
-                ),
-                angularaxis=dict(
-                    tickfont=dict(size=9),  # Smaller font size
-                    gridcolor='rgba(255,255,255,0.1)'  # Added grid
-                )
-            ),
-            showlegend=True,
-            template="plotly_dark",
-            height=400,
-            title=dict(
-                text=f"{line_info['name']} Performance Trends",
-                y=0.98,  # Position title near the top of the plot area
-                x=0.5,
-                xanchor='center',
-                yanchor='top'
-            ),
-            margin=dict(l=40, r=40, t=100, b=40),  # Increased top margin to make space for title and legend
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.15,  # Position legend above the plot area, relative to the top of the plot
-                xanchor="center",
-                x=0.5,  # Center legend horizontally
-                font=dict(size=10),
-                bgcolor='rgba(0,0,0,0.5)',  # Add a slight background for readability
-                bordercolor='rgba(255,255,255,0.1)',
-                borderwidth=1
-            )
+        forecast = SAMPLER.forecast(line_id)
+        current = TRENDS_FIGURE["data"][0]
+        return fill_figure(TRENDS_FIGURE, [
+            {"r": [data[k] for k in categories], "line": {**current["line"], "color": line_info["color"]}},
+            {},
+            {"r": [forecast[k]["mean"][FORECAST_HORIZON_HOURS] for k in categories]}
+        ], title={**TRENDS_FIGURE["layout"]["title"], "text": f"{line_info['name']} Performance Trends"})
+
+    except Exception as e:
+        return error_figure(e)
+
+
+FORECAST_HOURS = list(range(0, 25, 2))  # More data points for better visibility
+FORECAST_PRODUCTION = [100 * (0.98 ** h) for h in FORECAST_HOURS]
+
+
+def forecast_template():
+    placeholder = [0] * len(FORECAST_HOURS)
+    fig_forecast = go.Figure()
+
+    # Production trace (Blue) - Associated with yaxis (primary left)
+    fig_forecast.add_trace(go.Scatter(
+        x=FORECAST_HOURS, y=FORECAST_PRODUCTION,
+        mode='lines+markers',
+        name='Units Produced',
+        line=dict(color='#6495ED', width=3),  # Cornflower Blue
+        marker=dict(symbol='circle', size=7),
+        yaxis='y' # Primary y-axis
+    ))
+
+    # Efficiency trace (Purple) - Associated with yaxis2 (right)
+    fig_forecast.add_trace(go.Scatter(
+        x=FORECAST_HOURS, y=placeholder,
+        mode='lines+markers',
+        name='OEE Efficiency',
+        line=dict(color='#BA55D3', width=3),  # Medium Orchid
+        marker=dict(symbol='square', size=7),
+        yaxis='y2' # Right y-axis
+    ))
+
+    # OEE prediction interval (shaded band around the efficiency forecast)
+    fig_forecast.add_trace(go.Scatter(
+        x=FORECAST_HOURS + FORECAST_HOURS[::-1],
+        y=placeholder + placeholder,
+        fill='toself',
+        fillcolor='rgba(186, 85, 211, 0.15)',
+        line=dict(width=0),
+        hoverinfo='skip',
+        name='OEE 90% Interval',
+        yaxis='y2'
+    ))
+
+    # Failure risk percentile band (10th-90th)
+    fig_forecast.add_trace(go.Scatter(
+        x=FORECAST_HOURS + FORECAST_HOURS[::-1],
+        y=placeholder + placeholder,
+        fill='toself',
+        fillcolor='rgba(220, 20, 60, 0.12)',
+        line=dict(width=0),
+        hoverinfo='skip',
+        name='Failure Risk P10-P90',
+        yaxis='y2'
+    ))
+
+    # Failure probability trace (Crimson, NO FILL) - Associated with yaxis2 (right)
+    fig_forecast.add_trace(go.Scatter(
+        x=FORECAST_HOURS, y=placeholder,
+        mode='lines',
+        name='Failure Risk',
+        line=dict(color='#DC143C', width=3, dash='dot'),  # Crimson
+        yaxis='y2' # Right y-axis
+    ))
+
+    # Predicted failure points (where the 90th percentile turns critical), filled per line
+    fig_forecast.add_trace(go.Scatter(
+        x=[], y=[],
+        mode='markers',
+        name='Critical Risk Point',
+        marker=dict(
+            symbol='circle', # Changed to solid circle
+            size=12, # Slightly smaller but solid
+            color='#FFD700', # Solid gold color for high visibility
+            line=dict(width=1, color='white') # Thin white border for definition
+        ),
+        yaxis='y2' # Associated with the right y-axis
+    ))
+
+    # Add risk bands with improved visibility and cleaner colors
+    fig_forecast.add_hrect(
+        y0=0, y1=30,
+        fillcolor="rgba(30, 144, 255, 0.1)", # Dodger Blue subtle
+        layer="below",
+        line_width=0,
+        annotation_text="Low Risk",
+        annotation_position="top left",
+        annotation_font_size=10,
+        annotation_font_color="#ffffff"
+    )
+    fig_forecast.add_hrect(
+        y0=30, y1=70,
+        fillcolor="rgba(255, 165, 0, 0.1)", # Orange subtle
+        layer="below",
+        line_width=0,
+        annotation_text="Medium Risk",
+        annotation_position="top left",
+        annotation_font_size=10,
+        annotation_font_color="#ffffff"
+    )
+    fig_forecast.add_hrect(
+        y0=70, y1=100,
+        fillcolor="rgba(255, 69, 0, 0.1)", # Red-Orange subtle
+        layer="below",
+        line_width=0,
+        annotation_text="High Risk",
+        annotation_position="top left",
+        annotation_font_size=10,
+        annotation_font_color="#ffffff"
+    )
+
+    fig_forecast.update_layout(
+        title=dict(
+            text='Production Forecast with Failure Risk',
+            y=0.98,  # Position title at the very top
+            x=0.5,
+            xanchor='center',
+            font=dict(size=16)
+        ),
+        xaxis_title='Hours Ahead',
+        yaxis=dict(
+            title='Units Produced',
+            color='#6495ED',
+            range=[0, max(FORECAST_PRODUCTION) * 1.1]
+        ),
+        yaxis2=dict(
+            title='OEE (%) / Failure Risk (%)',
+            overlaying='y',
+            side='right',
+            color='#FFFFFF',
+            range=[0, 100],
+            position=1.0,
+            showgrid=False
+        ),
+        template="plotly_dark",
+        height=450,  # Increased height
+        margin=dict(l=20, r=120, t=100, b=40),  # Increased top margin
+        paper_bgcolor='black',
+        plot_bgcolor='black',
+        legend=dict(
+            orientation="h",
+            y=1.1,  # Position legend ABOVE the plot area
+            yanchor="bottom",  # Anchor to bottom of legend so it sits just above the plot
+            x=0.5,  # Center legend horizontally
+            xanchor="center",
+            font=dict(size=10),
+            bgcolor='rgba(0,0,0,0.5)',
+            bordercolor='rgba(255,255,255,0.1)',
+            borderwidth=1,
+            itemsizing='constant',
+            itemwidth=40
         )
+    )
 
+    return figure_template(fig_forecast)
 
 
-              # 2. ENHANCED Performance Forecast with Failure Risk - BIGGER SIZE
-        hours = list(range(0, 25, 2))  # More data points for better visibility
-        production = [100 * (0.98 ** h) for h in hours]
-        efficiency = [data["OEE"] * (0.992 ** h) for h in hours]
-
-        # Calculate failure probability (TEMPORARY: FORCED HIGH VALUES FOR DEBUGGING)
-        # This will ensure critical points are always generated for testing the marker visibility
-        # We start at 40 and increase by 3 for each 2-hour step, ensuring it crosses 60 and 70
-        failure_prob = [40 + (h * 3) for h in hours]
-        failure_prob = [min(100, p) for p in failure_prob]  # Cap at 100%
-
-        fig_forecast = go.Figure()
-
-        # Production trace (Blue) - Associated with yaxis (primary left)
-        fig_forecast.add_trace(go.Scatter(
-            x=hours, y=production,
-            mode='lines+markers',
-            name='Units Produced',
-            line=dict(color='#6495ED', width=3),  # Cornflower Blue
-            marker=dict(symbol='circle', size=7),
-            yaxis='y' # Primary y-axis
-        ))
-
-        # Efficiency trace (Purple) - Associated with yaxis2 (right)
-        fig_forecast.add_trace(go.Scatter(
-            x=hours, y=efficiency,
-            mode='lines+markers',
-            name='OEE Efficiency',
-            line=dict(color='#BA55D3', width=3),  # Medium Orchid
-            marker=dict(symbol='square', size=7),
-            yaxis='y2' # Right y-axis
-        ))
-
-        # Failure probability trace (Crimson, NO FILL) - Associated with yaxis2 (right)
-        fig_forecast.add_trace(go.Scatter(
-            x=hours, y=failure_prob,
-            mode='lines',
-            name='Failure Risk',
-            line=dict(color='#DC143C', width=3, dash='dot'),  # Crimson
-            yaxis='y2' # Right y-axis
-        ))
-
-        # Add predicted failure points
-        critical_points = []
-        for i, prob in enumerate(failure_prob):
-            if prob > 60: # Threshold for critical points
-                critical_points.append((hours[i], prob))
-
-        # print(f"DEBUG: critical_points = {critical_points}") # Diagnostic print - keep commented for now
-
-        if critical_points: # Only add trace if there are critical points
-            x_vals, y_vals = zip(*critical_points)
-            fig_forecast.add_trace(go.Scatter(
-                x=x_vals, y=y_vals,
-                mode='markers',
-                name='Critical Risk Point',
-                marker=dict(
-                    symbol='circle', # Changed to solid circle
-                    size=12, # Slightly smaller but solid
-                    color='#FFD700', # Solid gold color for high visibility
-                    line=dict(width=1, color='white') # Thin white border for definition
-                ),
-                yaxis='y2' # Associated with the right y-axis
-            ))
-
-        # Add risk bands with improved visibility and cleaner colors
-        fig_forecast.add_hrect(
-            y0=0, y1=30,
-            fillcolor="rgba(30, 144, 255, 0.1)", # Dodger Blue subtle
-            layer="below",
-            line_width=0,
-            annotation_text="Low Risk",
-            annotation_position="top left",
-            annotation_font_size=10,
-            annotation_font_color="#ffffff"
-        )
-        fig_forecast.add_hrect(
-            y0=30, y1=70,
-            fillcolor="rgba(255, 165, 0, 0.1)", # Orange subtle
-            layer="below",
-            line_width=0,
-            annotation_text="Medium Risk",
-            annotation_position="top left",
-            annotation_font_size=10,
-            annotation_font_color="#ffffff"
-        )
-        fig_forecast.add_hrect(
-            y0=70, y1=100,
-            fillcolor="rgba(255, 69, 0, 0.1)", # Red-Orange subtle
-            layer="below",
-            line_width=0,
-            annotation_text="High Risk",
-            annotation_position="top left",
-            annotation_font_size=10,
-            annotation_font_color="#ffffff"
-        )
+FORECAST_FIGURE = forecast_template()
 
-        fig_forecast.update_layout(
-            title=dict(
-                text='Production Forecast with Failure Risk',
-                y=0.98,  # Position title at the very top
-                x=0.5,
-                xanchor='center',
-                font=dict(size=16)
-            ),
-            xaxis_title='Hours Ahead',
-            yaxis=dict(
-                title='Units Produced',
-                color='#6495ED',
-                range=[0, max(production) * 1.1]
-            ),
-            yaxis2=dict(
-                title='OEE (%) / Failure Risk (%)',
-                overlaying='y',
-                side='right',
-                color='#FFFFFF',
-                range=[0, 100],
-                position=1.0,
-                showgrid=False
-            ),
-            template="plotly_dark",
-            height=450,  # Increased height
-            margin=dict(l=20, r=120, t=100, b=40),  # Increased top margin
-            paper_bgcolor='black',
-            plot_bgcolor='black',
-            legend=dict(
-                orientation="h",
-                y=1.1,  # Position legend ABOVE the plot area
-                yanchor="bottom",  # Anchor to bottom of legend so it sits just above the plot
-                x=0.5,  # Center legend horizontally
-                xanchor="center",
-                font=dict(size=10),
-                bgcolor='rgba(0,0,0,0.5)',
-                bordercolor='rgba(255,255,255,0.1)',
-                borderwidth=1,
-                itemsizing='constant',
-                itemwidth=40
-            )
-        )
 
-        # 3. Resource Utilization with Bottleneck Prediction
-        resources = ['Robots', 'Personnel', 'Energy', 'Materials', 'Machines']
-        utilization = [random.randint(60, 95) for _ in resources]
-
-        # Calculate projected utilization
-        projected = [u * (1 + random.uniform(0.05, 0.15)) for u in utilization]
-        projected = [min(110, p) for p in projected]  # Cap at 110%
-
-        # Generate bottlenecks for anomaly detection
-        bottlenecks = predict_bottlenecks(utilization)
-
-        fig_util = go.Figure()
-
-        # Current utilization bars
-        fig_util.add_trace(go.Bar(
-            x=resources,
-            y=utilization,
-            name='Current',
-            marker_color='#4facfe'
-        ))
-
-        # Projected utilization bars
-        fig_util.add_trace(go.Bar(
-            x=resources,
-            y=[max(0, p - u) for u, p in zip(utilization, projected)],
-            name='Projected Increase',
-            marker_color='#ff7de9',
-            text=[f"{p:.0f}%" for p in projected],
-            textposition='outside',
-            base=utilization
-        ))
-
-        # Add threshold line
-        # Improved threshold line
-        # Lighter threshold line with reduced opacity
-        # White threshold line with lower opacity
-        # White threshold line with consistent opacity for line and text
-        fig_util.add_hline(
-            y=85,
-            line=dict(
-                color="#FFFFFF",  # White line
-                width=2,
-                dash="dash"
-            ),
-            opacity=0.3,  # Line opacity at 0.3
-            annotation=dict(
-                text="Bottleneck Threshold",
-                font=dict(
-                    color="rgba(255,255,255,0.3)",  # White text with 0.3 opacity
-                    size=12,
-                    family="Arial"
-                ),
-                bgcolor="rgba(0,0,0,0.2)",  # Reduced background opacity
-                bordercolor="rgba(255,255,255,0.3)",  # Border with 0.3 opacity
-                borderwidth=1,
-                borderpad=4
-            ),
-            annotation_position="top right"
-        )
+@app.callback(
+    Output('efficiency-forecast', 'figure'),
+    [Input('analytics-kpi-data', 'data')],
+    [State('line-selector', 'value')],
+    **background_options('forecast-busy')
+)
+def update_efficiency_forecast(data, line_id):
+    if data is None:
+        return loading_figure()
 
-        fig_util.update_layout(
-            barmode='stack',
-            title=dict(
-                text='Resource Utilization with Projection',
-                y=0.98,  # Position title near the top of the plot area
-                x=0.5,
-                xanchor='center',
-                yanchor='top'
-            ),
-            xaxis_title='Resource Type',
-            yaxis_title='Utilization (%)',
-            template="plotly_dark",
-            height=400,
-            yaxis_range=[0, 110],
-            margin=dict(l=50, r=20, t=100, b=100),  # Increased top margin to make space for title and legend
-            xaxis=dict(
-                tickangle=-30,  # Rotate labels
-                tickfont=dict(size=10)
+    try:
+        # 2. ENHANCED Performance Forecast with Failure Risk - BIGGER SIZE
+        forecast = SAMPLER.forecast(line_id)
+        hours = FORECAST_HOURS
+        efficiency = forecast["OEE"]["mean"][hours]
+        efficiency_lower = forecast["OEE"]["lower"][hours]
+        efficiency_upper = forecast["OEE"]["upper"][hours]
+
+        # Failure probability percentiles from the Monte Carlo engine (computed in the background)
+        risk_projection = SAMPLER.failure_risk(line_id)
+        if risk_projection is not None:
+            failure_prob = risk_projection["percentiles"][50][hours]
+            failure_low = risk_projection["percentiles"][RISK_PERCENTILES[0]][hours]
+            failure_high = risk_projection["percentiles"][RISK_PERCENTILES[-1]][hours]
+        else:
+            failure_prob = failure_low = failure_high = np.full(len(hours), calculate_failure_probability(data))
+
+        # Critical points only get a trace (and legend entry) when there are any
+        critical = failure_high > CRITICAL_RISK
+        traces = [
+            {},
+            {"y": efficiency},
+            {"y": np.r_[efficiency_upper, efficiency_lower[::-1]]},
+            {"y": np.r_[failure_high, failure_low[::-1]]},
+            {"y": failure_prob}
+        ]
+        if critical.any():
+            traces.append({"x": np.array(hours)[critical], "y": failure_high[critical]})
+        return fill_figure(FORECAST_FIGURE, traces)
+
+    except Exception as e:
+        return error_figure(e)
+
+
+def history_template():
+    """Layout plus one line trace and one min/max band trace, copied per KPI"""
+    fig_history = go.Figure()
+    fig_history.add_trace(go.Scattergl(x=[], y=[], mode='lines', line=dict(width=1.5)))
+    # Min/max of each bucket as a band around the mean
+    fig_history.add_trace(go.Scatter(
+        x=[], y=[],
+        fill='toself',
+        opacity=0.2,
+        line=dict(width=0),
+        hoverinfo='skip',
+        showlegend=False
+    ))
+    fig_history.update_layout(
+        template="plotly_dark",
+        height=400,
+        margin=dict(l=40, r=20, t=30, b=40),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        legend=dict(orientation="h", y=1.08, x=0.5, xanchor="center", font=dict(size=10))
+    )
+    return figure_template(fig_history)
+
+
+HISTORY_FIGURE = history_template()
+HISTORY_LINE, HISTORY_BAND = HISTORY_FIGURE["data"]
+
+
+# The browser reports the plot width so traces carry about one point per pixel
+app.clientside_callback(
+    """
+    function(pathname) {
+        const graph = document.getElementById("kpi-history");
+        return graph ? graph.offsetWidth : window.innerWidth;
+    }
+    """,
+    Output('history-width', 'data'),
+    [Input('url', 'pathname')]
+)
+
+
+def local_datetimes(stamps):
+    """Epoch seconds as naive local datetimes, the way the dashboard shows times"""
+    offset = datetime.now().astimezone().utcoffset().total_seconds()
+    return ((np.asarray(stamps) + offset) * 1000).astype("datetime64[ms]")
+
+
+def zoomed_range(relayout):
+    """(start, end) epoch seconds of a zoomed x axis, or None when autoscaled"""
+    if not relayout or "xaxis.range[0]" not in relayout:
+        return None
+    bounds = epoch_seconds([relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]])
+    return tuple(bounds) if np.isfinite(bounds).all() else None
+
+
+@app.callback(
+    [Output('kpi-history', 'figure'),
+     Output('kpi-history', 'relayoutData')],
+    [Input('line-selector', 'value'),
+     Input('history-kpis', 'value'),
+     Input('history-range', 'value'),
+     Input('history-downsampling', 'value'),
+     Input('history-width', 'data'),
+     Input('kpi-history', 'relayoutData'),
+     Input('refresh-tick', 'data'),
+     Input('url', 'pathname')]
+)
+def update_kpi_history(line_id, kpis, range_label, method, width, relayout, tick, pathname):
+    # Only update if we're on the analytics page
+    if pathname != "/analytics":
+        raise PreventUpdate
+
+    # A new line or range drops the zoom; the cleared relayoutData fires this callback again
+    trigger = callback_context.triggered_id
+    reset_zoom = trigger in ('line-selector', 'history-range') and relayout is not None
+    if trigger == 'kpi-history' and relayout is None:
+        raise PreventUpdate
+
+    try:
+        # Zooming re-queries just the visible window, at full resolution once it fits the width
+        zoom = None if reset_zoom else zoomed_range(relayout)
+        end = max(SAMPLER.snapshot(line_id)["last_updated"].values())
+        start, end = zoom or (end - HISTORY_RANGES[range_label] * 3600, end + 1)
+        n_points = chart_points(width)
+
+        traces = []
+        for kpi in kpis or []:
+            color = HISTORY_COLORS[KPI_INDEX[kpi]]
+            # Wide ranges read the rollups, so their cost depends on the width, not the range
+            buckets = SAMPLER.rollup(line_id, kpi, start, end, (end - start) / n_points)
+            if buckets is not None and len(buckets["ts"]):
+                times = local_datetimes(buckets["ts"])
+                traces.append({**HISTORY_LINE, "x": times, "y": buckets["mean"], "name": kpi, "legendgroup": kpi,
+                               "line": {**HISTORY_LINE["line"], "color": color}})
+                traces.append({**HISTORY_BAND, "x": np.r_[times, times[::-1]],
+                               "y": np.r_[buckets["max"], buckets["min"][::-1]],
+                               "fillcolor": color, "legendgroup": kpi})
+                continue
+
+            chunks = list(history_chunks(line_id, kpi, start, end))
+            if not chunks:
+                continue
+            ts = np.concatenate([c[0] for c in chunks])
+            values = np.concatenate([c[1] for c in chunks])
+            ts, values = downsample(ts, values, n_points, method)
+            traces.append({**HISTORY_LINE, "x": local_datetimes(ts), "y": values, "name": kpi,
+                           "line": {**HISTORY_LINE["line"], "color": color}})
+
+        layout = {
+            **HISTORY_FIGURE["layout"],
+            # Keeps the user's zoom when the figure is refreshed
+            "uirevision": f"{line_id}-{range_label}"
+        }
+        if zoom:
+            layout["xaxis"] = {**layout.get("xaxis", {}), "range": local_datetimes(np.array(zoom))}
+        return {"data": traces, "layout": layout}, None if reset_zoom else no_update
+
+    except Exception as e:
+        return error_figure(e), no_update
+
+
+def utilization_template():
+    placeholder = [0] * len(RESOURCES)
+    fig_util = go.Figure()
+
+    # Current utilization bars (filled per line)
+    fig_util.add_trace(go.Bar(
+        x=RESOURCES,
+        y=placeholder,
+        name='Current',
+        marker_color='#4facfe'
+    ))
+
+    # Projected utilization bars (filled per line)
+    fig_util.add_trace(go.Bar(
+        x=RESOURCES,
+        y=placeholder,
+        name='Projected Increase',
+        marker_color='#ff7de9',
+        text=[""] * len(RESOURCES),
+        textposition='outside',
+        base=placeholder
+    ))
+
+    # Add threshold line
+    # Improved threshold line
+    # Lighter threshold line with reduced opacity
+    # White threshold line with lower opacity
+    # White threshold line with consistent opacity for line and text
+    fig_util.add_hline(
+        y=BOTTLENECK_THRESHOLD,
+        line=dict(
+            color="#FFFFFF",  # White line
+            width=2,
+            dash="dash"
+        ),
+        opacity=0.3,  # Line opacity at 0.3
+        annotation=dict(
+            text="Bottleneck Threshold",
+            font=dict(
+                color="rgba(255,255,255,0.3)",  # White text with 0.3 opacity
+                size=12,
+                family="Arial"
             ),
-            bargap=0.4,  # Space between bars
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.15,  # Position legend above the plot area, relative to the top of the plot
-                xanchor="center",
-                x=0.5,  # Center legend horizontally
-                font=dict(size=10),
-                bgcolor='rgba(0,0,0,0.5)',  # Add a slight background for readability
-                bordercolor='rgba(255,255,255,0.1)',
-                borderwidth=1
-            )
-        )
+            bgcolor="rgba(0,0,0,0.2)",  # Reduced background opacity
+            bordercolor="rgba(255,255,255,0.3)",  # Border with 0.3 opacity
+            borderwidth=1,
+            borderpad=4
+        ),
+        annotation_position="top right"
+    )
 
+    fig_util.update_layout(
+        barmode='stack',
+        title=dict(
+            text='Resource Utilization with Projection',
+            y=0.98,  # Position title near the top of the plot area
+            x=0.5,
+            xanchor='center',
+            yanchor='top'
+        ),
+        xaxis_title='Resource Type',
+        yaxis_title='Utilization (%)',
+        template="plotly_dark",
+        height=400,
+        yaxis_range=[0, 110],
+        margin=dict(l=50, r=20, t=100, b=100),  # Increased top margin to make space for title and legend
+        xaxis=dict(
+            tickangle=-30,  # Rotate labels
+            tickfont=dict(size=10)
+        ),
+        bargap=0.4,  # Space between bars
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.15,  # Position legend above the plot area, relative to the top of the plot
+            xanchor="center",
+            x=0.5,  # Center legend horizontally
+            font=dict(size=10),
+            bgcolor='rgba(0,0,0,0.5)',  # Add a slight background for readability
+            bordercolor='rgba(255,255,255,0.1)',
+            borderwidth=1
+        )
+    )
 
+    return figure_template(fig_util)
 
-        # 4. COMPLETELY REDESIGNED Predictive Maintenance planner
-        # Get component failure predictions
-        failure_predictions = predict_component_failures(data, line_id)
 
-        # Find the most critical components
-        critical_components = [p for p in failure_predictions if p["risk"] > 50]
-        warning_components = [p for p in failure_predictions if 30 <= p["risk"] <= 50]
-        normal_components = [p for p in failure_predictions if p["risk"] < 30]
+UTILIZATION_FIGURE = utilization_template()
 
-        # Create maintenance timeline cards
-        maintenance_timeline = html.Div([
-            # Maintenance timing header
-            html.Div([
-                html.H5("Maintenance Timeline", className="mb-3 text-center"),
-                html.Div([
-                    html.Span("Next 24 Hours", className="badge bg-danger me-2"),
-                    html.Span("24-72 Hours", className="badge bg-warning me-2"),
-                    html.Span("72+ Hours", className="badge bg-success")
-                ], className="text-center mb-3")
-            ]),
 
-            # Timeline visualization
-            html.Div([
-                # Critical components (need attention in 24h)
-                html.Div([
-                    html.H6("Critical Priority", className="text-danger mb-3"),
-                    html.Div([
-                        dbc.Card([
-                            dbc.CardBody([
-                                html.Div([
-                                    html.Span(c["component"], className="fw-bold"),
-                                    dbc.Badge(f"{c['risk']:.1f}% Risk",
-                                              color="danger",
-                                              className="ms-auto")
-                                ], className="d-flex justify-content-between align-items-center mb-2"),
-
-                                dbc.Progress(
-                                    value=c["risk"],
-                                    color="danger",
-                                    className="mb-2",
-                                    style={"height": "8px"}
-                                ),
-
-                                html.Div([
-                                    html.Small(f"Hours until failure: {c['hours']}"),
-                                    html.Small([
-                                        html.I(className="bi bi-tools me-1"),
-                                        "Action required: Immediate"
-                                    ], className="d-block mt-1")
-                                ], className="small text-muted")
-                            ])
-                        ], className="mb-2 border-danger") for c in critical_components
-                    ]) if critical_components else
-                    dbc.Card([
-                        dbc.CardBody([
-                            html.Div([
-                                html.I(className="bi bi-check-circle me-2 text-success"),
-                                html.Span("No critical components", className="text-muted")
-                            ], className="d-flex align-items-center justify-content-center")
-                        ])
-                    ], className="mb-2")
-                ], className="mb-4"),
-
-                # Warning components (need attention in 24-72h)
-                html.Div([
-                    html.H6("Medium Priority", className="text-warning mb-3"),
-                    html.Div([
-                        dbc.Card([
-                            dbc.CardBody([
-                                html.Div([
-                                    html.Span(c["component"], className="fw-bold"),
-                                    dbc.Badge(f"{c['risk']:.1f}% Risk",
-                                              color="warning",
-                                              className="ms-auto")
-                                ], className="d-flex justify-content-between align-items-center mb-2"),
-
-                                dbc.Progress(
-                                    value=c["risk"],
-                                    color="warning",
-                                    className="mb-2",
-                                    style={"height": "8px"}
-                                ),
-
-                                html.Div([
-                                    html.Small(f"Hours until failure: {c['hours']}"),
-                                    html.Small([
-                                        html.I(className="bi bi-calendar me-1"),
-                                        "Schedule maintenance within 72 hours"
-                                    ], className="d-block mt-1")
-                                ], className="small text-muted")
-                            ])
-                        ], className="mb-2 border-warning") for c in warning_components[:3]
-                    ]) if warning_components else html.Div("No medium priority maintenance needed")
-                ], className="mb-3")
-            ]),
+@app.callback(
+    Output('resource-utilization', 'figure'),
+    [Input('kpi-data', 'data'),
+     Input('line-selector', 'value'),
+     Input('url', 'pathname')]
+)
+def update_resource_utilization(data, line_id, pathname):
+    # Only update if we're on the analytics page
+    if pathname != "/analytics":
+        raise PreventUpdate
+    if data is None:
+        return loading_figure()
 
-            # Maintenance recommendations box
-            dbc.Card([
-                dbc.CardHeader("Recommended Maintenance Schedule"),
-                dbc.CardBody([
-                    html.Div([
-                        html.Strong(f"{component['component']}:", className="me-2"),
-                        html.Span(component['recommendation'])
-                    ], className="mb-2") for component in failure_predictions[:3]
-                ])
-            ], className="mt-3")
+    try:
+        # 3. Resource Utilization with Bottleneck Prediction
+        resource_state = SAMPLER.resources(line_id)
+        utilization = resource_state["current"]
+
+        # Projected average utilization over the next shift (trend fit, capped at 110%)
+        projected = resource_state["projected"]
+
+        # Resources projected to cross the threshold are highlighted
+        bottlenecks = {b["resource"] for b in predict_bottlenecks(utilization, projected)}
+        projection = UTILIZATION_FIGURE["data"][1]
+        return fill_figure(UTILIZATION_FIGURE, [
+            {"y": utilization},
+            {"y": np.maximum(0, np.asarray(projected) - np.asarray(utilization)),
+             "marker": {**projection["marker"],
+                        "color": ['#ff4136' if r in bottlenecks else '#ff7de9' for r in RESOURCES]},
+             "text": [f"{p:.0f}%" for p in projected],
+             "base": utilization}
         ])
 
-        # 5. COMPLETELY REDESIGNED Component Failure Prediction
-        # Create component-specific failure cards
-        component_failures = html.Div([
-            dbc.Row([
-                # Left column - Component failure probabilities
-                dbc.Col([
-                    html.Div([
-                        html.H5("Component Failure Risk Analysis", className="mb-3"),
+    except Exception as e:
+        return error_figure(e)
+
+
+def cached_failure_predictions(data, line_id):
+    """Component failure predictions from the derived metric graph"""
+    return SAMPLER.metric(line_id, "component_failures") or predict_component_failures(data, line_id)
+
+
+def kpi_factor(kpi, value):
+    """'KPI value' label of a contributing factor, flagged when 10% off target"""
+    target = TARGETS[kpi]
+    critical = value > target * 1.1 if kpi in RISK_LOWER_IS_BETTER else value < target * 0.9
+    return f"{kpi} {value:.3g}" + (" (critical)" if critical else "")
+
+
+def maintenance_records(failure_predictions):
+    """Planner table rows, one per component; row ids are the component names"""
+    return [{
+        "id": p["component"],
+        "component": p["component"],
+        "priority": "Critical" if p["risk"] > 50 else "Medium" if p["risk"] >= 30 else "Low",
+        "risk": round(p["risk"], 1),
+        "hours": p["hours"],
+        "recommendation": p["recommendation"]
+    } for p in failure_predictions]
+
+
+def failure_records(failure_predictions, data):
+    """Failure table rows with the component's influencing KPIs as contributing factors"""
+    return [{
+        "id": p["component"],
+        "component": p["component"],
+        "risk": round(p["risk"], 1),
+        "hours": p["hours"],
+        "factors": " · ".join(kpi_factor(kpi, data[kpi])
+                              for kpi in COMPONENT_FACTOR_KPIS.get(p["component"], ()) if kpi in data)
+    } for p in failure_predictions]
+
+
+def window_records(maintenance_plan):
+    return [{
+        "date": datetime.strptime(window["date"], "%Y-%m-%d").strftime("%a %d %b"),
+        "component": window["component"],
+        "risk": round(window["risk"], 1),
+        "cost": round(window["cost"])
+    } for window in maintenance_plan]
+
+
+def anomaly_records(anomalies):
+    return [{
+        "time": datetime.fromtimestamp(event["timestamp"]).strftime("%d %b %H:%M:%S"),
+        "type": ANOMALY_LABELS[event["type"]],
+        "kpi": event["kpi"],
+        "value": round(event["value"], 2),
+        "score": round(event["score"], 1)
+    } for event in anomalies]
+
+
+# Without the plotly_dark template, which would be most of the response
+FAILURE_TIMELINE_FIGURE = {
+    "data": [{
+        "type": "scatter",
+        "mode": "markers+text",
+        "textposition": "top center",
+        "marker": {"size": 16, "symbol": "diamond", "line": {"width": 1, "color": "white"}},
+        "hovertemplate": "<b>%{text}</b><br>Hours: %{x}<br>Risk: %{y:.1f}%<extra></extra>"
+    }],
+    "layout": {
+        "height": 300,
+        "font": {"color": "#c9d1d9"},
+        "xaxis": {"title": {"text": "Hours until Failure"}, "showgrid": True,
+                  "gridcolor": "rgba(255,255,255,0.1)", "zeroline": False},
+        "yaxis": {"title": {"text": "Risk Level (%)"}, "showgrid": True,
+                  "gridcolor": "rgba(255,255,255,0.1)", "range": [0, 100]},
+        "plot_bgcolor": "rgba(0,0,0,0)",
+        "paper_bgcolor": "rgba(0,0,0,0)",
+        "margin": {"l": 40, "r": 20, "t": 10, "b": 40}
+    }
+}
 
-                        # Component detail cards
-                        html.Div([
-                            dbc.Card([
-                                dbc.CardHeader([
-                                    html.Div([
-                                        html.Span(f"{component['component']}", className="fw-bold"),
-                                        html.Span(f"Risk Level: {component['risk']:.1f}%",
-                                                  className="badge rounded-pill bg-danger ms-2"
-                                                  if component['risk'] > 50 else
-                                                  "badge rounded-pill bg-warning ms-2"
-                                                  if component['risk'] > 30 else
-                                                  "badge rounded-pill bg-success ms-2")
-                                    ], className="d-flex justify-content-between align-items-center"),
-                                ]),
-                                dbc.CardBody([
-                                    # Hours until failure
-                                    html.Div([
-                                        html.Span(f"Time until failure: ", className="me-2"),
-                                        html.Strong(f"{component['hours']} hours",
-                                                    className="text-danger" if component['hours'] < 24 else
-                                                    "text-warning" if component['hours'] < 72 else
-                                                    "text-success")
-                                    ], className="mb-2"),
-
-                                    # Contributing factors
-                                    html.Div([
-                                        html.Small("Contributing Factors:", className="text-muted d-block mb-1"),
-                                        html.Ul([
-                                            html.Li([
-                                                html.Strong("OEE: "),
-                                                f"{data['OEE']:.1f}" +
-                                                (" (critical)"
-                                                 if data['OEE'] < TARGETS['OEE'] * 0.9 else "")
-                                            ]) if component['component'] in [c for c in COMPONENT_KPI_MATRIX if
-                                                                             'OEE' in COMPONENT_KPI_MATRIX[
-                                                                                 c]] else None,
-                                            html.Li([
-                                                html.Strong("PM Risk: "),
-                                                f"{data['PM Risk']:.1f}" +
-                                                (" (critical)"
-                                                 if data['PM Risk'] > TARGETS['PM Risk'] * 1.1 else "")
-                                            ]) if component['component'] in [c for c in COMPONENT_KPI_MATRIX if
-                                                                             'PM Risk' in COMPONENT_KPI_MATRIX[
-                                                                                 c]] else None,
-                                            html.Li([
-                                                html.Strong("Batt Efficiency: "),
-                                                f"{data['Batt Efficiency']:.1f}" +
-                                                (" (critical)"
-                                                 if data['Batt Efficiency'] < TARGETS['Batt Efficiency'] * 0.9 else "")
-                                            ]) if component['component'] in [c for c in COMPONENT_KPI_MATRIX if
-                                                                             'Batt Efficiency' in COMPONENT_KPI_MATRIX[
-                                                                                 c]] else None,
-                                        ])
-                                    ])
-                                ])
-                            ], className="mb-3 shadow-sm") for component in failure_predictions[:4]
-                        ])
-                    ])
-                ], width=7),
 
-                # Right column - Visual timeline
-                dbc.Col([
-                    html.Div([
-                        html.H5("Failure Timeline", className="mb-3"),
-
-                        # Timeline visualization
-                        dcc.Graph(
-                            figure=go.Figure(
-                                data=[
-                                    go.Scatter(
-                                        x=[component['hours'] for component in failure_predictions[:8]],
-                                        y=[component['risk'] for component in failure_predictions[:8]],
-                                        mode='markers+text',
-                                        text=[component['component'] for component in failure_predictions[:8]],
-                                        textposition='top center',
-                                        marker=dict(
-                                            size=16,
-                                            color=[
-                                                '#ff4136' if component['risk'] > 50 else
-                                                '#ffdc00' if component['risk'] > 30 else
-                                                '#2ecc40'
-                                                for component in failure_predictions[:8]
-                                            ],
-                                            symbol='diamond',
-                                            line=dict(width=1, color='white')
-                                        ),
-                                        hovertemplate='<b>%{text}</b><br>Hours: %{x}<br>Risk: %{y:.1f}%<extra></extra>'
-                                    )
-                                ],
-                                layout=go.Layout(
-                                    height=300,
-                                    template='plotly_dark',
-                                    xaxis=dict(
-                                        title='Hours until Failure',
-                                        showgrid=True,
-                                        gridcolor='rgba(255,255,255,0.1)'
-                                    ),
-                                    yaxis=dict(
-                                        title='Risk Level (%)',
-                                        showgrid=True,
-                                        gridcolor='rgba(255,255,255,0.1)',
-                                        range=[0, 100]
-                                    ),
-                                    plot_bgcolor='rgba(0,0,0,0)',
-                                    paper_bgcolor='rgba(0,0,0,0)',
-                                    margin=dict(l=40, r=20, t=10, b=40)
-                                )
-                            ),
-                            config={'displayModeBar': False}
-                        )
-                    ])
-                ], width=5)
-            ])
-        ])
+@app.callback(
+    [Output('maintenance-table', 'data'),
+     Output('maintenance-windows', 'data'),
+     Output('maintenance-windows-title', 'children'),
+     Output('maintenance-status', 'children')],
+    [Input('analytics-group-risk', 'data')],
+    **background_options('maintenance-busy')
+)
+def update_maintenance_panel(data):
+    # Return placeholder if no data
+    if data is None:
+        return no_update, no_update, no_update, dbc.Alert("Loading maintenance data...", color="info")
 
-        return fig_trends, fig_forecast, fig_util, maintenance_timeline, component_failures
+    try:
+        line_id = data["line_id"]
+
+        # Component failure predictions and cost-optimised windows, sent as table rows
+        failure_predictions = cached_failure_predictions(data, line_id)
+        maintenance_plan = (SAMPLER.metric(line_id, "maintenance_plan")
+                            or calculate_optimal_maintenance(data, failure_predictions, line_id))
+        title = (f"Optimised Maintenance Windows (next {MAINTENANCE_HORIZON_DAYS} days, "
+                 f"{MAINTENANCE_CREWS.get(line_id, 1)} crew jobs/day)")
+        return maintenance_records(failure_predictions), window_records(maintenance_plan), title, None
 
     except Exception as e:
-        # Create error figures and content
-        error_fig = go.Figure()
-        error_fig.update_layout(
-            template="plotly_dark",
-            height=300,
-            title=f"Error: {str(e)}",
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)'
-        )
-        error_content = dbc.Alert(f"Error loading data: {str(e)}", color="danger")
-        return error_fig, error_fig, error_fig, error_content, error_content
+        return [], [], no_update, dbc.Alert(f"Error loading data: {str(e)}", color="danger")
+
+
+@app.callback(
+    [Output('failure-table', 'data'),
+     Output('failure-timeline', 'figure'),
+     Output('anomaly-table', 'data'),
+     Output('component-status', 'children')],
+    [Input('analytics-group-risk', 'data')],
+    **background_options('component-busy')
+)
+def update_component_panel(data):
+    # Return placeholder if no data
+    if data is None:
+        return no_update, no_update, no_update, dbc.Alert("Loading data...", color="info")
+
+    try:
+        line_id = data["line_id"]
+        failure_predictions = cached_failure_predictions(data, line_id)
+        anomalies = SAMPLER.anomalies(line_id, limit=8)
+
+        timeline = failure_predictions[:8]
+        risks = [p["risk"] for p in timeline]
+        figure = fill_figure(FAILURE_TIMELINE_FIGURE, [{
+            "x": [p["hours"] for p in timeline],
+            "y": risks,
+            "text": [p["component"] for p in timeline],
+            "marker": {**FAILURE_TIMELINE_FIGURE["data"][0]["marker"],
+                       "color": ['#ff4136' if r > 50 else '#ffdc00' if r > 30 else '#2ecc40' for r in risks]}
+        }])
+
+        status = None if anomalies else html.Div([
+            html.I(className="bi bi-check-circle me-2 text-success"),
+            html.Span("No anomalies detected in the KPI stream", className="text-muted")
+        ], className="d-flex align-items-center")
+        return failure_records(failure_predictions[:4], data), figure, anomaly_records(anomalies), status
+
+    except Exception as e:
+        return [], error_figure(e), [], dbc.Alert(f"Error loading data: {str(e)}", color="danger")
 
 
 # ====================== FACTORY STATUS CALLBACK ======================
+HEARTBEAT_PERIOD = min(UPDATE_FREQUENCIES.values())  # the sampler reads some KPI at least this often
+
+
+def duration_text(seconds):
+    return f"{seconds:.0f}s" if seconds < 120 else f"{seconds / 60:.0f}m" if seconds < 7200 else f"{seconds / 3600:.1f}h"
+
+
+def health_badge(health):
+    """(label, color) summarising an adapter's health snapshot"""
+    if not health["reads"]:
+        return "No reads yet", "secondary"
+    if health["failing"]:
+        return f"Failing ({health['error_rate']:.0%} errors)", "danger"
+    if health["stale"]:
+        return f"Stale ({len(health['stale'])} KPI{'s' if len(health['stale']) > 1 else ''})", "danger"
+    if health["slow"]:
+        return "Slow reads", "warning"
+    return "Healthy", "success"
+
+
+def latency_text(latency):
+    if latency["p50_ms"] is None:
+        return "no reads"
+    return (f"p50 ≤{latency['p50_ms']:.0f} ms · p95 ≤{latency['p95_ms']:.0f} ms · "
+            f"max {latency['max_ms']:.1f} ms")
+
+
+def latency_histogram(latency):
+    """Read counts per latency bucket, skipping empty buckets"""
+    labels = [f"≤{bound:g}ms" for bound in latency["buckets_ms"]] + [f">{latency['buckets_ms'][-1]:g}ms"]
+    return " · ".join(f"{label}: {count}" for label, count in zip(labels, latency["counts"]) if count)
+
+
+def staleness_badge(kpi, state):
+    color = ("danger" if state["stale"] else "secondary" if not state["received"] else
+             "success" if state["staleness"] <= 1 else "warning")
+    return dbc.Badge(f"{kpi} {duration_text(state['age'])}/{duration_text(state['period'])}",
+                     color=color, className="me-1 mb-1")
+
+
 @app.callback(
     Output('factory-status-panel', 'children'),
     [Input('line-selector', 'value'),
-     Input('interval', 'n_intervals'),
+     Input('refresh-tick', 'data'),
      Input('adapter-modes-store', 'data')]  # Add adapter modes input
 )
-def update_factory_status(line_id, n, adapter_modes):
+def update_factory_status(line_id, tick, adapter_modes):
     # Get mode for current line
     mode = adapter_modes.get(line_id, 'virtual')
 
@@ -1755,8 +5029,9 @@ def update_factory_status(line_id, n, adapter_modes):
     adapter = get_adapter(line_id, mode)
 
     try:
-        # Get status from the adapter
+        # Get status and read telemetry from the adapter
         status = adapter.get_status()
+        health = adapter.get_health()
 
         # Status badge color
         status_color = "success" if status["status"] == "Connected" else "danger"
@@ -1764,20 +5039,17 @@ def update_factory_status(line_id, n, adapter_modes):
         # Mode badge color
         mode_color = "info" if status["mode"] == "Simulation" else "warning"
 
-        # Heartbeat recency
-        if "last_update" in status and status["last_update"] != "Never":
-            try:
-                last_time = datetime.strptime(status["last_update"], "%H:%M:%S")
-                now_time = datetime.strptime(datetime.now().strftime("%H:%M:%S"), "%H:%M:%S")
-                seconds_ago = (now_time - last_time).total_seconds()
-                heartbeat_text = f"{int(seconds_ago)}s ago"
-                heartbeat_color = "success" if seconds_ago < 10 else "warning" if seconds_ago < 30 else "danger"
-            except:
-                heartbeat_text = status["last_update"]
-                heartbeat_color = "info"
-        else:
+        # Heartbeat recency, from monotonic read times
+        seconds_ago = health["heartbeat"]
+        if seconds_ago is None:
             heartbeat_text = "Never"
             heartbeat_color = "danger"
+        else:
+            heartbeat_text = f"{duration_text(seconds_ago)} ago"
+            heartbeat_color = ("success" if seconds_ago < HEARTBEAT_PERIOD * 1.5 else
+                               "warning" if seconds_ago < HEARTBEAT_PERIOD * STALE_AFTER_PERIODS else "danger")
+
+        health_text, health_color = health_badge(health)
 
         return html.Div([
             # Connection status
@@ -1800,13 +5072,34 @@ def update_factory_status(line_id, n, adapter_modes):
                 html.I(className="bi bi-heart-pulse me-2"),
                 html.Strong("Heartbeat: "),
                 dbc.Badge(heartbeat_text, color=heartbeat_color)
+            ], className="mb-2"),
+
+            # Read health: error rate and latency distribution
+            html.Div([
+                html.I(className="bi bi-activity me-2"),
+                html.Strong("Health: "),
+                dbc.Badge(health_text, color=health_color, className="me-2"),
+                html.Small(f"{health['reads']} reads, {health['errors']} errors", className="text-muted")
+            ], className="mb-1"),
+            html.Div([
+                html.Small(f"Latency: {latency_text(health['latency'])}", className="d-block"),
+                html.Small(latency_histogram(health["latency"]), className="d-block text-muted"),
+                html.Small(f"Last error: {health['last_error']}", className="d-block text-danger")
+                if health["last_error"] else None
+            ], className="mb-2 ms-4"),
+
+            # Age of each KPI's latest sample against its update period
+            html.Div([
+                html.Small("KPI data age / update period:", className="d-block text-muted mb-1"),
+                html.Div([staleness_badge(kpi, state) for kpi, state in health["kpis"].items()])
             ]),
 
             # NEW: Adapter type information
             html.Div([
                 html.I(className="bi bi-info-circle me-2"),
                 html.Strong("Adapter: "),
-                html.Span("OPC-UA" if mode == "production" else "Virtual Simulator")
+                html.Span({"production": "OPC-UA", "replay": "Recorded Replay",
+                           "assets": "Per-Asset Simulator"}.get(mode, "Virtual Simulator"))
             ], className="mt-3")
         ])
 
@@ -1817,12 +5110,6 @@ def update_factory_status(line_id, n, adapter_modes):
         ], color="danger")
 
 
-
-# ====================== RUN APP ======================
-if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 8050))
-    app.run_server(debug=False, host='0.0.0.0', port=port)
-
 # ====================== RUN APP ======================
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8050))
@@ -0,0 +1,10 @@
+// Resume KPI refreshes as soon as a hidden tab becomes visible again.
+// The refresh callbacks pause themselves while document.hidden is true.
+document.addEventListener('visibilitychange', function () {
+    if (!document.hidden) {
+        const button = document.getElementById('visibility-resume');
+        if (button) {
+            button.click();
+        }
+    }
+});
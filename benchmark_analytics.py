@@ -0,0 +1,56 @@
+"""Measure how batch line analytics scale with the number of worker processes.
+
+Usage:
+    python benchmark_analytics.py --lines 500
+
+Builds `--lines` synthetic lines from the configured production lines with
+jittered KPI values and times failure risk, component predictions and
+maintenance planning for all of them with 1, 2, 4, ... worker processes.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app import INITIAL_DATA, KPI_NAMES, LINE_IDS, LineAnalyticsRunner
+
+
+def synthetic_lines(n_lines, seed=0):
+    """(values, profiles) of n_lines lines cycling through the configured ones"""
+    rng = np.random.default_rng(seed)
+    profiles = [LINE_IDS[i % len(LINE_IDS)] for i in range(n_lines)]
+    base = np.array([INITIAL_DATA[kpi] for kpi in KPI_NAMES])
+    return base * rng.uniform(0.8, 1.2, (n_lines, len(KPI_NAMES))), profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch line analytics across worker processes")
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    args = parser.parse_args()
+
+    values, profiles = synthetic_lines(args.lines)
+    workers = [1]
+    while workers[-1] * 2 <= args.max_workers:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != args.max_workers:
+        workers.append(args.max_workers)
+
+    baseline = None
+    for count in workers:
+        runner = LineAnalyticsRunner(workers=count, min_parallel_lines=1)
+        runner.run(values[:count], profiles[:count])  # start the pool outside the timing
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            runner.run(values, profiles)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        baseline = baseline or best
+        print(f"{args.lines} lines, {count} worker(s): {best:.3f}s (speedup {baseline / best:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Measure how long the dashboard takes to import and to serve its first requests.
+
+Usage:
+    python benchmark_startup.py --budget 1.0
+
+Reports the import time of `app`, the first request of each page resource,
+and the time a worker forked from the imported app (gunicorn --preload) takes
+to serve its first request. Exits with status 1 if a forked worker misses
+the budget.
+"""
+import argparse
+import os
+import sys
+import time
+
+FIRST_REQUESTS = ["/", "/_dash-layout", "/_dash-dependencies", "/api/lines"]
+
+
+def first_requests(server):
+    """Elapsed seconds of the first GET of each resource"""
+    client = server.test_client()
+    timings = []
+    for path in FIRST_REQUESTS:
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append((path, response.status_code, time.perf_counter() - started))
+    return timings
+
+
+def forked_worker_time(server):
+    """Seconds from fork until the child has served its first request"""
+    read_end, write_end = os.pipe()
+    started = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        server.test_client().get("/")
+        os.write(write_end, repr(time.perf_counter() - started).encode())
+        os._exit(0)
+    os.close(write_end)
+    elapsed = float(os.read(read_end, 64).decode())
+    os.waitpid(pid, 0)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard import and first-request time")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds allowed for a worker restart")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    import app  # imported here so the import itself is timed
+    print(f"import app: {time.perf_counter() - started:.3f}s")
+
+    for path, status, elapsed in first_requests(app.server):
+        print(f"first GET {path} ({status}): {elapsed * 1000:.1f}ms")
+
+    if not hasattr(os, "fork"):
+        print("fork is not available on this platform; skipping the worker restart check")
+        return
+    restart = forked_worker_time(app.server)
+    print(f"forked worker first request: {restart:.3f}s (budget {args.budget:.1f}s)")
+    if restart > args.budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
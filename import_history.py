@@ -0,0 +1,33 @@
+"""Bulk-import historical KPI exports into the recording store.
+
+Usage:
+    python import_history.py exports/*.csv exports/*.parquet --recordings-dir recordings
+
+Exports need `timestamp` and `line_id` columns and either `kpi`/`value`
+columns (long format) or one column per KPI name (wide format).
+"""
+import argparse
+import time
+
+from app import IMPORT_CHUNK_ROWS, RECORDINGS_DIR, import_history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import historical KPI exports (CSV or Parquet)")
+    parser.add_argument("paths", nargs="+", help="export files to import")
+    parser.add_argument("--recordings-dir", default=RECORDINGS_DIR)
+    parser.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = import_history(args.paths, args.recordings_dir, args.chunk_rows)
+    elapsed = time.perf_counter() - started
+
+    print(f"Read {summary['rows']} rows in {elapsed:.1f}s: "
+          f"{summary['imported']} samples imported, {summary['rejected']} rejected")
+    if summary["unknown_columns"]:
+        print(f"Ignored columns: {', '.join(summary['unknown_columns'])}")
+
+
+if __name__ == "__main__":
+    main()